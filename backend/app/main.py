@@ -1,24 +1,36 @@
 print("### FASTAPI APP WITH CORS IS RUNNING ###")
 
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import RedirectResponse, JSONResponse, Response
+from fastapi import FastAPI, HTTPException, Request, Header, Query
+from fastapi.responses import RedirectResponse, JSONResponse, Response, PlainTextResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional
+from typing import List, Optional
 from urllib.parse import urlencode
 
 import os
+import time
+import logging
 import traceback
 import numpy as np
 
-from app.utils.clap_encoder import ClapEncoder
+from app.utils.clap_encoder import make_encoder
 from app.utils.color_to_text import color_to_text_prompt
 from app.utils.spotify_auth import SpotifyAuth
 from app.utils.spotify_fetch import SpotifyFetcher
-from app.models.song_store import SongStore
+from app.models.tiered_store import TieredSongStore
 from app.models.user_profile import UserProfile
-from app.utils.local_recommender import recommend_hybrid
+from app.models.taste_model import TasteModel
+from app.models.session_history import SessionHistory, new_bitmap, set_rows, test_rows
+from app.models.ranking_cache import RankingCache, RecentResults, RANKING_DEPTH
+from app.utils.local_recommender import rank_hybrid
+from app.utils import local_recommender
+from app.utils import metrics
+from app.utils import fast_json
+from app.utils import journey as journeys
+from app.utils.profiler import PROFILER, profiled
+from app.utils.warmup import Component, warm_up, readiness
+from app.utils.admission import ADMISSION, Deadline, RECOMMEND_DEADLINE_MS, SHED_TOTAL, TIER_TOTAL
 
 USER_TASTE = {}
 
@@ -29,6 +41,15 @@ ENV_PATH = os.path.join(BASE_DIR, ".env")
 print("Loading .env from:", ENV_PATH)
 load_dotenv(dotenv_path=ENV_PATH)
 
+logging.basicConfig(level=os.getenv("SHIKISAI_LOG_LEVEL", "INFO"), format="%(message)s")
+
+# Endpoints that get per-stage timers + Server-Timing
+TIMED_ENDPOINTS = {
+    "/recommend": "recommend",
+    "/build_index_spotify": "build_index_spotify",
+    "/journey": "journey",
+}
+
 # App + Singletons
 app = FastAPI(title="Shikisai Recommender")
 
@@ -44,25 +65,215 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
-clap = ClapEncoder()
-spotify_auth = SpotifyAuth()
-spotify_fetcher = SpotifyFetcher()
+# Heavy singletons are Components: built by the startup warmup or on first
+# use, so importing this module (and liveness checks) never waits on them.
+CATALOG_WATCH_SECONDS = float(os.getenv("SHIKISAI_CATALOG_WATCH_SECONDS", "0"))
+WARMUP = os.getenv("SHIKISAI_WARMUP", "background").lower()  # background | blocking | off
+
+
+def load_encoder():
+    encoder = make_encoder()
+    print(f"Encoder: {encoder.name} ({encoder.version}, dim={encoder.dim})")
+    return encoder
+
+
+def load_store():
+    s = TieredSongStore(clap=clap)
+    try:
+        s.load_index()
+        print("FAISS index loaded successfully.")
+    except Exception as e:
+        print("No FAISS index found — will build on demand.", e)
+    return s
+
+
+def load_catalog():
+    snapshot = local_recommender.CATALOG.current()
+    if CATALOG_WATCH_SECONDS > 0:
+        local_recommender.CATALOG.start_watcher(CATALOG_WATCH_SECONDS)
+    return snapshot
+
 
-store = SongStore(clap=clap)
+clap = Component("encoder", load_encoder)
+store = Component("store", load_store)
+catalog = Component("catalog", load_catalog)
+spotify_auth = Component("spotify_auth", SpotifyAuth, required=False)
+spotify_fetcher = Component("spotify_fetcher", SpotifyFetcher, required=False)
+COMPONENTS = [clap, store, catalog, spotify_auth, spotify_fetcher]
 
 user_profile = UserProfile(
     spotify_auth=spotify_auth,
     store=store
 )
 
+sessions = SessionHistory()
+rankings = RankingCache()
+recent_results = RecentResults()
+# cursors of a retired catalog snapshot would keep it alive until they expire
+local_recommender.CATALOG.subscribe(lambda old, new: rankings.retire(new.version))
+tastes = TasteModel(spotify_fetcher, catalog=local_recommender.CATALOG.peek)
+
+# Gauges read at scrape time
+metrics.REGISTRY.gauge(
+    "shikisai_catalog_tracks",
+    "Tracks in the local recommender catalog.",
+    fn=lambda: len(local_recommender.CATALOG.peek() or ()),
+)
+metrics.REGISTRY.gauge(
+    "shikisai_catalog_version",
+    "Version of the catalog snapshot being served.",
+    fn=lambda: local_recommender.CATALOG.peek().version if local_recommender.CATALOG.peek() else 0,
+)
+metrics.REGISTRY.gauge(
+    "shikisai_store_vectors",
+    "Vectors in the FAISS song store.",
+    fn=lambda: store.peek().index.ntotal if store.ready and store.peek().index is not None else 0,
+)
+metrics.REGISTRY.gauge(
+    "shikisai_user_indexes_resident",
+    "Per-user delta indexes currently held in memory.",
+    fn=lambda: store.peek().resident_users() if store.ready else 0,
+)
+metrics.REGISTRY.gauge(
+    "shikisai_user_indexes_bytes",
+    "Approximate memory used by resident per-user delta indexes.",
+    fn=lambda: store.peek().resident_bytes() if store.ready else 0,
+)
+metrics.REGISTRY.gauge(
+    "shikisai_sessions",
+    "Sessions with remembered recommendation history.",
+    fn=lambda: len(sessions),
+)
+metrics.REGISTRY.gauge(
+    "shikisai_ranking_cache_rows",
+    "Rows held by cached rankings (pagination cursors).",
+    fn=lambda: rankings.cached_rows,
+)
+metrics.REGISTRY.gauge(
+    "shikisai_store_index_info",
+    "FAISS index type currently loaded (value is always 1).",
+    labelnames=("type",),
+    fn=lambda: {(type(store.peek().index).__name__ if store.ready and store.peek().index is not None else "none",): 1},
+)
+metrics.REGISTRY.gauge(
+    "shikisai_component_ready",
+    "Whether each lazily built component is ready (1) or not (0).",
+    labelnames=("component",),
+    fn=lambda: {(c.name,): int(c.ready) for c in COMPONENTS},
+)
+
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    endpoint = TIMED_ENDPOINTS.get(request.url.path)
+    if endpoint is None or request.method == "OPTIONS":
+        return await call_next(request)
+
+    request.state.arrived = time.monotonic()  # deadlines count from here
+    timings = metrics.begin_request(endpoint)
+    t0 = time.perf_counter()
+    response = await call_next(request)
+    total = time.perf_counter() - t0
+
+    metrics.REQUEST_SECONDS.observe(total, endpoint=endpoint)
+    response.headers["Server-Timing"] = metrics.server_timing_header(timings, total)
+    return response
+
 # Startup
 @app.on_event("startup")
 def startup_event():
+    if WARMUP != "off":
+        warm_up(COMPONENTS, background=(WARMUP != "blocking"))
+
+# Health
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving HTTP."""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: every required component has been built."""
+    status = readiness(COMPONENTS)
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+# Metrics
+@app.get("/metrics")
+def metrics_endpoint():
+    return PlainTextResponse(
+        metrics.REGISTRY.render(),
+        media_type="text/plain; version=0.0.4",
+    )
+
+# Admin: on-demand profiling
+ADMIN_TOKEN = os.getenv("SHIKISAI_ADMIN_TOKEN")
+
+
+def require_admin(x_admin_token: Optional[str]):
+    if not ADMIN_TOKEN:
+        raise HTTPException(403, "Admin endpoints disabled (set SHIKISAI_ADMIN_TOKEN)")
+    if x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(403, "Invalid admin token")
+
+
+@app.post("/admin/profile/start")
+def profile_start(
+    requests: Optional[int] = None,
+    seconds: Optional[float] = None,
+    x_admin_token: Optional[str] = Header(None),
+):
+    require_admin(x_admin_token)
+    if requests is None and seconds is None:
+        requests = 20
+    PROFILER.start(requests=requests, seconds=seconds)
+    return PROFILER.status()
+
+
+@app.post("/admin/profile/stop")
+def profile_stop(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    PROFILER.stop()
+    return PROFILER.status()
+
+
+@app.get("/admin/profile")
+def profile_status(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    return PROFILER.status()
+
+
+@app.get("/admin/profile/dump")
+def profile_dump(format: str = "pstats", x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
     try:
-        store.load_index()
-        print("FAISS index loaded successfully.")
-    except Exception as e:
-        print("No FAISS index found — will build on demand.", e)
+        body = PROFILER.dump(format)
+    except RuntimeError as e:
+        raise HTTPException(404, str(e))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    if format == "pstats":
+        return Response(
+            body,
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": 'attachment; filename="recommend.pstats"'},
+        )
+    return PlainTextResponse(body.decode("utf-8"))
+
+# Admin: catalog snapshots
+@app.post("/admin/catalog/reload")
+def catalog_reload(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    started = local_recommender.CATALOG.reload()
+    return {"started": started, **local_recommender.CATALOG.status()}
+
+
+@app.get("/admin/catalog")
+def catalog_status(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    encoder = clap.peek()
+    return {**local_recommender.CATALOG.status(), "encoder": encoder.info() if encoder else None}
 
 # Spotify OAuth
 @app.get("/auth/login")
@@ -105,102 +316,390 @@ class BuildSpotifyPayload(BaseModel):
 @app.post("/build_index_spotify")
 def build_index_spotify(payload: BuildSpotifyPayload):
     try:
-        tracks = spotify_fetcher.fetch_tracks_from_user(
-            access_token=payload.token,
-            fetch_playlists=payload.fetch_playlists,
-            fetch_saved=payload.fetch_saved,
-            fetch_top=payload.fetch_top,
-            max_per_source=payload.max_tracks_per_source,
-        )
+        with metrics.stage("fetch"):
+            tracks = spotify_fetcher.fetch_tracks_from_user(
+                access_token=payload.token,
+                fetch_playlists=payload.fetch_playlists,
+                fetch_saved=payload.fetch_saved,
+                fetch_top=payload.fetch_top,
+                max_per_source=payload.max_tracks_per_source,
+            )
         print("FETCHED TRACK COUNT:", len(tracks))
 
-        n_added = store.add_spotify_tracks(tracks)
+        with metrics.stage("user_id"):
+            user_id = spotify_fetcher.get_user_id(payload.token)
+        if not user_id:
+            raise HTTPException(401, "Could not resolve Spotify user for token")
+
+        with metrics.stage("index"):
+            n_added = store.add_user_tracks(user_id, tracks)
 
-        print(f"Indexed {n_added} tracks into FAISS.")
+        print(f"Indexed {n_added} tracks into FAISS for user {user_id}.")
 
         return {"status": "ok", "n_added": n_added}
 
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(500, str(e))
 
+def add_excluded_ids(exclude, snapshot, track_ids):
+    if exclude is None:
+        exclude = new_bitmap(len(snapshot))
+    set_rows(exclude, snapshot.metadata.rows_for_ids(track_ids))
+    return exclude
+
+
+def restrict_rows(rows, row_ids=None, exclude=None):
+    """Keep the rows of a precomputed ranking that pass the request's filters and exclusions."""
+    if row_ids is not None:
+        rows = rows[np.isin(rows, row_ids)]
+    if exclude is not None:
+        rows = rows[~test_rows(exclude, rows)]
+    return rows
+
+
+def recommend_ranking(deadline, tier, snapshot, prompt, hex_color, v, a, k,
+                      token, refresh_token, exclude_recent, row_ids, exclude):
+    """Encode + (taste) + rank for the full, no_taste and coarse tiers. Returns (ranked, taste, tier)."""
+    # Encode prompt -> CLAP (a model still loading is not an encode cost)
+    clap.get()
+    with ADMISSION.stage("encode"):
+        text_emb = clap.encode_text(prompt)
+    text_emb = np.asarray(text_emb, dtype=np.float32)
+
+    if text_emb.size >= 512:
+        text_emb = text_emb[:512]
+    else:
+        pad = np.zeros(512 - text_emb.size, dtype=np.float32)
+        text_emb = np.concatenate([text_emb, pad])
+
+    taste = None
+    if tier in ("full", "no_taste"):
+        # Spotify calls only when the budget allows them
+        user_id = None
+        if tier == "full" and token:
+            try:
+                spotify_fetcher.get()
+                with metrics.stage("user_id"):
+                    user_id = spotify_fetcher.get_user_id(token, refresh_token)
+            except Exception as e:
+                # Spotify unavailable: carry on without the taste-dependent calls
+                print("User id fetch failed:", e)
+                tier = "no_taste"
+
+        if tier == "full" and token and refresh_token:
+            try:
+                with ADMISSION.stage("taste"):
+                    if user_id:
+                        # incremental: only plays since the last refresh are fetched
+                        taste = tastes.profile(user_id, token, refresh_token)
+                    else:
+                        taste = spotify_fetcher.get_user_taste_profile(
+                            access_token=token,
+                            refresh_token=refresh_token
+                        )
+            except Exception as e:
+                print("Taste fetch failed:", e)
+
+        if tier == "full" and exclude_recent and token:
+            try:
+                with ADMISSION.stage("recent"):
+                    recent = spotify_fetcher.get_recently_played_ids(token, refresh_token)
+            except Exception as e:
+                print("Recently played fetch failed:", e)
+                recent = None
+            if recent:
+                exclude = add_excluded_ids(exclude, snapshot, recent)
+
+    # The budget may have shrunk while encoding / fetching
+    if tier != "coarse" and not ADMISSION.affordable(deadline, "rank"):
+        tier = "coarse"
+
+    coarse = tier == "coarse"
+    with ADMISSION.stage("rank_coarse" if coarse else "rank"):
+        ranked = rank_hybrid(
+            query_embed=text_emb[:512],
+            v=v,
+            a=a,
+            hex_color=hex_color,
+            depth=max(k, RANKING_DEPTH),
+            user_taste=taste,
+            snapshot=snapshot,
+            row_ids=row_ids,
+            exclude=exclude,
+            rerank_candidates=max(4 * k, 256) if coarse else None,
+        )
+
+    if not coarse and taste is None and row_ids is None and exclude is None:
+        recent_results.put(snapshot, hex_color, ranked)
+    return ranked, taste, tier
+
+
+def split_multi(values: Optional[List[str]]) -> List[str]:
+    """Accept both ?genres=a&genres=b and ?genres=a,b."""
+    out = []
+    for v in values or []:
+        out.extend(p.strip() for p in v.split(",") if p.strip())
+    return out
+
+
 @app.options("/recommend")
 def recommend_options():
     return {}
 
 # Recommend Endpoint (1027-D)
 @app.get("/recommend")
-def recommend(hex: Optional[str] = None, k: int = 10, token: Optional[str] = None, refresh_token: Optional[str] = None):
+@profiled
+def recommend(
+    hex: Optional[str] = None,
+    k: int = Query(10, ge=1, le=RANKING_DEPTH),
+    token: Optional[str] = None,
+    refresh_token: Optional[str] = None,
+    year_min: Optional[int] = None,
+    year_max: Optional[int] = None,
+    popularity_min: Optional[float] = None,
+    genres: Optional[List[str]] = Query(None),
+    exclude_artists: Optional[List[str]] = Query(None),
+    exclude_ids: Optional[List[str]] = Query(None),
+    session_id: Optional[str] = None,
+    exclude_recent: bool = False,
+    cursor: Optional[str] = None,
+    deadline_ms: Optional[float] = None,
+    request: Request = None,
+):
     try:
+        # Next page of a cached ranking: O(k) slice, stable order
+        if cursor:
+            with metrics.stage("page"):
+                page = rankings.page(cursor, k)
+                if page is None:
+                    raise HTTPException(410, "Cursor expired or unknown")
+                ranked_list, rows, next_cursor = page
+            if session_id:
+                sessions.record(session_id, ranked_list.snapshot, rows)
+            with metrics.stage("render"):
+                return fast_json.json_response({
+                    **ranked_list.meta,
+                    "recommendations": ranked_list.snapshot.payloads.join(rows),
+                    "next_cursor": next_cursor,
+                })
+
         # Handle preflight / empty call
         if not hex:
             return {"ok": True}
 
+        # Time budget from arrival (includes time queued for a worker thread)
+        budget_ms = min(deadline_ms or RECOMMEND_DEADLINE_MS, RECOMMEND_DEADLINE_MS)
+        deadline = Deadline(budget_ms / 1000, start=getattr(request.state, "arrived", None))
+        if deadline.expired():
+            SHED_TOTAL.inc()
+            raise HTTPException(503, "Deadline exceeded before processing", headers={"Retry-After": "1"})
+
         # Normalize hex
         hex_color = hex.strip()
 
+        # Pin one catalog snapshot for the whole request
+        snapshot = local_recommender.CATALOG.current()
+
+        # Metadata filters -> row selection (evaluated before any vector work)
+        with metrics.stage("filter"):
+            row_ids = snapshot.metadata.select_rows(
+                year_min=year_min,
+                year_max=year_max,
+                popularity_min=popularity_min,
+                genres=split_multi(genres),
+                exclude_artists=split_multi(exclude_artists),
+            )
+
         # Color -> prompt + VAD
-        prompt, vad_vals = color_to_text_prompt(hex_color)
-        print("PROMPT:", prompt)
+        with metrics.stage("prompt"):
+            prompt, vad_vals = color_to_text_prompt(hex_color)
 
         if vad_vals is not None and len(vad_vals) == 2:
             v, a = vad_vals
         else:
             v, a = 0.5, 0.5
 
-        # Encode prompt -> CLAP
-        text_emb = clap.encode_text(prompt)
-        text_emb = np.asarray(text_emb, dtype=np.float32)
-
-        if text_emb.size >= 512:
-            text_emb = text_emb[:512]
-        else:
-            pad = np.zeros(512 - text_emb.size, dtype=np.float32)
-            text_emb = np.concatenate([text_emb, pad])
-
-        # Build 1027-D vector
-        audio_emb = np.zeros(512, dtype=np.float32)
-        vad_emb = np.zeros(3, dtype=np.float32)
-
-        query_vec = np.concatenate(
-            [text_emb, audio_emb, vad_emb]
-        ).astype("float32")
-
-        _ = store.search(query_vec, k=200)
+        # Exclusions -> one row bitmap (session history + explicit ids)
+        with metrics.stage("exclude"):
+            exclude = sessions.bitmap(session_id, snapshot) if session_id else None
+            excluded_ids = split_multi(exclude_ids)
+            if excluded_ids:
+                exclude = add_excluded_ids(exclude, snapshot, excluded_ids)
 
+        wants_taste = bool(token)
+        tier = ADMISSION.choose_tier(deadline, wants_taste)
         taste = None
-        if token and refresh_token:
-            try:
-                taste = spotify_fetcher.get_user_taste_profile(
-                    access_token=token,
-                    refresh_token=refresh_token
-                )
-            except Exception as e:
-                print("Taste fetch failed:", e)
-
-        print("RECOMMEND TOKEN:", token)
-        print("USING TASTE:", taste)
-
-        recs = recommend_hybrid(
-            query_embed=text_emb[:512],
-            v=v,
-            a=a,
-            hex_color=hex_color,
-            limit=k,
-            user_taste=taste
-        )
-
-        return {
+        ranked = None
+        if tier != "cached":
+            # Heavy work (encode + rank) under admission control; a request
+            # that cannot get a slot in time degrades to the cached tiers
+            with ADMISSION.admit(deadline, reserve=ADMISSION.estimate("encode", "rank_coarse")) as admitted:
+                if admitted:
+                    tier = ADMISSION.choose_tier(deadline, wants_taste)
+                if admitted and tier != "cached":
+                    ranked, taste, tier = recommend_ranking(
+                        deadline, tier, snapshot, prompt, hex_color, v, a, k,
+                        token, refresh_token, exclude_recent, row_ids, exclude,
+                    )
+
+        if ranked is None:
+            # Degraded: no encoder, no scoring beyond a cached/precomputed list
+            with metrics.stage("fallback"):
+                ranked = recent_results.get(snapshot, hex_color)
+                tier = "cached"
+                if ranked is None:
+                    ranked = local_recommender.precomputed_ranking(snapshot, hex_color, v, a, RANKING_DEPTH)
+                    tier = "precomputed"
+                ranked = restrict_rows(ranked, row_ids, exclude)
+
+        TIER_TOTAL.inc(tier=tier)
+
+        meta = {
             "hex": hex_color,
             "prompt": prompt,
             "vad": {"valence": v, "arousal": a},
-            "recommendations": recs
+            "tier": tier,
         }
+        list_id = rankings.put(snapshot, ranked, meta)
+
+        if session_id:
+            sessions.record(session_id, snapshot, ranked[:k])
+
+        metrics.log_event(
+            "recommend",
+            hex=hex_color,
+            prompt=prompt,
+            has_token=bool(token),
+            catalog_version=snapshot.version,
+            taste=taste,
+            tier=tier,
+            n_results=min(k, len(ranked)),
+        )
+
+        with metrics.stage("render"):
+            return fast_json.json_response({
+                **meta,
+                "recommendations": snapshot.payloads.join(ranked[:k]),
+                "next_cursor": RankingCache.next_cursor(list_id, len(ranked), k),
+            })
 
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(
             status_code=500,
             detail=f"Recommendation failed: {str(e)}"
         )
-    
\ No newline at end of file
+    
+
+# Similar Tracks ("more like this")
+@app.get("/similar/{track_id}")
+def similar(track_id: str, k: int = 10):
+    """Neighbors of a catalog track from the precomputed graph: an O(k) slice, no encoder."""
+    snapshot = local_recommender.CATALOG.current()
+    rows = snapshot.metadata.rows_for_ids([track_id])
+    if len(rows) == 0:
+        raise HTTPException(404, f"Unknown track: {track_id}")
+
+    with metrics.stage("similar"):
+        found = local_recommender.similar_tracks(snapshot, int(rows[0]), k=max(1, min(k, 50)))
+    if found is None:
+        raise HTTPException(503, "Similar-track graph is still being built", headers={"Retry-After": "5"})
+    similar_rows, scores = found
+
+    metrics.log_event("similar", track_id=track_id, catalog_version=snapshot.version, n_results=len(similar_rows))
+    return fast_json.json_response({
+        "track_id": track_id,
+        "catalog_version": snapshot.version,
+        "scores": np.round(scores, 4),
+        "similar": snapshot.payloads.join(similar_rows),
+    })
+
+
+# Color Journey (playlist through a sequence of colors)
+@app.get("/journey")
+def journey(
+    stops: List[str] = Query(...),
+    length: int = 30,
+    exclude_ids: Optional[List[str]] = Query(None),
+    session_id: Optional[str] = None,
+    deadline_ms: Optional[float] = None,
+    request: Request = None,
+):
+    """
+    `length` tracks moving through the color stops in order (?stops=#ff7e5f,#feb47b,#2b1055),
+    scored for all stops at once and sequenced by beam search (see app/utils/journey.py).
+    """
+    hex_colors = split_multi(stops)
+    if not 1 <= len(hex_colors) <= journeys.JOURNEY_MAX_STOPS:
+        raise HTTPException(400, f"Give between 1 and {journeys.JOURNEY_MAX_STOPS} color stops")
+    if not 2 <= length <= journeys.JOURNEY_MAX_LENGTH:
+        raise HTTPException(400, f"length must be between 2 and {journeys.JOURNEY_MAX_LENGTH}")
+
+    budget_ms = min(deadline_ms or journeys.JOURNEY_DEADLINE_MS, journeys.JOURNEY_DEADLINE_MS)
+    deadline = Deadline(budget_ms / 1000, start=getattr(request.state, "arrived", None))
+    if deadline.expired():
+        SHED_TOTAL.inc()
+        raise HTTPException(503, "Deadline exceeded before processing", headers={"Retry-After": "1"})
+
+    try:
+        snapshot = local_recommender.CATALOG.current()
+
+        with metrics.stage("prompt"):
+            prompts, vads = [], []
+            for hex_color in hex_colors:
+                prompt, emotions = color_to_text_prompt(hex_color)
+                prompts.append(prompt)
+                vads.append(journeys.stop_vad(emotions))
+
+        with metrics.stage("exclude"):
+            exclude = sessions.bitmap(session_id, snapshot) if session_id else None
+            excluded_ids = split_multi(exclude_ids)
+            if excluded_ids:
+                exclude = add_excluded_ids(exclude, snapshot, excluded_ids)
+
+        with ADMISSION.admit(deadline) as admitted:
+            if not admitted:
+                SHED_TOTAL.inc()
+                raise HTTPException(503, "Too busy to plan a journey right now", headers={"Retry-After": "1"})
+
+            # every stop prompt in one encoder batch
+            clap.get()
+            with ADMISSION.stage("journey_encode"):  # a batch; kept apart from /recommend's single encode
+                embeds = clap.encode_texts(prompts)
+            plan_stops = [journeys.Stop(h, e, v, a) for h, e, (v, a) in zip(hex_colors, embeds, vads)]
+
+            with metrics.stage("journey"):
+                rows, objective = journeys.plan_journey(snapshot, plan_stops, length, exclude=exclude)
+
+        if session_id:
+            sessions.record(session_id, snapshot, rows)
+
+        metrics.log_event(
+            "journey",
+            stops=hex_colors,
+            length=length,
+            catalog_version=snapshot.version,
+            n_results=len(rows),
+        )
+
+        with metrics.stage("render"):
+            return fast_json.json_response({
+                "stops": [
+                    {"hex": h, "prompt": p, "vad": {"valence": round(v, 3), "arousal": round(a, 3)}}
+                    for h, p, (v, a) in zip(hex_colors, prompts, vads)
+                ],
+                "length": len(rows),
+                "score": round(objective, 4),
+                "tracks": snapshot.payloads.join(rows),
+            })
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Journey failed: {str(e)}")
@@ -0,0 +1,172 @@
+# app/models/catalog.py
+import os
+import time
+import threading
+import traceback
+from typing import Callable, Dict, List, Optional
+
+
+class CatalogSnapshot:
+    """
+    Immutable, versioned view of the recommender catalog.
+
+    Holds the track frame, the normalized embedding matrix and every
+    structure derived from them (masks, pools, indexes). Requests take a
+    reference to one snapshot and use it throughout, so a reload never
+    changes data under an in-flight request. Per-snapshot caches are built
+    on first use through derived().
+    """
+
+    def __init__(self, version: int, df, emb_norm, source: Optional[str] = None):
+        self.version = version
+        self.df = df
+        self.emb_norm = emb_norm
+        self.source = source
+        self.source_mtime = os.path.getmtime(source) if source and os.path.exists(source) else None
+        self.built_at = time.time()
+
+        self._derived: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.df)
+
+    def derived(self, name: str, build: Callable[["CatalogSnapshot"], object]):
+        """Return the structure `name` for this snapshot, building it once."""
+        value = self._derived.get(name)
+        if value is not None:
+            return value
+        with self._lock:
+            value = self._derived.get(name)
+            if value is None:
+                value = build(self)
+                self._derived[name] = value
+        return value
+
+    def peek_derived(self, name: str):
+        """The structure `name` if it has been built already, else None."""
+        return self._derived.get(name)
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "tracks": len(self),
+            "source": self.source,
+            "source_mtime": self.source_mtime,
+            "built_at": self.built_at,
+        }
+
+
+class CatalogManager:
+    """
+    Owns the current CatalogSnapshot and swaps in new ones.
+
+    build(version) must return a fully built snapshot; it runs outside the
+    swap lock (in a background thread for reload()), and the new snapshot
+    replaces the old one with a single reference assignment.
+    """
+
+    def __init__(self, build: Callable[[int], CatalogSnapshot], watch_paths: Optional[List[str]] = None):
+        self._build = build
+        self._watch_paths = list(watch_paths or [])
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._version = 0
+        self._lock = threading.Lock()
+        self._reloading = threading.Lock()
+        self._listeners: List[Callable] = []
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.last_error: Optional[str] = None
+
+    def peek(self) -> Optional[CatalogSnapshot]:
+        """Current snapshot, or None if nothing has been loaded yet."""
+        return self._snapshot
+
+    def current(self) -> CatalogSnapshot:
+        """Current snapshot; the first call builds it synchronously."""
+        snap = self._snapshot
+        if snap is not None:
+            return snap
+        with self._lock:
+            if self._snapshot is None:
+                self._swap(self._build_next())
+            return self._snapshot
+
+    def subscribe(self, fn: Callable[[Optional[CatalogSnapshot], CatalogSnapshot], None]):
+        """Call fn(old, new) after every swap."""
+        self._listeners.append(fn)
+
+    def _build_next(self) -> CatalogSnapshot:
+        self._version += 1
+        return self._build(self._version)
+
+    def _swap(self, new: CatalogSnapshot):
+        old = self._snapshot
+        self._snapshot = new
+        print(f"[Catalog] Now serving snapshot v{new.version} ({len(new)} tracks)")
+        for fn in self._listeners:
+            try:
+                fn(old, new)
+            except Exception:
+                traceback.print_exc()
+
+    def reload(self, block: bool = False) -> bool:
+        """
+        Build the next snapshot and swap it in. Returns False if a reload
+        is already running. With block=False the build runs in a thread.
+        """
+        if not self._reloading.acquire(blocking=False):
+            return False
+
+        def run():
+            try:
+                new = self._build_next()
+                with self._lock:
+                    self._swap(new)
+                self.last_error = None
+            except Exception as e:
+                traceback.print_exc()
+                self.last_error = str(e)
+            finally:
+                self._reloading.release()
+
+        if block:
+            run()
+        else:
+            threading.Thread(target=run, name="catalog-reload", daemon=True).start()
+        return True
+
+    @property
+    def reloading(self) -> bool:
+        return self._reloading.locked()
+
+    # File watcher
+    def _mtimes(self):
+        return tuple(os.path.getmtime(p) if os.path.exists(p) else None for p in self._watch_paths)
+
+    def start_watcher(self, interval: float = 5.0):
+        """Poll the watched files and reload when any of them changes."""
+        if self._watcher is not None or not self._watch_paths:
+            return
+
+        def watch():
+            last = self._mtimes()
+            while not self._stop.wait(interval):
+                now = self._mtimes()
+                if now != last and self.reload(block=True):
+                    last = now
+
+        self._watcher = threading.Thread(target=watch, name="catalog-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+
+    def status(self) -> dict:
+        snap = self._snapshot
+        return {
+            "loaded": snap is not None,
+            "reloading": self.reloading,
+            "last_error": self.last_error,
+            **(snap.info() if snap is not None else {}),
+        }
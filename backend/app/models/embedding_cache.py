@@ -0,0 +1,126 @@
+# app/models/embedding_cache.py
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.utils import metrics
+
+EMBED_CACHE_MB = float(os.getenv("SHIKISAI_EMBED_CACHE_MB", "512"))  # 0 = no cache
+EMBED_CACHE_PATH = os.getenv("SHIKISAI_EMBED_CACHE_PATH", "")  # default: <data_dir>/embedding_cache.sqlite
+
+_SQL_VARS = 500  # keys per IN (...) query, under SQLite's variable limit
+
+
+def cache_key(encoder_version: str, text: str) -> bytes:
+    return hashlib.sha256(f"{encoder_version}\x00{text}".encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed text embeddings on disk: sha256(encoder version, text)
+    -> float32 vector, in SQLite so every store and process on the host can
+    share it. Entries are evicted least-recently-used once the stored vectors
+    exceed max_mb.
+    """
+
+    def __init__(self, path: str, max_mb: float = EMBED_CACHE_MB):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._stats = metrics.REGISTRY.cache("embedding_cache")
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key BLOB PRIMARY KEY,
+                vec BLOB NOT NULL,
+                used INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS embeddings_used ON embeddings(used);
+        """)
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM embeddings").fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def get_many(self, encoder_version: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Cached vector per text (None on a miss), in input order."""
+        keys = [cache_key(encoder_version, t) for t in texts]
+        found: Dict[bytes, np.ndarray] = {}
+        with self._lock:
+            now = time.time_ns()  # wall clock, so processes sharing the file agree on recency
+            for i in range(0, len(keys), _SQL_VARS):
+                chunk = keys[i:i + _SQL_VARS]
+                marks = ",".join("?" * len(chunk))
+                for key, vec in self._conn.execute(f"SELECT key, vec FROM embeddings WHERE key IN ({marks})", chunk):
+                    found[key] = np.frombuffer(vec, dtype=np.float32).copy()
+            if found:
+                self._conn.executemany("UPDATE embeddings SET used = ? WHERE key = ?", [(now, k) for k in found])
+                self._conn.commit()
+        out = [found.get(k) for k in keys]
+        n_hit = sum(v is not None for v in out)
+        self._stats.hit(n_hit)
+        self._stats.miss(len(out) - n_hit)
+        return out
+
+    def put_many(self, encoder_version: str, texts: Sequence[str], vectors: Sequence[np.ndarray]):
+        rows = [
+            (cache_key(encoder_version, t), np.asarray(v, dtype=np.float32).tobytes())
+            for t, v in zip(texts, vectors)
+        ]
+        if not rows:
+            return
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vec, used) VALUES (?, ?, ?)",
+                [(k, v, time.time_ns()) for k, v in rows],
+            )
+            if self._conn.total_changes - before == len(rows):
+                self._bytes += sum(len(v) for _, v in rows)
+            else:
+                self._bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM embeddings").fetchone()[0]
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop least-recently-used entries until the vectors fit in max_bytes (lock held)."""
+        if self._bytes <= self.max_bytes:
+            return
+        # evict down to 90% so a full cache does not evict on every insert
+        target = int(self.max_bytes * 0.9)
+        freed = 0
+        cur = self._conn.execute("SELECT key, LENGTH(vec) FROM embeddings ORDER BY used")
+        doomed = []
+        for key, size in cur:
+            if self._bytes - freed <= target:
+                break
+            doomed.append((key,))
+            freed += size
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", doomed)
+        self._bytes -= freed
+        print(f"[EmbeddingCache] Evicted {len(doomed)} embeddings ({freed / 1e6:.1f} MB)")
+
+
+def open_cache(data_dir: str, max_mb: float = EMBED_CACHE_MB) -> Optional[EmbeddingCache]:
+    """The host's shared cache (None when disabled or unavailable)."""
+    if max_mb <= 0:
+        return None
+    path = EMBED_CACHE_PATH or os.path.join(data_dir, "embedding_cache.sqlite")
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return EmbeddingCache(path, max_mb)
+    except sqlite3.Error as e:
+        print("[EmbeddingCache] Disabled:", e)
+        return None
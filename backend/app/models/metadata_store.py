@@ -0,0 +1,179 @@
+# app/models/metadata_store.py
+import ast
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+FLAG_COLUMNS = ("allowed", "is_theme", "is_classical", "is_romance", "is_instrumental")
+
+
+def _as_list(x) -> List[str]:
+    if isinstance(x, str):
+        if x.startswith("["):
+            try:
+                x = ast.literal_eval(x)
+            except Exception:
+                return [x]
+        else:
+            return [x]
+    if isinstance(x, (list, tuple, np.ndarray)):
+        return [str(v) for v in x if v is not None and str(v)]
+    return []
+
+
+class MetadataStore:
+    """
+    Indexed SQLite view of one catalog snapshot's metadata.
+
+    Rows are keyed by their catalog row number, so select_rows() returns a
+    row-id selection that recommend_hybrid can apply before any vector work.
+    Genres and artists live in their own tables (one row per value) so both
+    are index lookups; year, popularity and the content flags are indexed
+    columns on tracks.
+    """
+
+    def __init__(self, df, features: Optional[Dict] = None, path: str = ":memory:"):
+        self.n_rows = len(df)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._load(df, features or {})
+
+    def _load(self, df, feats):
+        c = self._conn
+        c.executescript("""
+            DROP TABLE IF EXISTS tracks;
+            DROP TABLE IF EXISTS track_genres;
+            DROP TABLE IF EXISTS track_artists;
+            CREATE TABLE tracks (
+                row INTEGER PRIMARY KEY,
+                id TEXT,
+                name TEXT,
+                release_year INTEGER,
+                popularity REAL,
+                allowed INTEGER,
+                is_theme INTEGER,
+                is_classical INTEGER,
+                is_romance INTEGER,
+                is_instrumental INTEGER
+            );
+            CREATE TABLE track_genres (genre TEXT, row INTEGER);
+            CREATE TABLE track_artists (artist TEXT, row INTEGER);
+        """)
+
+        n = len(df)
+        allowed = np.zeros(n, dtype=bool)
+        if "allowed_rows" in feats:
+            allowed[feats["allowed_rows"]] = True
+
+        def flag(name):
+            values = feats.get(name)
+            return np.zeros(n, dtype=bool) if values is None else np.asarray(values, dtype=bool)
+
+        is_instrumental = (df["instrumentalness"] > 0.75).to_numpy()
+        c.executemany(
+            "INSERT INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            zip(
+                range(n),
+                df["id"].astype(str),
+                df["name"].astype(str),
+                df["release_year"].astype(int).tolist(),
+                df["popularity"].astype(float).tolist(),
+                allowed.astype(int).tolist(),
+                flag("is_theme").astype(int).tolist(),
+                flag("is_classical").astype(int).tolist(),
+                flag("is_romance").astype(int).tolist(),
+                is_instrumental.astype(int).tolist(),
+            ),
+        )
+        c.executemany(
+            "INSERT INTO track_genres VALUES (?, ?)",
+            ((g.lower().strip(), i) for i, gs in enumerate(df["genres"]) for g in _as_list(gs)),
+        )
+        c.executemany(
+            "INSERT INTO track_artists VALUES (?, ?)",
+            ((a.lower().strip(), i) for i, arts in enumerate(df["artists"]) for a in _as_list(arts)),
+        )
+        c.executescript("""
+            CREATE INDEX idx_tracks_id ON tracks(id);
+            CREATE INDEX idx_tracks_year ON tracks(release_year);
+            CREATE INDEX idx_tracks_pop ON tracks(popularity);
+            CREATE INDEX idx_tracks_flags ON tracks(allowed, is_theme, is_classical, is_romance, is_instrumental);
+            CREATE INDEX idx_genres ON track_genres(genre, row);
+            CREATE INDEX idx_artists ON track_artists(artist, row);
+        """)
+        c.commit()
+
+    def select_rows(
+        self,
+        year_min: Optional[int] = None,
+        year_max: Optional[int] = None,
+        popularity_min: Optional[float] = None,
+        genres: Optional[Iterable[str]] = None,
+        artists: Optional[Iterable[str]] = None,
+        exclude_artists: Optional[Iterable[str]] = None,
+        flags: Optional[Dict[str, bool]] = None,
+    ) -> Optional[np.ndarray]:
+        """
+        Sorted row ids matching every given filter, or None when no filter
+        is set (meaning "all rows"). genres/artists match any listed value.
+        """
+        where, params = [], []
+
+        if year_min is not None:
+            where.append("t.release_year >= ?")
+            params.append(int(year_min))
+        if year_max is not None:
+            where.append("t.release_year <= ?")
+            params.append(int(year_max))
+        if popularity_min is not None:
+            where.append("t.popularity >= ?")
+            params.append(float(popularity_min))
+
+        for name, value in (flags or {}).items():
+            if name not in FLAG_COLUMNS:
+                raise ValueError(f"Unknown flag: {name}")
+            where.append(f"t.{name} = ?")
+            params.append(int(bool(value)))
+
+        def norm(values):
+            return [v.lower().strip() for v in values or [] if v and v.strip()]
+
+        genres, artists, exclude_artists = norm(genres), norm(artists), norm(exclude_artists)
+
+        if genres:
+            marks = ",".join("?" * len(genres))
+            where.append(f"t.row IN (SELECT row FROM track_genres WHERE genre IN ({marks}))")
+            params.extend(genres)
+        if artists:
+            marks = ",".join("?" * len(artists))
+            where.append(f"t.row IN (SELECT row FROM track_artists WHERE artist IN ({marks}))")
+            params.extend(artists)
+        if exclude_artists:
+            marks = ",".join("?" * len(exclude_artists))
+            where.append(f"t.row NOT IN (SELECT row FROM track_artists WHERE artist IN ({marks}))")
+            params.extend(exclude_artists)
+
+        if not where:
+            return None
+
+        sql = "SELECT t.row FROM tracks t WHERE " + " AND ".join(where) + " ORDER BY t.row"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+
+    def rows_for_ids(self, track_ids: Iterable[str]) -> np.ndarray:
+        ids = [str(t) for t in track_ids if t]
+        if not ids:
+            return np.zeros(0, dtype=np.int64)
+        out = []
+        with self._lock:
+            # stay under SQLite's bound-parameter limit
+            for i in range(0, len(ids), 900):
+                chunk = ids[i:i + 900]
+                marks = ",".join("?" * len(chunk))
+                out.extend(r[0] for r in self._conn.execute(
+                    f"SELECT row FROM tracks WHERE id IN ({marks})", chunk
+                ))
+        return np.unique(np.asarray(out, dtype=np.int64))
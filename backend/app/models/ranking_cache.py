@@ -0,0 +1,166 @@
+# app/models/ranking_cache.py
+import os
+import time
+import secrets
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from app.utils import metrics
+
+RANKING_DEPTH = int(os.getenv("SHIKISAI_RANKING_DEPTH", "200"))
+RANKING_TTL_SECONDS = float(os.getenv("SHIKISAI_RANKING_TTL_SECONDS", "600"))
+RANKING_MAX_ENTRIES = int(os.getenv("SHIKISAI_RANKING_MAX_ENTRIES", "5000"))
+RANKING_MAX_ROWS = int(os.getenv("SHIKISAI_RANKING_MAX_ROWS", "1000000"))
+RECENT_RESULTS_MAX = int(os.getenv("SHIKISAI_RECENT_RESULTS", "4096"))
+
+
+class RankedList:
+    """One cached ranking: the snapshot it refers to, its rows and the response header fields."""
+
+    __slots__ = ("snapshot", "rows", "meta", "last_used")
+
+    def __init__(self, snapshot, rows: np.ndarray, meta: Dict):
+        self.snapshot = snapshot
+        self.rows = rows
+        self.meta = meta
+        self.last_used = time.monotonic()
+
+
+class RankingCache:
+    """
+    Server-side ranked candidate lists addressed by opaque cursors.
+
+    A cursor is "<list id>:<offset>", so following a page is a slice of the
+    cached rows with a stable order. Lists expire after ttl seconds without
+    use; beyond max_entries lists or max_rows cached rows in total, the
+    least recently used lists are dropped first. Each list keeps a reference
+    to its catalog snapshot; retire() drops the lists of older snapshots
+    after a catalog swap (their cursors answer 410), so a retired snapshot
+    and its embedding matrices are not kept alive by cached pages.
+    """
+
+    def __init__(
+        self,
+        ttl: float = RANKING_TTL_SECONDS,
+        max_entries: int = RANKING_MAX_ENTRIES,
+        max_rows: int = RANKING_MAX_ROWS,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._lists: "OrderedDict[str, RankedList]" = OrderedDict()
+        self._n_rows = 0
+        self._min_version = None  # lists of older snapshots are not kept
+        self._lock = threading.Lock()
+        self._stats = metrics.REGISTRY.cache("ranking")
+
+    def __len__(self):
+        return len(self._lists)
+
+    @property
+    def cached_rows(self) -> int:
+        return self._n_rows
+
+    def _drop(self, list_id: str):
+        entry = self._lists.pop(list_id)
+        self._n_rows -= len(entry.rows)
+
+    def _evict(self, now: float):
+        while self._lists:
+            list_id, entry = next(iter(self._lists.items()))
+            over = len(self._lists) > self.max_entries or self._n_rows > self.max_rows
+            if not over and now - entry.last_used < self.ttl:
+                break
+            self._drop(list_id)
+
+    def put(self, snapshot, rows, meta: Dict) -> str:
+        """Cache a ranking; returns its list id."""
+        list_id = secrets.token_urlsafe(9)
+        entry = RankedList(snapshot, np.asarray(rows, dtype=np.int32), meta)
+        with self._lock:
+            if self._min_version is None or snapshot.version >= self._min_version:
+                self._lists[list_id] = entry
+                self._n_rows += len(entry.rows)
+            self._evict(entry.last_used)
+        return list_id
+
+    def retire(self, version: int):
+        """Drop every list ranked against a snapshot older than `version`."""
+        with self._lock:
+            self._min_version = version
+            for list_id in [i for i, e in self._lists.items() if e.snapshot.version < version]:
+                self._drop(list_id)
+
+    def page(self, cursor: str, size: int) -> Optional[Tuple[RankedList, np.ndarray, Optional[str]]]:
+        """
+        Resolve a cursor to (list, rows of this page, next cursor or None).
+        Returns None for unknown, expired or malformed cursors (negative
+        offset) and for pages of fewer than one row.
+        """
+        try:
+            list_id, offset = cursor.rsplit(":", 1)
+            offset = int(offset)
+        except ValueError:
+            return None
+        if offset < 0 or size < 1:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._lists.get(list_id)
+            if entry is None:
+                self._stats.miss()
+                return None
+            entry.last_used = now
+            self._lists.move_to_end(list_id)
+        self._stats.hit()
+
+        return entry, entry.rows[offset:offset + size], self.next_cursor(list_id, len(entry.rows), offset + size)
+
+    @staticmethod
+    def next_cursor(list_id: str, n_rows: int, offset: int) -> Optional[str]:
+        """Cursor for the page starting at offset, or None past the end."""
+        return f"{list_id}:{offset}" if offset < n_rows else None
+
+
+class RecentResults:
+    """
+    Latest generic (no taste, filters or exclusions) ranking per
+    (catalog version, color). Served by the "cached" degradation tier,
+    filtered to the request's rows.
+    """
+
+    def __init__(self, ttl: float = RANKING_TTL_SECONDS, max_entries: int = RECENT_RESULTS_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[float, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = metrics.REGISTRY.cache("recent_results")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, snapshot, hex_color: str, rows):
+        key = (snapshot.version, hex_color.lower())
+        with self._lock:
+            self._entries[key] = (time.monotonic(), np.asarray(rows, dtype=np.int32))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, snapshot, hex_color: str) -> Optional[np.ndarray]:
+        key = (snapshot.version, hex_color.lower())
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+        if entry is None:
+            self._stats.miss()
+            return None
+        self._stats.hit()
+        return entry[1]
@@ -0,0 +1,97 @@
+# app/models/session_history.py
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+SESSION_TTL_SECONDS = float(os.getenv("SHIKISAI_SESSION_TTL_SECONDS", "1800"))
+MAX_SESSIONS = int(os.getenv("SHIKISAI_MAX_SESSIONS", "10000"))
+
+
+# Row bitmaps: bit (r & 7) of byte (r >> 3) is set when row r is excluded
+def new_bitmap(n_rows: int) -> np.ndarray:
+    return np.zeros((n_rows + 7) // 8, dtype=np.uint8)
+
+
+def set_rows(bits: np.ndarray, rows) -> np.ndarray:
+    rows = np.asarray(rows, dtype=np.int64)
+    if len(rows):
+        np.bitwise_or.at(bits, rows >> 3, (1 << (rows & 7)).astype(np.uint8))
+    return bits
+
+
+def test_rows(bits: np.ndarray, rows) -> np.ndarray:
+    """Boolean array: is each row's bit set."""
+    rows = np.asarray(rows, dtype=np.int64)
+    return ((bits[rows >> 3] >> (rows & 7).astype(np.uint8)) & 1).astype(bool)
+
+
+class SessionHistory:
+    """
+    Recently served tracks per client session.
+
+    A session keeps only the sorted rows it was served (4 bytes each); the
+    catalog-sized bitmap that ranking consumes is built per request. Rows
+    are tied to the catalog snapshot version they were recorded against;
+    after a snapshot swap the row numbering changes, so the old history is
+    dropped. Sessions expire after SESSION_TTL_SECONDS without use, and at
+    most MAX_SESSIONS are kept (least recently used evicted first).
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL_SECONDS, max_sessions: int = MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        # session_id -> (snapshot_version, sorted int32 rows, last_used)
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _expire(self, now: float):
+        while self._sessions:
+            sid, (_, _, last_used) = next(iter(self._sessions.items()))
+            if now - last_used < self.ttl and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.pop(sid)
+
+    def rows(self, session_id: str, snapshot) -> Optional[np.ndarray]:
+        """Sorted rows served in this session on this snapshot, or None."""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(session_id)
+            if entry is None or entry[0] != snapshot.version:
+                return None
+            return entry[1]
+
+    def bitmap(self, session_id: str, snapshot) -> Optional[np.ndarray]:
+        """The session's served rows as a fresh row bitmap for this snapshot, or None."""
+        rows = self.rows(session_id, snapshot)
+        if rows is None:
+            return None
+        return set_rows(new_bitmap(len(snapshot)), rows)
+
+    def record(self, session_id: str, snapshot, rows):
+        """Mark rows as served in this session."""
+        now = time.time()
+        rows = np.asarray(rows, dtype=np.int32)
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry is not None and entry[0] == snapshot.version:
+                rows = np.union1d(entry[1], rows)
+            else:
+                rows = np.unique(rows)
+            self._sessions[session_id] = (snapshot.version, rows, now)
+            self._expire(now)
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return sum(e[1].nbytes for e in self._sessions.values())
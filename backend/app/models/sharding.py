@@ -0,0 +1,301 @@
+# app/models/sharding.py
+"""
+Scatter-gather scoring over a catalog split into row-range shards.
+
+Each shard is a process (local or remote) that loads one slice of the
+catalog and answers "top M for this query" over multiprocessing.connection
+(TCP + HMAC authkey). The coordinator merges the shard lists and applies the
+global dedup rules. Every hybrid-score term is row-local and ties are broken
+by a seeded hash of the global row id, so the merged ranking is identical to
+rank_hybrid over the unsharded catalog.
+
+    python -m app.models.sharding split --shards 4 --out data/shards
+    SHIKISAI_SHARD_AUTHKEY=<secret> python -m app.models.sharding serve --manifest data/shards/shards.json --shard 0 --port 7101
+"""
+import os
+import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import AuthenticationError, Listener, Client
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from app.utils import local_recommender as lr
+from app.models.session_history import new_bitmap, set_rows
+
+PAYLOAD_COLUMNS = ("id", "name", "artists")  # what track_payload reads
+
+
+def shard_authkey(authkey: Optional[bytes] = None) -> bytes:
+    """
+    The shared HMAC key for shard connections: `authkey`, else
+    SHIKISAI_SHARD_AUTHKEY. There is no default: connections carry pickles,
+    so a known key would let anyone who can reach a shard run code on it.
+    """
+    key = authkey or os.getenv("SHIKISAI_SHARD_AUTHKEY", "").encode("utf-8")
+    if not key:
+        raise RuntimeError("SHIKISAI_SHARD_AUTHKEY is not set; shards need a shared secret")
+    return key
+
+
+# SPLIT
+def split_catalog(catalog_path: str, n_shards: int, out_dir: str) -> str:
+    """
+    Write the cleaned catalog as n_shards contiguous row ranges plus a
+    shards.json manifest; returns the manifest path. Row numbers are those of
+    the unsharded snapshot (after invalid embeddings are dropped).
+    """
+    df = pd.read_csv(catalog_path)
+    valid = df["clap_embed"].apply(lr.safe_parse_embed).notnull().to_numpy()
+    df = df[valid].reset_index(drop=True)
+
+    os.makedirs(out_dir, exist_ok=True)
+    bounds = np.linspace(0, len(df), n_shards + 1).astype(int)
+    shards = []
+    for i in range(n_shards):
+        start, end = int(bounds[i]), int(bounds[i + 1])
+        path = os.path.join(out_dir, f"shard-{i}.csv")
+        df.iloc[start:end].to_csv(path, index=False)
+        shards.append({"path": os.path.abspath(path), "start": start, "end": end})
+
+    manifest = os.path.join(out_dir, "shards.json")
+    with open(manifest, "w", encoding="utf-8") as f:
+        json.dump({"source": os.path.abspath(catalog_path), "n_rows": len(df), "shards": shards}, f, indent=2)
+    return manifest
+
+
+# SHARD SIDE
+def _hash_keys(strings: pd.Series) -> np.ndarray:
+    return pd.util.hash_pandas_object(strings, index=False).to_numpy()
+
+
+class Shard:
+    """One catalog slice: a regular snapshot whose row r is global row offset + r."""
+
+    def __init__(self, path: str, offset: int, version: int = 1):
+        self.snap = lr.build_snapshot(version, path)
+        self.offset = offset
+        keys = lr.dedup_key_strings(self.snap.df)
+        self.key_hashes = {name: _hash_keys(s) for name, s in keys.items()}
+        self.columns = {c: snap_col.to_numpy() for c, snap_col in self.snap.df[list(PAYLOAD_COLUMNS)].items()}
+
+    def info(self) -> Dict:
+        return {"offset": self.offset, "n_rows": len(self.snap), "version": self.snap.version}
+
+    def top(self, m: int, query_embed, v, a, seed: int, filters: Optional[Dict] = None,
+            exclude_rows: Optional[Sequence[int]] = None, **kw) -> Dict:
+        """
+        This shard's best m rows by (clipped score desc, tiebreak asc), with
+        what the coordinator needs to merge and dedup them. exhausted=True
+        when no rows beyond these exist.
+        """
+        snap = self.snap
+        row_ids = snap.metadata.select_rows(**filters) if filters else None
+
+        exclude = None
+        if exclude_rows is not None and len(exclude_rows):
+            local = np.asarray(exclude_rows, dtype=np.int64) - self.offset
+            local = local[(local >= 0) & (local < len(snap))]
+            if len(local):
+                exclude = new_bitmap(len(snap))
+                set_rows(exclude, local)
+
+        rows, score, _ = lr.score_candidates(
+            query_embed, v, a, row_ids=row_ids, exclude=exclude, snapshot=snap, **kw
+        )
+        score = np.clip(score, 0, None)
+        global_rows = rows.astype(np.int64) + self.offset
+        tie = lr.tiebreak(global_rows, seed)
+
+        top = lr.top_window(score, tie, min(m, len(rows)))
+        rows = rows[top]
+        feats = snap.features
+        return {
+            "rows": global_rows[top],
+            "score": score[top],
+            "tie": tie[top],
+            "song_key": self.key_hashes["song_key"][rows],
+            "artist_key": self.key_hashes["artist_key"][rows],
+            "name_key": self.key_hashes["name_key"][rows],
+            "is_classical": feats["is_classical"][rows],
+            "fields": {c: self.columns[c][rows] for c in PAYLOAD_COLUMNS},
+            "exhausted": len(top) == len(score),
+        }
+
+
+def serve(shard: Shard, host: str = "127.0.0.1", port: int = 7101, authkey: Optional[bytes] = None):
+    """Answer coordinator requests forever, one thread per connection."""
+    authkey = shard_authkey(authkey)
+
+    def handle(conn):
+        with conn:
+            while True:
+                try:
+                    op, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if op == "top":
+                        conn.send(("ok", shard.top(**kwargs)))
+                    elif op == "info":
+                        conn.send(("ok", shard.info()))
+                    else:
+                        conn.send(("error", f"unknown op {op}"))
+                except Exception as e:
+                    conn.send(("error", f"{type(e).__name__}: {e}"))
+
+    with Listener((host, port), authkey=authkey) as listener:
+        print(f"[Shard] rows {shard.offset}..{shard.offset + len(shard.snap)} listening on {host}:{port}")
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, EOFError, OSError) as e:
+                print(f"[Shard] Rejected connection: {type(e).__name__}")
+                continue
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+
+# COORDINATOR SIDE
+class ShardClient:
+    """Connections to one shard, one per calling thread."""
+
+    def __init__(self, address, authkey: Optional[bytes] = None):
+        self.address = address
+        self.authkey = shard_authkey(authkey)
+        self._local = threading.local()
+
+    def call(self, op: str, **kwargs):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = Client(self.address, authkey=self.authkey)
+        try:
+            conn.send((op, kwargs))
+            status, result = conn.recv()
+        except (EOFError, OSError):
+            self._local.conn = None
+            raise
+        if status != "ok":
+            raise RuntimeError(f"shard {self.address}: {result}")
+        return result
+
+
+def parse_addresses(spec: str) -> List[tuple]:
+    """"host:port,host:port" -> [(host, port), ...]"""
+    out = []
+    for part in spec.split(","):
+        host, _, port = part.strip().rpartition(":")
+        out.append((host or "127.0.0.1", int(port)))
+    return out
+
+
+class ShardedCatalog:
+    """
+    Coordinator: scatter a query to every shard, merge their sorted top lists
+    and dedup globally, deepening the shards that could still contribute.
+    """
+
+    def __init__(self, addresses, authkey: Optional[bytes] = None):
+        if isinstance(addresses, str):
+            addresses = parse_addresses(addresses)
+        self.clients = [ShardClient(a, authkey) for a in addresses]
+        self.pool = ThreadPoolExecutor(max_workers=4 * len(self.clients), thread_name_prefix="shard")
+
+    def info(self) -> List[Dict]:
+        return list(self.pool.map(lambda c: c.call("info"), self.clients))
+
+    def _gather(self, shard_ids, m, query):
+        futures = {i: self.pool.submit(self.clients[i].call, "top", m=m, **query) for i in shard_ids}
+        return {i: f.result() for i, f in futures.items()}
+
+    def rank(
+        self,
+        query_embed,
+        v,
+        a,
+        hex_color=None,
+        user_taste=None,
+        preferences=None,
+        depth=10,
+        filters=None,
+        exclude_rows=None,
+        seed=None,
+    ):
+        """
+        Same result as rank_hybrid(...) over the unsharded catalog (without
+        the coarse pass): (global rows, payloads), best first, after dedup.
+        filters are MetadataStore.select_rows keyword arguments.
+        """
+        if seed is None:
+            seed = np.random.randint(0, 2**31)
+        query = dict(
+            query_embed=np.asarray(query_embed, dtype=np.float32)[:512], v=v, a=a, seed=seed,
+            hex_color=hex_color, user_taste=user_taste, preferences=preferences,
+            filters=filters, exclude_rows=None if exclude_rows is None else np.asarray(exclude_rows),
+        )
+
+        m = max(depth * 2, 32)
+        results = self._gather(range(len(self.clients)), m, query)
+        while True:
+            n_safe, parts = self._merge(results)
+            ranked = lr.dedupe_ranked(np.arange(n_safe), parts)
+            pending = [i for i, r in results.items() if not r["exhausted"]]
+            if len(ranked) >= depth or not pending:
+                ranked = ranked[:depth]
+                payloads = [lr.track_payload({c: parts[c][i] for c in PAYLOAD_COLUMNS}) for i in ranked]
+                return parts["rows"][ranked], payloads
+            # the complete prefix cannot fill `depth` yet: deepen the live shards
+            m *= 4
+            results.update(self._gather(pending, m, query))
+
+    @staticmethod
+    def _merge(results):
+        """
+        Merge shard lists into one (score desc, tie asc) order and keep the
+        prefix that is complete: everything ranked at or before the last row
+        of every shard that still has more rows.
+        """
+        cols = ("rows", "score", "tie", "song_key", "artist_key", "name_key", "is_classical")
+        parts = {c: np.concatenate([r[c] for r in results.values()]) for c in cols}
+        for c in PAYLOAD_COLUMNS:
+            parts[c] = np.concatenate([r["fields"][c] for r in results.values()])
+        order = np.lexsort((parts["tie"], -parts["score"]))
+        parts = {c: v[order] for c, v in parts.items()}
+
+        cut_short = [(r["score"][-1], r["tie"][-1]) for r in results.values() if not r["exhausted"] and len(r["rows"])]
+        n_safe = lr.complete_prefix(parts["score"], parts["tie"], cut_short)
+        return n_safe, parts
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    sp = sub.add_parser("split", help="split the catalog CSV into row-range shards")
+    sp.add_argument("--catalog", default=lr.FILE_PATH)
+    sp.add_argument("--shards", type=int, required=True)
+    sp.add_argument("--out", required=True)
+
+    sv = sub.add_parser("serve", help="serve one shard")
+    sv.add_argument("--manifest", required=True)
+    sv.add_argument("--shard", type=int, required=True)
+    sv.add_argument("--host", default="127.0.0.1")
+    sv.add_argument("--port", type=int, required=True)
+
+    args = ap.parse_args()
+    if args.cmd == "split":
+        print("Wrote", split_catalog(args.catalog, args.shards, args.out))
+    else:
+        try:
+            shard_authkey()
+        except RuntimeError as e:
+            raise SystemExit(f"Refusing to serve on {args.host}: {e}")
+        with open(args.manifest, encoding="utf-8") as f:
+            spec = json.load(f)["shards"][args.shard]
+        serve(Shard(spec["path"], spec["start"]), args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,24 +6,29 @@ import faiss
 from typing import List, Dict, Optional
 
 from app.utils.color_to_text import color_to_emotion
+from app.models.embedding_cache import EmbeddingCache
 
 # Fixed dimensions
 TEXT_DIM = 512
 AUDIO_DIM = 512
 VAD_DIM = 3
 FINAL_DIM = TEXT_DIM + AUDIO_DIM + VAD_DIM  # 1027
+ENCODE_BATCH = 64  # texts per CLAP call for cache misses
 
 # SongStore
 class SongStore:
     """
     FAISS-backed store for 1027-d song vectors (512 text + 512 audio + 3 VAD).
     - add_spotify_tracks(tracks): accepts simplified track dicts from spotify_fetcher
+    - remove_tracks(ids): drops tracks (used when a local file's content changes)
     - load_index(), _build_faiss(), search(q, k)
     - build_from_local(audio_dir): optional helper to encode local audio files (fallback)
+    - embed_cache: optional shared EmbeddingCache; text CLAP runs only on cache misses
     """
 
-    def __init__(self, clap, data_dir: str = "data"):
+    def __init__(self, clap, data_dir: str = "data", embed_cache: Optional[EmbeddingCache] = None):
         self.clap = clap
+        self.embed_cache = embed_cache
         self.dim = FINAL_DIM
 
         self.vectors: Optional[np.ndarray] = None
@@ -36,6 +41,27 @@ class SongStore:
         self.vectors_path = os.path.join(data_dir, "song_vectors.npy")
         self.meta_path = os.path.join(data_dir, "song_metadata.json")
 
+    @property
+    def encoder_version(self) -> Optional[str]:
+        return getattr(self.clap, "version", None)
+
+    def _check_encoders(self):
+        """Warn when stored vectors came from an encoder whose space differs from the current one."""
+        try:
+            compatible = getattr(self.clap, "compatible", None)
+        except Exception as e:
+            print("[SongStore] Encoder unavailable, skipping encoder check:", e)
+            return
+        if compatible is None:
+            return
+        counts: Dict[str, int] = {}
+        for m in self.metadata:
+            v = m.get("encoder")
+            if v and not compatible(v):
+                counts[v] = counts.get(v, 0) + 1
+        if counts:
+            print(f"[SongStore] WARNING: vectors from other encoders {counts}; current is {self.encoder_version}")
+
     # Helpers: clean text embedding to 512 dims
     def _extract_embedding_from_obj(self, obj):
         """
@@ -73,16 +99,20 @@ class SongStore:
             return np.concatenate([arr.astype(np.float32), pad])
 
     # Build full 1027-d vector
-    def _make_song_vector(self, text_output) -> Optional[np.ndarray]:
+    def _make_song_vector(self, text_output, audio_output=None) -> Optional[np.ndarray]:
         """
         Convert CLAP text output (whatever it is) into a strict 1027-d normalized vector.
+        audio_output (CLAP audio embedding) fills the audio block; zeros without it.
         Returns None if text_output cannot be interpreted.
         """
         text_emb = self._clean_text_embedding(text_output)
         if text_emb is None:
             return None
 
-        audio_emb = np.zeros(AUDIO_DIM, dtype=np.float32)  # placeholder
+        audio_emb = np.zeros(AUDIO_DIM, dtype=np.float32)
+        if audio_output is not None:
+            arr = np.asarray(audio_output, dtype=np.float32).flatten()[:AUDIO_DIM]
+            audio_emb[:arr.size] = arr
         vad = np.zeros(VAD_DIM, dtype=np.float32)  # placeholder
 
         vec = np.concatenate([text_emb, audio_emb, vad]).astype(np.float32)
@@ -105,6 +135,8 @@ class SongStore:
         skipped = 0
         encoded_failures = 0
 
+        pending = []  # (spotify_id, title, artists, genres, text_desc, track)
+        pending_ids = set()
         for i, t in enumerate(tracks):
             # Spotify_id extraction
             spotify_id = (
@@ -117,7 +149,7 @@ class SongStore:
                 print(f"[SongStore] SKIP#{i}: missing spotify_id -> item={t}")
                 skipped += 1
                 continue
-            if spotify_id in self.seen_ids:
+            if spotify_id in self.seen_ids or spotify_id in pending_ids:
                 continue
 
             # Normalize artists list: accept both list of names or list of objects
@@ -138,18 +170,47 @@ class SongStore:
                 mood_line = ""
 
             text_desc = f"Song '{title}' by {', '.join(artists)}. Genres: {', '.join(genres)}.{mood_line}"
-
-            # Encode text with CLAP
+            pending.append((spotify_id, title, artists, genres, text_desc, t))
+            pending_ids.add(spotify_id)
+
+        # Text embeddings: shared cache first, CLAP only for text never seen
+        texts = [p[4] for p in pending]
+        version = self.encoder_version if self.embed_cache is not None else None
+        text_outs = self.embed_cache.get_many(version, texts) if version else [None] * len(texts)
+        misses = [j for j, out in enumerate(text_outs) if out is None]
+        fresh_texts, fresh_outs = [], []
+        for b in range(0, len(misses), ENCODE_BATCH):
+            batch = misses[b:b + ENCODE_BATCH]
             try:
-                text_out = self.clap.encode_text(text_desc)
+                outs = self.clap.encode_texts([texts[j] for j in batch])
             except Exception as e:
-                print(f"[SongStore] CLAP encode EXCEPTION for {spotify_id}: {e}")
-                encoded_failures += 1
+                # one bad text should not cost the whole batch: retry one by one
+                print(f"[SongStore] CLAP batch encode failed ({e}); encoding {len(batch)} texts singly")
+                outs = []
+                for j in batch:
+                    try:
+                        outs.append(self.clap.encode_text(texts[j]))
+                    except Exception as e:
+                        print(f"[SongStore] CLAP encode EXCEPTION for {pending[j][0]}: {e}")
+                        encoded_failures += 1
+                        outs.append(None)
+            for j, out in zip(batch, outs):
+                if out is None:
+                    continue
+                text_outs[j] = out
+                fresh_texts.append(texts[j])
+                fresh_outs.append(out)
+        if version and fresh_texts:
+            self.embed_cache.put_many(version, fresh_texts, fresh_outs)
+        if pending:
+            print(f"[SongStore] Text embeddings: {len(pending) - len(fresh_texts) - encoded_failures} cached, {len(fresh_texts)} encoded")
+
+        for (spotify_id, title, artists, genres, _, t), text_out in zip(pending, text_outs):
+            if text_out is None:
                 continue
-
-            vec = self._make_song_vector(text_out)
+            vec = self._make_song_vector(text_out, t.get("audio_embedding"))
             if vec is None:
-                print(f"[SongStore] SKIP#{i}: failed to parse embedding for {spotify_id} (raw size unknown)")
+                print(f"[SongStore] SKIP: failed to parse embedding for {spotify_id} (raw size unknown)")
                 encoded_failures += 1
                 continue
 
@@ -159,7 +220,8 @@ class SongStore:
                 "title": title,
                 "artists": artists,
                 "genres": genres,
-                "source": "spotify",
+                "source": t.get("source") or "spotify",
+                "encoder": self.encoder_version,
             })
             self.seen_ids.add(spotify_id)
 
@@ -194,35 +256,59 @@ class SongStore:
             self.vectors = np.vstack([self.vectors, new_vecs])
             self.metadata.extend(new_meta)
 
-        # persist
+        self._persist()
+
+        added = len(new_vecs)
+        print(f"[SongStore] Added {added} new vectors (skipped={skipped}, encode_failures={encoded_failures})")
+        return added
+
+    def remove_tracks(self, spotify_ids) -> int:
+        """Drop tracks by id (e.g. local files whose content changed). Returns tracks removed."""
+        drop = set(spotify_ids) & self.seen_ids
+        if not drop or self.vectors is None:
+            return 0
+        keep = [i for i, m in enumerate(self.metadata) if (m.get("spotify_id") or m.get("id")) not in drop]
+        removed = len(self.metadata) - len(keep)
+        self.vectors = self.vectors[keep]
+        self.metadata = [self.metadata[i] for i in keep]
+        self.seen_ids -= drop
+        self._persist()
+        print(f"[SongStore] Removed {removed} vectors")
+        return removed
+
+    def _persist(self):
+        """Write vectors + metadata and rebuild the FAISS index."""
         np.save(self.vectors_path, self.vectors)
         with open(self.meta_path, "w", encoding="utf-8") as f:
             json.dump(self.metadata, f, indent=2, ensure_ascii=False)
 
-        # rebuild faiss
+        if self.vectors.shape[0] == 0:
+            self.index = None
+            if os.path.exists(self.index_path):
+                os.remove(self.index_path)
+            return
         self._build_faiss()
 
-        added = len(new_vecs)
-        print(f"[SongStore] Added {added} new vectors (skipped={skipped}, encode_failures={encoded_failures})")
-        return added
-
-    # Optional: build from local audio files (simple placeholder)
-    def build_from_local(self, audio_dir: str):
+    # Build from local audio files
+    def build_from_local(self, audio_dir: str, **ingest_kwargs):
         """
-        Simple helper that looks for audio files and encodes filenames + metadata to text vectors.
-        This is a lightweight fallback (not high quality audio encoding).
+        Index a local audio library. With an audio-capable encoder, files are
+        decoded in a process pool and embedded with CLAP audio (see
+        app/utils/audio_ingest.py; re-runs skip unchanged files). Otherwise
+        only file names are encoded as text (lightweight fallback).
         """
         if not os.path.exists(audio_dir):
             raise FileNotFoundError(f"Audio dir not found: {audio_dir}")
 
-        files = []
-        for root, _, filenames in os.walk(audio_dir):
-            for fn in filenames:
-                if fn.lower().endswith((".mp3", ".wav", ".flac", ".m4a")):
-                    files.append(os.path.join(root, fn))
+        if getattr(self.clap, "supports_audio", False):
+            from app.utils.audio_ingest import ingest
+            return ingest(self, audio_dir, **ingest_kwargs)
+
+        print("[SongStore] Encoder has no audio tower; indexing file names only")
+        from app.utils.audio_ingest import find_audio_files
 
         tracks = []
-        for p in files:
+        for p in find_audio_files(audio_dir):
             title = os.path.splitext(os.path.basename(p))[0]
             tracks.append({
                 "spotify_id": f"local::{title}",
@@ -252,6 +338,16 @@ class SongStore:
         faiss.write_index(index, self.index_path)
         print(f"[SongStore] FAISS index built with {self.vectors.shape[0]} vectors (dim={self.dim})")
 
+    def memory_bytes(self) -> int:
+        """Approximate resident size: vectors + flat index copy + metadata."""
+        n = 0
+        if self.vectors is not None:
+            n += self.vectors.nbytes
+        if self.index is not None:
+            n += self.index.ntotal * self.dim * 4
+        n += 512 * len(self.metadata)
+        return n
+
     def load_index(self):
         # load metadata if exists
         if os.path.exists(self.meta_path):
@@ -261,6 +357,7 @@ class SongStore:
                 sid = m.get("spotify_id") or m.get("id")
                 if sid:
                     self.seen_ids.add(sid)
+            self._check_encoders()
 
         # load vectors if exists
         if os.path.exists(self.vectors_path):
@@ -293,6 +390,9 @@ class SongStore:
         D, I = self.index.search(q, k)
         results = []
         for score, idx in zip(D[0], I[0]):
+            if idx < 0:
+                # fewer than k vectors in the index
+                continue
             meta = self.metadata[idx].copy()
             meta["score"] = float(score)
             meta["idx"] = int(idx)
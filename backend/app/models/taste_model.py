@@ -0,0 +1,261 @@
+# app/models/taste_model.py
+import os
+import re
+import json
+import math
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from app.utils import metrics
+from app.utils.genre_index import normalize_genre
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+TASTE_DIR = os.getenv("SHIKISAI_TASTE_DIR", os.path.join(BACKEND_DIR, "data", "taste"))
+TASTE_HALF_LIFE_DAYS = float(os.getenv("SHIKISAI_TASTE_HALF_LIFE_DAYS", "30"))
+TASTE_REFRESH_SECONDS = float(os.getenv("SHIKISAI_TASTE_REFRESH_SECONDS", "60"))
+TASTE_MAX_GENRES = int(os.getenv("SHIKISAI_TASTE_MAX_GENRES", "100"))
+TASTE_MAX_USERS = int(os.getenv("SHIKISAI_TASTE_MAX_USERS", "4096"))
+TOP_TRACK_WEIGHT = 0.5  # a top track seeds the profile like half a play
+
+FEATURES = ("valence", "energy", "acousticness", "danceability", "tempo")
+
+REFRESH_PLAYS = metrics.REGISTRY.histogram(
+    "shikisai_taste_refresh_plays",
+    "New plays folded into a taste profile per refresh.",
+    buckets=(0, 1, 5, 10, 25, 50, 100, 200),
+)
+
+
+def _safe_user_file(user_id: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_-]", "_", user_id) + ".json"
+
+
+class TasteState:
+    """
+    Running aggregates of one user's listening, decayed with a half-life.
+
+    All sums are expressed at ref_ms: adding a play at time t first scales
+    everything by 0.5 ** ((t - ref_ms) / half_life), so recent plays count
+    more and nothing older has to be kept. Means are ratios of sums and are
+    unaffected by the decay of the common reference.
+    """
+
+    def __init__(self, data: Optional[Dict] = None):
+        data = data or {}
+        self.ref_ms: int = data.get("ref_ms", 0)
+        self.cursor_ms: Optional[int] = data.get("cursor_ms")
+        self.weight: float = data.get("weight", 0.0)
+        self.feature_sums: Dict[str, float] = data.get("feature_sums", {})
+        self.feature_weights: Dict[str, float] = data.get("feature_weights", {})
+        self.genres: Dict[str, float] = data.get("genres", {})
+        self.plays: int = data.get("plays", 0)
+        self.refreshed_at: float = 0.0  # not persisted: refresh again after a restart
+
+    def to_dict(self) -> Dict:
+        return {
+            "ref_ms": self.ref_ms,
+            "cursor_ms": self.cursor_ms,
+            "weight": self.weight,
+            "feature_sums": self.feature_sums,
+            "feature_weights": self.feature_weights,
+            "genres": self.genres,
+            "plays": self.plays,
+        }
+
+    def _decay_to(self, t_ms: int, half_life_ms: float):
+        if t_ms <= self.ref_ms:
+            return
+        if self.ref_ms:
+            f = 0.5 ** ((t_ms - self.ref_ms) / half_life_ms)
+            self.weight *= f
+            for d in (self.feature_sums, self.feature_weights, self.genres):
+                for k in d:
+                    d[k] *= f
+        self.ref_ms = t_ms
+
+    def add(self, t_ms: int, features: Optional[Dict], genres: List[str], half_life_ms: float,
+            w: float = 1.0, is_play: bool = True):
+        """Fold in one track at t_ms (tracks older than ref_ms are discounted accordingly)."""
+        self._decay_to(t_ms, half_life_ms)
+        w *= 0.5 ** ((self.ref_ms - t_ms) / half_life_ms)
+        self.weight += w
+        self.plays += int(is_play)
+        for k in FEATURES:
+            val = (features or {}).get(k)
+            if val is not None and not (isinstance(val, float) and math.isnan(val)):
+                self.feature_sums[k] = self.feature_sums.get(k, 0.0) + w * float(val)
+                self.feature_weights[k] = self.feature_weights.get(k, 0.0) + w
+        for g in set(normalize_genre(g) for g in genres if g):
+            self.genres[g] = self.genres.get(g, 0.0) + w
+
+        if len(self.genres) > 2 * TASTE_MAX_GENRES:
+            keep = sorted(self.genres.items(), key=lambda kv: -kv[1])[:TASTE_MAX_GENRES]
+            self.genres = dict(keep)
+
+    def profile(self, now_ms: int, half_life_ms: float) -> Optional[Dict]:
+        """Same shape as SpotifyFetcher.get_user_taste_profile, plus genre counts."""
+        if self.weight <= 0:
+            return None
+        f = 0.5 ** (max(0, now_ms - self.ref_ms) / half_life_ms)
+        out = {
+            k: (self.feature_sums[k] / self.feature_weights[k]) if self.feature_weights.get(k) else None
+            for k in FEATURES
+        }
+        top = sorted(self.genres.items(), key=lambda kv: -kv[1])
+        out["genre_counts"] = {g: c * f for g, c in top[:TASTE_MAX_GENRES]}
+        out["top_genres"] = [g for g, _ in top[:5]]
+        out["plays"] = self.plays
+        out["weight"] = self.weight * f
+        return out
+
+
+class TasteModel:
+    """
+    Incrementally updated taste profiles.
+
+    The first refresh for a user seeds the state from their top tracks and
+    last 50 plays; later refreshes fetch only plays after the stored
+    recently-played cursor, at most once per refresh_seconds. Track features
+    and genres come from the catalog snapshot when the track is in it, so
+    Spotify is only asked about artists and audio features of unknown
+    tracks. States live in an LRU and in data_dir/<user>.json.
+    """
+
+    def __init__(self, fetcher, catalog: Callable, data_dir: str = TASTE_DIR,
+                 half_life_days: float = TASTE_HALF_LIFE_DAYS, refresh_seconds: float = TASTE_REFRESH_SECONDS,
+                 max_users: int = TASTE_MAX_USERS):
+        self.fetcher = fetcher
+        self.catalog = catalog
+        self.data_dir = data_dir
+        self.half_life_ms = half_life_days * 86400 * 1000
+        self.refresh_seconds = refresh_seconds
+        self.max_users = max_users
+        self._states: "OrderedDict[str, TasteState]" = OrderedDict()
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._artist_genres: "OrderedDict[str, List[str]]" = OrderedDict()
+
+    # State storage
+    def _path(self, user_id: str) -> str:
+        return os.path.join(self.data_dir, _safe_user_file(user_id))
+
+    def _user_lock(self, user_id: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(user_id, threading.Lock())
+
+    def state(self, user_id: str) -> TasteState:
+        with self._lock:
+            st = self._states.get(user_id)
+            if st is not None:
+                self._states.move_to_end(user_id)
+                return st
+        st = TasteState()
+        path = self._path(user_id)
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    st = TasteState(json.load(f))
+            except Exception as e:
+                print(f"[TasteModel] Unreadable state for {user_id}, starting over:", e)
+        with self._lock:
+            st = self._states.setdefault(user_id, st)
+            while len(self._states) > self.max_users:
+                uid, _ = self._states.popitem(last=False)
+                self._locks.pop(uid, None)
+        return st
+
+    def _save(self, user_id: str, st: TasteState):
+        os.makedirs(self.data_dir, exist_ok=True)  # first save, not import time
+        path = self._path(user_id)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(st.to_dict(), f)
+        os.replace(tmp, path)
+
+    # Track facts
+    def _track_facts(self, token, refresh_token, tracks: List[Dict]) -> Dict[str, tuple]:
+        """{track_id: (features, genres)} from the catalog, then Spotify for the rest."""
+        facts = {}
+        snap = self.catalog()
+        ids = [t["id"] for t in tracks]
+        if snap is not None and ids:
+            df = snap.df
+            rows = snap.metadata.rows_for_ids(ids)
+            cols = [c for c in FEATURES if c in df.columns]
+            sub = df.iloc[rows]
+            for row, tid, genres in zip(rows, sub["id"].astype(str), sub["genres"]):
+                feats = {c: df[c].iat[row] for c in cols}
+                facts[tid] = (feats, list(genres or []))
+
+        missing = [t for t in tracks if t["id"] not in facts]
+        if missing:
+            artist_ids = [a for t in missing for a in t["artist_ids"] if a not in self._artist_genres]
+            if artist_ids:
+                try:
+                    found = self.fetcher.get_artist_genres(token, refresh_token, artist_ids)
+                except Exception as e:
+                    print("[TasteModel] artist genres fetch failed:", e)
+                    found = {}
+                for aid in artist_ids:
+                    self._artist_genres[aid] = found.get(aid, [])
+                while len(self._artist_genres) > 50000:
+                    self._artist_genres.popitem(last=False)
+            feats = self.fetcher.get_audio_features(token, refresh_token, [t["id"] for t in missing])
+            for t in missing:
+                genres = [g for a in t["artist_ids"] for g in self._artist_genres.get(a, [])]
+                facts[t["id"]] = (feats.get(t["id"]), genres)
+        return facts
+
+    # Refresh + read
+    def refresh(self, user_id: str, token: str, refresh_token: Optional[str] = None, force: bool = False) -> TasteState:
+        st = self.state(user_id)
+        with self._user_lock(user_id):
+            if not force and time.time() - st.refreshed_at < self.refresh_seconds:
+                return st
+            st.refreshed_at = time.time()
+
+            seed = []
+            if st.cursor_ms is None:
+                try:
+                    for t in self.fetcher.get_top_tracks(token, refresh_token):
+                        if t.get("id"):
+                            seed.append({"id": t["id"], "artist_ids": [a.get("id") for a in t.get("artists", []) if a.get("id")]})
+                except Exception as e:
+                    print("[TasteModel] top tracks fetch failed:", e)
+
+            try:
+                plays = self.fetcher.get_recently_played_since(token, refresh_token, after_ms=st.cursor_ms)
+            except Exception as e:
+                print("[TasteModel] recently played fetch failed:", e)
+                return st
+
+            REFRESH_PLAYS.observe(len(plays))
+            if not plays and not seed:
+                return st
+
+            facts = self._track_facts(token, refresh_token, seed + plays)
+            now_ms = int(time.time() * 1000)
+            for t in seed:
+                feats, genres = facts.get(t["id"], (None, []))
+                st.add(now_ms, feats, genres, self.half_life_ms, w=TOP_TRACK_WEIGHT, is_play=False)
+            for p in plays:
+                feats, genres = facts.get(p["id"], (None, []))
+                st.add(p["played_at_ms"], feats, genres, self.half_life_ms)
+            if plays:
+                st.cursor_ms = max(st.cursor_ms or 0, plays[-1]["played_at_ms"])
+            elif st.cursor_ms is None:
+                st.cursor_ms = now_ms
+
+            try:
+                self._save(user_id, st)
+            except OSError as e:
+                print(f"[TasteModel] Could not save state for {user_id}:", e)
+            print(f"[TasteModel] {user_id}: +{len(plays)} plays (+{len(seed)} top seeds), {st.plays} total")
+        return st
+
+    def profile(self, user_id: str, token: str, refresh_token: Optional[str] = None) -> Optional[Dict]:
+        """Refresh if due, then return the decayed taste profile (None without any plays)."""
+        st = self.refresh(user_id, token, refresh_token)
+        return st.profile(int(time.time() * 1000), self.half_life_ms)
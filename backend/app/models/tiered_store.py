@@ -0,0 +1,152 @@
+# app/models/tiered_store.py
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.models.song_store import SongStore
+from app.models.embedding_cache import open_cache
+from app.utils import metrics
+
+USER_INDEX_BUDGET_MB = float(os.getenv("SHIKISAI_USER_INDEX_BUDGET_MB", "256"))
+
+
+def _safe_user_dir(user_id: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_-]", "_", user_id)
+
+
+class TieredSongStore:
+    """
+    Shared read-only base SongStore plus small per-user delta SongStores.
+
+    - The base lives in data_dir (faiss.index / song_vectors.npy / song_metadata.json)
+      and is never written by user builds.
+    - Each user's delta lives in data_dir/users/<user_id>/ with the same layout.
+    - Deltas are kept in an LRU under a memory budget and reloaded from disk
+      on demand; search() queries the base and the caller's delta and merges.
+    """
+
+    def __init__(self, clap, data_dir: str = "data", budget_mb: float = USER_INDEX_BUDGET_MB):
+        self.clap = clap
+        self.data_dir = data_dir
+        self.users_dir = os.path.join(data_dir, "users")
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+
+        # one text-embedding cache for the base and every user delta
+        self.embed_cache = open_cache(data_dir)
+        self.base = SongStore(clap=clap, data_dir=data_dir, embed_cache=self.embed_cache)
+        self._users: "OrderedDict[str, SongStore]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = metrics.REGISTRY.cache("user_index")
+
+    # Compatibility with single-store callers
+    @property
+    def index(self):
+        return self.base.index
+
+    @property
+    def metadata(self):
+        return self.base.metadata
+
+    @property
+    def vectors(self):
+        return self.base.vectors
+
+    def load_index(self):
+        self.base.load_index()
+
+    # Per-user deltas
+    def _user_path(self, user_id: str) -> str:
+        return os.path.join(self.users_dir, _safe_user_dir(user_id))
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return sum(s.memory_bytes() for s in self._users.values())
+
+    def resident_users(self) -> int:
+        return len(self._users)
+
+    def _evict(self, keep: str):
+        total = sum(s.memory_bytes() for s in self._users.values())
+        for uid in list(self._users.keys()):
+            if total <= self.budget_bytes:
+                break
+            if uid == keep:
+                continue
+            total -= self._users.pop(uid).memory_bytes()
+            print(f"[TieredSongStore] Evicted user index {uid}")
+
+    def user_store(self, user_id: str, create: bool = False) -> Optional[SongStore]:
+        """
+        Return the user's delta store (LRU touch), loading it from disk if
+        needed. Returns None if the user has no delta and create is False.
+        """
+        with self._lock:
+            store = self._users.get(user_id)
+            if store is not None:
+                self._users.move_to_end(user_id)
+                self._stats.hit()
+                return store
+
+        path = self._user_path(user_id)
+        if not create and not os.path.exists(path):
+            return None
+
+        self._stats.miss()
+        store = SongStore(clap=self.clap, data_dir=path, embed_cache=self.embed_cache)
+        try:
+            store.load_index()
+        except Exception as e:
+            print(f"[TieredSongStore] Failed to load user index {user_id}:", e)
+
+        with self._lock:
+            # another request may have loaded it meanwhile
+            existing = self._users.get(user_id)
+            if existing is not None:
+                self._users.move_to_end(user_id)
+                return existing
+            self._users[user_id] = store
+            self._evict(keep=user_id)
+        return store
+
+    def add_user_tracks(self, user_id: str, tracks: List[Dict], color_hex: Optional[str] = None) -> int:
+        """Index tracks into the user's delta, skipping anything already in the base."""
+        base_ids = self.base.seen_ids
+        fresh = [
+            t for t in tracks
+            if (t.get("spotify_id") or t.get("id")) not in base_ids
+        ]
+        store = self.user_store(user_id, create=True)
+        n_added = store.add_spotify_tracks(fresh, color_hex=color_hex)
+        with self._lock:
+            if user_id in self._users:
+                self._evict(keep=user_id)
+        return n_added
+
+    # Search
+    def search(self, query_vector: np.ndarray, k: int = 10, user_id: Optional[str] = None) -> List[Dict]:
+        """
+        Top-k over the base plus the user's delta (if any), merged by score.
+        Each result carries "tier": "base" or "user".
+        """
+        results = []
+        if self.base.index is not None:
+            for r in self.base.search(query_vector, k=k):
+                r["tier"] = "base"
+                results.append(r)
+
+        if user_id:
+            store = self.user_store(user_id)
+            if store is not None and store.index is not None:
+                for r in store.search(query_vector, k=k):
+                    r["tier"] = "user"
+                    results.append(r)
+
+        if not results and self.base.index is None:
+            raise RuntimeError("Index not loaded.")
+
+        results.sort(key=lambda r: r["score"], reverse=True)
+        return results[:k]
@@ -0,0 +1,188 @@
+# app/utils/admission.py
+"""
+Deadlines, admission control and tier selection for /recommend.
+
+Every request gets a time budget. Heavy work (CLAP encoding + scoring)
+runs under a bounded number of slots with a bounded wait queue; a request
+that cannot get a slot in time, or whose remaining budget is too small for
+the full pipeline, is served by a cheaper tier instead of queueing until
+it times out:
+
+  full        taste fetch + encode + rank (reduced-embedding coarse pass as configured)
+  no_taste    skip the Spotify calls (taste profile, recently played)
+  coarse      reduced-embedding ranking with a small exact rerank
+  cached      a recent generic ranking of the same color
+  precomputed the color's intent pool ranked by static score (no encoder)
+
+Stage costs are tracked as moving averages of the observed durations.
+The first run of each stage (cold caches, connection setup) is not
+counted, and an estimate decays back toward its default while the stage
+is not observed. A tier skipped because of one slow run is therefore
+tried again and re-measured, instead of being skipped forever.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from app.utils import metrics
+
+RECOMMEND_DEADLINE_MS = float(os.getenv("SHIKISAI_RECOMMEND_DEADLINE_MS", "1000"))
+ADMIT_CONCURRENCY = int(os.getenv("SHIKISAI_ADMIT_CONCURRENCY", str(os.cpu_count() or 1)))
+ADMIT_QUEUE = int(os.getenv("SHIKISAI_ADMIT_QUEUE", str(4 * ADMIT_CONCURRENCY)))
+ESTIMATE_HALF_LIFE_S = float(os.getenv("SHIKISAI_ADMIT_ESTIMATE_HALF_LIFE_S", "30"))
+TIER_SAFETY = 1.5  # stage estimates are averages; keep headroom for the tail
+
+TIERS = ("full", "no_taste", "coarse", "cached", "precomputed")
+
+# starting guesses (seconds) until stages have been observed
+DEFAULT_STAGE_SECONDS = {
+    "encode": 0.15,
+    "taste": 0.3,
+    "recent": 0.2,
+    "rank": 0.05,
+    "rank_coarse": 0.02,
+    "journey_encode": 0.4,  # /journey: up to JOURNEY_MAX_STOPS prompts in one batch
+}
+
+TIER_TOTAL = metrics.REGISTRY.counter(
+    "shikisai_recommend_tier_total",
+    "Recommendations served per degradation tier.",
+    labelnames=("tier",),
+)
+SHED_TOTAL = metrics.REGISTRY.counter(
+    "shikisai_recommend_shed_total",
+    "Requests rejected because their deadline had passed before any work.",
+)
+QUEUE_WAIT = metrics.REGISTRY.histogram(
+    "shikisai_admission_wait_seconds",
+    "Time spent waiting for a heavy-work slot.",
+)
+
+
+class Deadline:
+    def __init__(self, budget_s: float, start: Optional[float] = None):
+        self.start = time.monotonic() if start is None else start
+        self.at = self.start + budget_s
+
+    def remaining(self) -> float:
+        return self.at - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+class AdmissionController:
+    """
+    Bounded concurrency for heavy work with a bounded queue in front of it.
+    A request that finds the queue full, or cannot get a slot before its
+    deadline minus the work it still needs, is not admitted.
+    """
+
+    def __init__(self, concurrency: int = ADMIT_CONCURRENCY, max_queue: int = ADMIT_QUEUE, alpha: float = 0.2,
+                 half_life_s: float = ESTIMATE_HALF_LIFE_S):
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max_queue
+        self.alpha = alpha
+        self.half_life_s = half_life_s
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._active = 0
+        self._estimates: Dict[str, float] = dict(DEFAULT_STAGE_SECONDS)
+        self._observed_at: Dict[str, float] = {}
+        self._warm: set = set()
+
+        metrics.REGISTRY.gauge(
+            "shikisai_admission_queue",
+            "Requests waiting for / holding a heavy-work slot.",
+            labelnames=("state",),
+            fn=lambda: {("waiting",): self._waiting, ("active",): self._active},
+        )
+
+    # Stage cost estimates
+    def _current(self, stage: str, now: float) -> Optional[float]:
+        """The stage's estimate, decayed toward its default for the time since it was last observed."""
+        est = self._estimates.get(stage)
+        default = DEFAULT_STAGE_SECONDS.get(stage)
+        at = self._observed_at.get(stage)
+        if est is None or default is None or at is None or self.half_life_s <= 0:
+            return est
+        return default + (est - default) * 0.5 ** ((now - at) / self.half_life_s)
+
+    def estimate(self, *stages: str) -> float:
+        now = time.monotonic()
+        return sum(self._current(s, now) or 0.0 for s in stages)
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            if stage not in self._warm:
+                self._warm.add(stage)  # first run is warm-up, not a cost sample
+                return
+            now = time.monotonic()
+            prev = self._current(stage, now)
+            self._estimates[stage] = seconds if prev is None else prev + self.alpha * (seconds - prev)
+            self._observed_at[stage] = now
+
+    @contextmanager
+    def stage(self, name: str):
+        """metrics.stage that also feeds the cost estimate of `name`."""
+        t0 = time.perf_counter()
+        with metrics.stage(name):
+            yield
+        self.observe(name, time.perf_counter() - t0)
+
+    # Tiers
+    def affordable(self, deadline: Deadline, *stages: str) -> bool:
+        return deadline.remaining() >= TIER_SAFETY * self.estimate(*stages)
+
+    def choose_tier(self, deadline: Deadline, wants_taste: bool) -> str:
+        """Most complete tier whose estimated cost fits the remaining budget."""
+        if wants_taste and self.affordable(deadline, "taste", "recent", "encode", "rank"):
+            return "full"
+        if self.affordable(deadline, "encode", "rank"):
+            return "no_taste" if wants_taste else "full"
+        if self.affordable(deadline, "encode", "rank_coarse"):
+            return "coarse"
+        return "cached"
+
+    # Admission
+    @contextmanager
+    def admit(self, deadline: Deadline, reserve: float = 0.0):
+        """
+        Yields True while holding a heavy-work slot, False if none could be
+        had (queue full, or no slot before deadline - reserve).
+        """
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                full = True
+            else:
+                full = False
+                self._waiting += 1
+        if full:
+            yield False
+            return
+
+        t0 = time.monotonic()
+        try:
+            ok = self._slots.acquire(timeout=max(0.0, deadline.remaining() - reserve))
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        QUEUE_WAIT.observe(time.monotonic() - t0)
+        if not ok:
+            yield False
+            return
+
+        with self._lock:
+            self._active += 1
+        try:
+            yield True
+        finally:
+            with self._lock:
+                self._active -= 1
+            self._slots.release()
+
+
+ADMISSION = AdmissionController()
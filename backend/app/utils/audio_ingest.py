@@ -0,0 +1,245 @@
+# app/utils/audio_ingest.py
+"""
+Local audio library -> CLAP audio embeddings for SongStore.
+
+Files are decoded and resampled in a process pool (one file per task, a
+bounded number of tasks in flight). Only a few fixed-length windows spread
+over each track are read, so memory per task is window_seconds * windows
+samples regardless of track length. The encoder embeds windows in batches;
+a track's audio embedding is the normalized mean of its windows.
+
+A JSON manifest keyed by path records size, mtime and sha256 of every
+processed file: unchanged files are skipped without decoding, and a file
+whose content was already embedded under another path is not re-embedded.
+"""
+import os
+import json
+import time
+import hashlib
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".flac", ".m4a", ".ogg")
+SAMPLE_RATE = 48000  # CLAP's audio front end
+WINDOW_SECONDS = float(os.getenv("SHIKISAI_AUDIO_WINDOW_SECONDS", "10"))
+MAX_WINDOWS = int(os.getenv("SHIKISAI_AUDIO_MAX_WINDOWS", "3"))
+INGEST_WORKERS = int(os.getenv("SHIKISAI_AUDIO_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+AUDIO_BATCH = int(os.getenv("SHIKISAI_AUDIO_BATCH", "16"))
+
+
+def find_audio_files(audio_dir: str) -> List[str]:
+    files = []
+    for root, _, filenames in os.walk(audio_dir):
+        for fn in filenames:
+            if fn.lower().endswith(AUDIO_EXTENSIONS):
+                files.append(os.path.join(root, fn))
+    return sorted(files)
+
+
+def file_digest(path: str, chunk: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def window_offsets(duration: float, window_seconds: float, max_windows: int) -> List[float]:
+    """Start times of up to max_windows windows spread evenly over the track."""
+    if duration <= window_seconds or max_windows <= 1:
+        return [max(0.0, (duration - window_seconds) / 2)]
+    span = duration - window_seconds
+    n = min(max_windows, int(duration // window_seconds))
+    return [span * (i + 1) / (n + 1) for i in range(n)]
+
+
+def decode_windows(path: str, sr: int = SAMPLE_RATE, window_seconds: float = WINDOW_SECONDS,
+                   max_windows: int = MAX_WINDOWS) -> np.ndarray:
+    """(n_windows, sr * window_seconds) mono float32 windows, zero-padded at the end."""
+    import librosa
+
+    length = int(sr * window_seconds)
+    duration = librosa.get_duration(path=path)
+    windows = []
+    for offset in window_offsets(duration, window_seconds, max_windows):
+        y, _ = librosa.load(path, sr=sr, mono=True, offset=offset, duration=window_seconds, res_type="soxr_hq")
+        w = np.zeros(length, dtype=np.float32)
+        w[:min(length, len(y))] = y[:length]
+        windows.append(w)
+    return np.stack(windows)
+
+
+def _decode_job(path: str, sr: int, window_seconds: float, max_windows: int):
+    """Process-pool task: (path, digest, windows or None, error or None)."""
+    try:
+        digest = file_digest(path)
+        return path, digest, decode_windows(path, sr, window_seconds, max_windows), None
+    except Exception as e:
+        return path, None, None, f"{type(e).__name__}: {e}"
+
+
+class AudioManifest:
+    """{path: {"size", "mtime", "sha256", "spotify_id"}} persisted as JSON."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        self.by_digest = {e["sha256"]: e for e in self.entries.values() if e.get("sha256")}
+
+    def unchanged(self, file_path: str) -> bool:
+        e = self.entries.get(file_path)
+        if e is None:
+            return False
+        st = os.stat(file_path)
+        return e.get("size") == st.st_size and e.get("mtime") == st.st_mtime
+
+    def record(self, file_path: str, digest: str, spotify_id: str) -> Optional[str]:
+        """
+        Point file_path at digest. Returns the id the path pointed at before
+        when its content changed (edited in place), else None.
+        """
+        st = os.stat(file_path)
+        entry = {"size": st.st_size, "mtime": st.st_mtime, "sha256": digest, "spotify_id": spotify_id}
+        old = self.entries.get(file_path)
+        self.entries[file_path] = entry
+        self.by_digest[digest] = entry
+        if old is None or old.get("sha256") == digest:
+            return None
+        if old.get("sha256") and not any(e.get("sha256") == old["sha256"] for e in self.entries.values()):
+            self.by_digest.pop(old["sha256"], None)
+        return old.get("spotify_id")
+
+    def live_ids(self) -> set:
+        return {e.get("spotify_id") for e in self.entries.values()}
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp, self.path)
+
+
+def decoded_files(files: List[str], workers: int = INGEST_WORKERS, sr: int = SAMPLE_RATE,
+                  window_seconds: float = WINDOW_SECONDS, max_windows: int = MAX_WINDOWS) -> Iterator[Tuple]:
+    """Yield _decode_job results in input order, with at most 2 * workers files in flight."""
+    if workers <= 1:
+        for p in files:
+            yield _decode_job(p, sr, window_seconds, max_windows)
+        return
+
+    ctx = multiprocessing.get_context("spawn")  # no forked copies of the encoder / FAISS
+    with ProcessPoolExecutor(workers, mp_context=ctx) as pool:
+        pending = deque()
+        it = iter(files)
+        for p in it:
+            pending.append(pool.submit(_decode_job, p, sr, window_seconds, max_windows))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            yield pending.popleft().result()
+            nxt = next(it, None)
+            if nxt is not None:
+                pending.append(pool.submit(_decode_job, nxt, sr, window_seconds, max_windows))
+
+
+def ingest(store, audio_dir: str, manifest_path: Optional[str] = None, workers: int = INGEST_WORKERS,
+           batch_size: int = AUDIO_BATCH, flush_every: int = 1000, window_seconds: float = WINDOW_SECONDS,
+           max_windows: int = MAX_WINDOWS) -> int:
+    """
+    Embed every new or changed audio file under audio_dir and add it to the
+    store (text description + audio embedding). A file edited in place gets
+    a new id; its old vector is removed. Returns tracks added.
+    """
+    encoder = store.clap
+    manifest = AudioManifest(manifest_path or os.path.join(os.path.dirname(store.meta_path), "audio_manifest.json"))
+
+    files = [p for p in find_audio_files(audio_dir) if not manifest.unchanged(p)]
+    print(f"[AudioIngest] {len(files)} new or changed files under {audio_dir}")
+    if not files:
+        return 0
+
+    added = 0
+    replaced = set()  # ids of files edited in place; dropped once no path points at them
+    pending: Dict[str, Dict] = {}  # digest -> track not flushed yet (in batch or tracks)
+    tracks: List[Dict] = []  # fully embedded, waiting to be flushed to the store
+    batch: List[Tuple[Dict, np.ndarray]] = []  # (track, window) not embedded yet
+    t0 = time.time()
+
+    def run_batch():
+        if not batch:
+            return
+        emb = np.asarray(encoder.encode_audio_batch([w for _, w in batch]), dtype=np.float32)
+        for (t, _), e in zip(batch, emb):
+            t["_windows"].append(e)
+            if len(t["_windows"]) == t["_n_windows"]:
+                mean = np.mean(t.pop("_windows"), axis=0)
+                t["audio_embedding"] = mean / (np.linalg.norm(mean) + 1e-9)
+                tracks.append(t)
+        batch.clear()
+
+    def flush():
+        nonlocal added
+        run_batch()
+        if tracks:
+            added += store.add_spotify_tracks(list(tracks))
+            for t in tracks:
+                for path in [t["_path"]] + t["_copies"]:
+                    replaced.add(manifest.record(path, t["_sha256"], t["spotify_id"]))
+            tracks.clear()
+        pending.clear()
+        stale = replaced - manifest.live_ids() - {None}
+        if stale:
+            store.remove_tracks(stale)
+        replaced.clear()
+        manifest.save()
+
+    for n, (path, digest, windows, error) in enumerate(
+        decoded_files(files, workers, SAMPLE_RATE, window_seconds, max_windows), 1
+    ):
+        if error:
+            print(f"[AudioIngest] SKIP {path}: {error}")
+            continue
+
+        known = manifest.by_digest.get(digest)
+        if known is not None and known.get("spotify_id") in store.seen_ids:
+            # same content already embedded (renamed / copied file)
+            replaced.add(manifest.record(path, digest, known["spotify_id"]))
+            continue
+        if digest in pending:
+            # same content as a file still waiting for its embedding
+            pending[digest]["_copies"].append(path)
+            continue
+
+        title = os.path.splitext(os.path.basename(path))[0]
+        track = {
+            "spotify_id": f"local::{digest[:16]}",
+            "title": title,
+            "artists": ["local"],
+            "artist_genres": ["local"],
+            "source": "local",
+            "_path": path,
+            "_sha256": digest,
+            "_copies": [],
+            "_windows": [],
+            "_n_windows": len(windows),
+        }
+        pending[digest] = track
+        for w in windows:
+            batch.append((track, w))
+            if len(batch) >= batch_size:
+                run_batch()
+
+        if n % flush_every == 0:
+            flush()
+            print(f"[AudioIngest] {n}/{len(files)} files, {added} added, {time.time() - t0:.0f}s")
+
+    flush()
+    print(f"[AudioIngest] Done: {added} tracks added in {time.time() - t0:.0f}s")
+    return added
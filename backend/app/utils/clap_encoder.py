@@ -1,44 +1,309 @@
 # app/utils/clap_encoder.py
-import torch
+import os
+import re
+import time
+import hashlib
+import threading
+from typing import List, Optional
+
 import numpy as np
-from transformers import ClapModel, ClapProcessor
 
-class ClapEncoder:
+CLAP_MODEL = os.getenv("SHIKISAI_CLAP_MODEL", "laion/clap-htsat-fused")
+ONNX_MODEL_PATH = os.getenv("SHIKISAI_ONNX_MODEL", os.path.join("data", "clap_text_int8.onnx"))
+ENCODER_THREADS = int(os.getenv("SHIKISAI_ENCODER_THREADS", "0"))  # 0 = library default
+ENCODER_CONNECT_SECONDS = float(os.getenv("SHIKISAI_ENCODER_CONNECT_SECONDS", "30"))
+
+NEUTRAL_VAD = [0.5, 0.5, 0.5]
+
+
+def encoder_socket_path() -> str:
+    """
+    SHIKISAI_ENCODER_SOCKET, else encoder.sock in a per-user directory:
+    $XDG_RUNTIME_DIR/shikisai, or /tmp/shikisai-<uid> without one.
+    """
+    path = os.getenv("SHIKISAI_ENCODER_SOCKET")
+    if path:
+        return path
+    runtime = os.getenv("XDG_RUNTIME_DIR")
+    base = os.path.join(runtime, "shikisai") if runtime else os.path.join("/tmp", f"shikisai-{os.getuid()}")
+    return os.path.join(base, "encoder.sock")
+
+
+def encoder_authkey() -> bytes:
+    """
+    HMAC key shared by the sidecar and its clients (SHIKISAI_ENCODER_AUTHKEY).
+    Required: the socket carries pickles, so a known key is code execution.
+    """
+    key = os.getenv("SHIKISAI_ENCODER_AUTHKEY", "").encode("utf-8")
+    if not key:
+        raise RuntimeError("SHIKISAI_ENCODER_AUTHKEY is not set; the encoder sidecar needs a shared secret")
+    return key
+
+
+class EncoderBackend:
+    """
+    Text encoder interface used by SongStore and /recommend.
+
+    encode_text returns a float32 vector of dim L2-normalized text-embedding
+    values followed by 3 VAD values; encode_texts returns the same per text.
+    `version` is "<space>@<variant>": vectors from backends with the same
+    space (e.g. fp32 and int8 CLAP) are comparable, others are not.
+    """
+
+    name = "base"
+    space = "unknown"
+    variant = "v1"
+    dim = 0
+    supports_audio = False  # encode_audio_batch available
+
+    @property
+    def version(self) -> str:
+        return f"{self.space}@{self.variant}"
+
+    def compatible(self, version: str) -> bool:
+        """Whether vectors recorded with `version` live in this encoder's space."""
+        return not version or version.split("@", 1)[0] == self.space
+
+    def info(self) -> dict:
+        return {"name": self.name, "version": self.version, "dim": self.dim}
+
+    def encode_text(self, text: str) -> np.ndarray:
+        return self.encode_texts([text])[0]
+
+    def encode_texts(self, texts: List[str]) -> List[np.ndarray]:
+        return [self.encode_text(t) for t in texts]
+
+    def encode_audio_batch(self, waveforms: List[np.ndarray]) -> np.ndarray:
+        """(n, dim) L2-normalized audio embeddings of 48 kHz mono waveforms."""
+        raise NotImplementedError(f"{self.name} encoder has no audio tower")
+
+
+def _with_vad(emb: np.ndarray) -> List[np.ndarray]:
+    """L2-normalize a (n, dim) batch and append neutral VAD to each row."""
+    emb = np.asarray(emb, dtype=np.float32)
+    emb = emb / (np.linalg.norm(emb, axis=1, keepdims=True) + 1e-9)
+    vad = np.tile(np.asarray(NEUTRAL_VAD, dtype=np.float32), (len(emb), 1))
+    return list(np.hstack([emb, vad]))
+
+
+def _set_threads(torch):
+    if ENCODER_THREADS > 0:
+        torch.set_num_threads(ENCODER_THREADS)
+
+
+class ClapEncoder(EncoderBackend):
     """
     True CLAP encoder using laion/clap-htsat-fused
     Produces:
-      - 1024-dim embedding
-      - valence, arousal, dominance
-    Total = 1027 dims 
+      - text embedding (projection_dim), L2-normalized
+      - neutral valence, arousal, dominance (the model has no VAD heads)
+    encode_text is encode_texts of one text, so both return the same vectors.
     """
 
+    name = "clap"
+    space = CLAP_MODEL
+    variant = "fp32"
+    supports_audio = True
+
     def __init__(self):
+        import torch
+        from transformers import ClapModel, ClapProcessor
+
+        self.torch = torch
+        _set_threads(torch)
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
 
         # Load the actual CLAP model
-        self.model = ClapModel.from_pretrained("laion/clap-htsat-fused").to(self.device)
-        self.processor = ClapProcessor.from_pretrained("laion/clap-htsat-fused")
+        self.model = ClapModel.from_pretrained(CLAP_MODEL).to(self.device)
+        self.processor = ClapProcessor.from_pretrained(CLAP_MODEL)
+        self.dim = int(self.model.config.projection_dim)
 
         self.model.eval()
 
-    def encode_text(self, text: str):
-        """Return a 1027-dim embedding (1024 + VAD values)."""
-        inputs = self.processor(text=text, return_tensors="pt").to(self.device)
-
-        with torch.no_grad():
+    def encode_texts(self, texts: List[str]):
+        inputs = self.processor(text=list(texts), return_tensors="pt", padding=True).to(self.device)
+        with self.torch.no_grad():
             outputs = self.model.get_text_features(**inputs)
+        return _with_vad(outputs.cpu().numpy())
 
-        # 1024-dim text embedding
-        vec = outputs.cpu().numpy()[0]
+    def encode_audio_batch(self, waveforms):
+        inputs = self.processor.feature_extractor(
+            [np.asarray(w, dtype=np.float32) for w in waveforms], sampling_rate=48000, return_tensors="pt"
+        ).to(self.device)
+        with self.torch.no_grad():
+            emb = self.model.get_audio_features(**inputs).cpu().numpy()
+        return emb / (np.linalg.norm(emb, axis=1, keepdims=True) + 1e-9)
+
+
+class QuantizedClapTextEncoder(EncoderBackend):
+    """
+    CLAP text tower only (no audio branch), with Linear layers dynamically
+    quantized to int8 for CPU inference. Same embedding space as ClapEncoder.
+    """
 
-        # Try extracting VAD if available; else fallback to 0.5
+    name = "clap-int8"
+    space = CLAP_MODEL
+    variant = "int8-dynamic"
+
+    def __init__(self):
+        import torch
+        from transformers import AutoTokenizer, ClapTextModelWithProjection
+
+        self.torch = torch
+        _set_threads(torch)
+        model = ClapTextModelWithProjection.from_pretrained(CLAP_MODEL).eval()
+        self.model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.tokenizer = AutoTokenizer.from_pretrained(CLAP_MODEL)
+        self.dim = int(model.config.projection_dim)
+
+    def encode_texts(self, texts: List[str]):
+        inputs = self.tokenizer(list(texts), return_tensors="pt", padding=True, truncation=True)
+        with self.torch.inference_mode():
+            emb = self.model(**inputs).text_embeds
+        return _with_vad(emb.numpy())
+
+
+class OnnxClapTextEncoder(EncoderBackend):
+    """
+    CLAP text tower exported to ONNX (scripts/export_clap_text_onnx.py) and run
+    with ONNX Runtime; needs onnxruntime and the tokenizer, not torch.
+    """
+
+    name = "clap-onnx"
+    space = CLAP_MODEL
+
+    def __init__(self, path: str = ONNX_MODEL_PATH):
         try:
-            val = float(self.model.text_model.valence_logits.cpu().numpy()[0])
-            aro = float(self.model.text_model.arousal_logits.cpu().numpy()[0])
-            dom = float(self.model.text_model.dominance_logits.cpu().numpy()[0])
-        except:
-            val = aro = dom = 0.5
+            import onnxruntime as ort
+        except ImportError as e:
+            raise RuntimeError("SHIKISAI_ENCODER=clap-onnx needs `pip install onnxruntime`") from e
+        from transformers import AutoTokenizer
+
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"ONNX text encoder not found: {path} (see scripts/export_clap_text_onnx.py)")
+
+        opts = ort.SessionOptions()
+        if ENCODER_THREADS > 0:
+            opts.intra_op_num_threads = ENCODER_THREADS
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(CLAP_MODEL)
+        self.dim = int(self.session.get_outputs()[0].shape[-1])
+        self.variant = "onnx-" + os.path.splitext(os.path.basename(path))[0]
+
+    def encode_texts(self, texts: List[str]):
+        inputs = self.tokenizer(list(texts), return_tensors="np", padding=True, truncation=True)
+        feeds = {k: v.astype(np.int64) for k, v in inputs.items() if k in self.input_names}
+        emb = self.session.run(None, feeds)[0]
+        return _with_vad(emb)
+
+
+class HashingEncoder(EncoderBackend):
+    """
+    Deterministic stand-in for ClapEncoder (no model, no torch).
+    Hashes word unigrams and bigrams into a 512-d signed bag of features,
+    L2-normalized, followed by neutral VAD values like ClapEncoder's output.
+    Similar prompts get similar vectors, which is enough for tests and load runs.
+    """
+
+    name = "hashing"
+    space = "hashing-512"
+    dim = 512
+    supports_audio = True
+
+    def encode_text(self, text: str):
+        vec = np.zeros(self.dim, dtype=np.float32)
+        words = re.findall(r"\w+", (text or "").lower())
+        for feat in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            h = int.from_bytes(hashlib.blake2b(feat.encode("utf-8"), digest_size=8).digest(), "little")
+            vec[h % self.dim] += 1.0 if (h >> 63) else -1.0
+        vec /= np.linalg.norm(vec) + 1e-9
+        return np.concatenate([vec, NEUTRAL_VAD]).astype(np.float32)
+
+    def encode_audio_batch(self, waveforms):
+        """Log band energies of the spectrum, so similar-sounding windows get similar vectors."""
+        out = np.zeros((len(waveforms), self.dim), dtype=np.float32)
+        for i, w in enumerate(waveforms):
+            spec = np.abs(np.fft.rfft(np.asarray(w, dtype=np.float32)))
+            edges = np.minimum(np.geomspace(1, len(spec), self.dim + 1).astype(int), len(spec) - 1)
+            out[i] = np.log1p(np.add.reduceat(spec, edges[:-1]))
+        return out / (np.linalg.norm(out, axis=1, keepdims=True) + 1e-9)
+
+
+class RemoteEncoder(EncoderBackend):
+    """
+    Client of the encoder sidecar (app/utils/encoder_server.py): same
+    interface and version as the backend the sidecar serves, without
+    loading a model in this process. One connection per calling thread.
+    """
+
+    name = "remote"
+
+    def __init__(self, path: Optional[str] = None, authkey: Optional[bytes] = None,
+                 connect_seconds: float = ENCODER_CONNECT_SECONDS):
+        self.path = path or encoder_socket_path()
+        self.authkey = authkey or encoder_authkey()
+        self._local = threading.local()
+
+        # the sidecar may still be loading its model
+        deadline = time.monotonic() + connect_seconds
+        while True:
+            try:
+                info = self._call("info")
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.5)
+        self.name = f"remote:{info['name']}"
+        self.space = info["space"]
+        self.variant = info["variant"]
+        self.dim = info["dim"]
+        self.supports_audio = info["supports_audio"]
+
+    def _connect(self):
+        from multiprocessing.connection import Client
+        conn = self._local.conn = Client(self.path, family="AF_UNIX", authkey=self.authkey)
+        return conn
+
+    def _call(self, op: str, **kwargs):
+        for attempt in (0, 1):
+            conn = getattr(self._local, "conn", None) or self._connect()
+            try:
+                conn.send((op, kwargs))
+                status, result = conn.recv()
+                break
+            except (EOFError, OSError):
+                # sidecar restarted: reconnect once
+                self._local.conn = None
+                if attempt:
+                    raise
+        if status != "ok":
+            raise RuntimeError(f"encoder sidecar: {result}")
+        return result
+
+    def info(self) -> dict:
+        return {**super().info(), "socket": self.path}
+
+    def encode_texts(self, texts: List[str]):
+        return list(self._call("encode_texts", texts=list(texts)))
+
+    def encode_audio_batch(self, waveforms):
+        return self._call("encode_audio_batch", waveforms=[np.asarray(w, dtype=np.float32) for w in waveforms])
+
+
+ENCODERS = {
+    "clap": ClapEncoder,
+    "clap-int8": QuantizedClapTextEncoder,
+    "clap-onnx": OnnxClapTextEncoder,
+    "hashing": HashingEncoder,
+    "remote": RemoteEncoder,
+}
 
-        full_vec = np.concatenate([vec, [val, aro, dom]]).astype(np.float32)
 
-        return full_vec
+def make_encoder(name: str = None) -> EncoderBackend:
+    """Encoder selected by SHIKISAI_ENCODER (one of ENCODERS; "clap" by default)."""
+    name = (name or os.getenv("SHIKISAI_ENCODER", "clap")).lower()
+    if name not in ENCODERS:
+        raise ValueError(f"Unknown encoder: {name} (expected one of {', '.join(ENCODERS)})")
+    return ENCODERS[name]()
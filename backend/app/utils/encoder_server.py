@@ -0,0 +1,177 @@
+# app/utils/encoder_server.py
+"""
+Encoder sidecar: one process per host owns the CLAP model and serves
+encode requests from every API worker over a Unix socket
+(multiprocessing.connection, HMAC authkey).
+
+Text requests from all connections go through one queue; a single
+inference thread takes whatever is waiting (up to max_batch texts, or
+what arrives within max_wait_ms of the first request) and encodes it as
+one batch. Workers use RemoteEncoder (SHIKISAI_ENCODER=remote), so they
+never import torch.
+
+    export SHIKISAI_ENCODER_AUTHKEY=<secret>
+    python -m app.utils.encoder_server --encoder clap
+    SHIKISAI_ENCODER=remote uvicorn app.main:app --workers 4
+
+The socket lives in a per-user 0700 directory ($XDG_RUNTIME_DIR/shikisai,
+else /tmp/shikisai-<uid>) unless SHIKISAI_ENCODER_SOCKET says otherwise.
+"""
+import os
+import stat
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import Future
+from multiprocessing.connection import AuthenticationError, Listener
+from typing import List, Optional
+
+import numpy as np
+
+from app.utils.clap_encoder import make_encoder, encoder_socket_path, encoder_authkey
+
+MAX_BATCH = int(os.getenv("SHIKISAI_ENCODER_MAX_BATCH", "32"))
+MAX_WAIT_MS = float(os.getenv("SHIKISAI_ENCODER_MAX_WAIT_MS", "5"))
+
+
+class TextBatcher:
+    """Coalesces encode_texts calls from many threads into batched model calls."""
+
+    def __init__(self, encoder, max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS):
+        self.encoder = encoder
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.texts = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="encode-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts: List[str]) -> Future:
+        fut = Future()
+        self._queue.put((list(texts), fut))
+        return fut
+
+    def _collect(self):
+        items = [self._queue.get()]
+        n = len(items[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while n < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            items.append(item)
+            n += len(item[0])
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            texts = [t for batch, _ in items for t in batch]
+            try:
+                vecs = np.asarray(self.encoder.encode_texts(texts), dtype=np.float32)
+            except Exception as e:
+                for _, fut in items:
+                    fut.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            start = 0
+            for batch, fut in items:
+                fut.set_result(vecs[start:start + len(batch)])
+                start += len(batch)
+
+
+def _private_dir(path: str):
+    """Create the socket's directory (0700) or check that an existing one is ours and private."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise RuntimeError(f"{path} must be a directory owned by this user with mode 0700")
+
+
+def serve(encoder, path: Optional[str] = None, authkey: Optional[bytes] = None,
+          max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS):
+    """Answer encode requests forever, one thread per client connection."""
+    path = path or encoder_socket_path()
+    authkey = authkey or encoder_authkey()
+    if not os.getenv("SHIKISAI_ENCODER_SOCKET") and path == encoder_socket_path():
+        _private_dir(os.path.dirname(path))
+    batcher = TextBatcher(encoder, max_batch, max_wait_ms)
+    audio_lock = threading.Lock()  # audio batches come pre-batched from ingestion
+
+    def info():
+        return {
+            **encoder.info(),
+            "space": encoder.space,
+            "variant": encoder.variant,
+            "supports_audio": bool(getattr(encoder, "supports_audio", False)),
+            "batches": batcher.batches,
+            "texts": batcher.texts,
+        }
+
+    def handle(conn):
+        with conn:
+            while True:
+                try:
+                    op, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if op == "encode_texts":
+                        conn.send(("ok", batcher.submit(kwargs["texts"]).result()))
+                    elif op == "encode_audio_batch":
+                        with audio_lock:
+                            conn.send(("ok", np.asarray(encoder.encode_audio_batch(kwargs["waveforms"]), dtype=np.float32)))
+                    elif op == "info":
+                        conn.send(("ok", info()))
+                    else:
+                        conn.send(("error", f"unknown op {op}"))
+                except Exception as e:
+                    conn.send(("error", f"{type(e).__name__}: {e}"))
+
+    if os.path.lexists(path):
+        if not stat.S_ISSOCK(os.lstat(path).st_mode):
+            raise RuntimeError(f"{path} exists and is not a socket")
+        os.unlink(path)  # stale socket from a previous run
+
+    # the socket is created 0600: no window where another user can connect
+    old_umask = os.umask(0o177)
+    try:
+        listener = Listener(path, family="AF_UNIX", authkey=authkey)
+    finally:
+        os.umask(old_umask)
+    with listener:
+        print(f"[EncoderServer] {encoder.name} ({encoder.version}) listening on {path}")
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, EOFError, OSError) as e:
+                print(f"[EncoderServer] Rejected connection: {type(e).__name__}")
+                continue
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--encoder", default=None, help="backend to serve (default: SHIKISAI_ENCODER, then clap)")
+    ap.add_argument("--socket", default=None, help="default: SHIKISAI_ENCODER_SOCKET, then a per-user runtime dir")
+    ap.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    ap.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    args = ap.parse_args()
+
+    name = args.encoder or os.getenv("SHIKISAI_ENCODER", "clap")
+    if name == "remote":
+        raise SystemExit("The sidecar needs a local encoder backend, not 'remote'")
+    try:
+        authkey = encoder_authkey()
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    serve(make_encoder(name), args.socket, authkey, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+
+
+if __name__ == "__main__":
+    main()
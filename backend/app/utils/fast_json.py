@@ -0,0 +1,56 @@
+# app/utils/fast_json.py
+from typing import Dict, Iterable, Sequence
+
+import numpy as np
+import orjson
+from fastapi.responses import Response
+
+_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def dumps(obj) -> bytes:
+    return orjson.dumps(obj, option=_OPTIONS)
+
+
+class Raw(bytes):
+    """Already-serialized JSON, spliced into a response as is."""
+
+
+class PayloadTable:
+    """
+    One pre-serialized JSON fragment per catalog row, stored back to back
+    in a single buffer. join(rows) builds a JSON array from byte slices, so
+    rendering k tracks costs k slices and one join.
+    """
+
+    def __init__(self, fragments: Iterable[bytes]):
+        fragments = list(fragments)
+        self.offsets = np.zeros(len(fragments) + 1, dtype=np.int64)
+        np.cumsum([len(f) for f in fragments], out=self.offsets[1:])
+        self.blob = b"".join(fragments)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.blob) + self.offsets.nbytes
+
+    def fragment(self, row: int) -> bytes:
+        return self.blob[self.offsets[row]:self.offsets[row + 1]]
+
+    def join(self, rows: Sequence[int]) -> Raw:
+        off = self.offsets
+        blob = self.blob
+        return Raw(b"[" + b",".join([blob[off[r]:off[r + 1]] for r in rows]) + b"]")
+
+
+def render(fields: Dict) -> bytes:
+    """A JSON object from fields; Raw values are inserted without re-encoding."""
+    parts = [dumps(k) + b":" + (v if isinstance(v, Raw) else dumps(v)) for k, v in fields.items()]
+    return b"{" + b",".join(parts) + b"}"
+
+
+def json_response(fields: Dict, status_code: int = 200) -> Response:
+    """Bypass FastAPI's jsonable_encoder / pydantic for hot endpoints."""
+    return Response(render(fields), status_code=status_code, media_type="application/json")
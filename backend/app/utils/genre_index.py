@@ -0,0 +1,111 @@
+# app/utils/genre_index.py
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, Mapping, Optional
+
+import numpy as np
+
+
+def normalize_genre(g) -> str:
+    return str(g).lower().strip()
+
+
+class GenreIndex:
+    """
+    Genre -> catalog rows inverted index (CSR layout).
+
+    postings[offsets[i]:offsets[i + 1]] are the sorted rows tagged with
+    genres[i]. boost() turns a genre weighting into per-candidate boosts with
+    work proportional to the postings of the requested genres, not to the
+    catalog size.
+    """
+
+    def __init__(self, n_rows: int, row_genres: Iterable[Iterable[str]], extra: Optional[Mapping[int, Iterable[str]]] = None):
+        """
+        row_genres: genres per catalog row (e.g. df["genres"])
+        extra:      additional {row: genres} (e.g. SongStore artist genres)
+        """
+        buckets = defaultdict(set)
+        for row, gs in enumerate(row_genres):
+            for g in gs or []:
+                buckets[normalize_genre(g)].add(row)
+        for row, gs in (extra or {}).items():
+            for g in gs or []:
+                buckets[normalize_genre(g)].add(row)
+        buckets.pop("", None)
+
+        self.n_rows = n_rows
+        self.genres = sorted(buckets)
+        self._slot = {g: i for i, g in enumerate(self.genres)}
+        self.offsets = np.zeros(len(self.genres) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum([len(buckets[g]) for g in self.genres])
+        self.postings = np.fromiter(
+            (r for g in self.genres for r in sorted(buckets[g])),
+            dtype=np.int32,
+            count=int(self.offsets[-1]),
+        )
+        self._scratch = threading.local()
+
+    def __len__(self):
+        return len(self.genres)
+
+    def rows(self, genre: str) -> np.ndarray:
+        i = self._slot.get(normalize_genre(genre))
+        if i is None:
+            return self.postings[:0]
+        return self.postings[self.offsets[i]:self.offsets[i + 1]]
+
+    def sparse_weights(self, weights: Mapping[str, float]):
+        """
+        Scatter-add genre weights onto rows.
+        Returns (rows, summed_weight) for every row tagged with a weighted genre.
+        """
+        parts, vals = [], []
+        for g, w in weights.items():
+            r = self.rows(g)
+            if len(r) and w:
+                parts.append(r)
+                vals.append(np.full(len(r), w, dtype=np.float32))
+        if not parts:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        rows = np.concatenate(parts)
+        vals = np.concatenate(vals)
+        uniq, inv = np.unique(rows, return_inverse=True)
+        return uniq, np.bincount(inv, weights=vals).astype(np.float32)
+
+    def _buffer(self) -> np.ndarray:
+        buf = getattr(self._scratch, "buf", None)
+        if buf is None:
+            buf = np.zeros(self.n_rows, dtype=np.float32)
+            self._scratch.buf = buf
+        return buf
+
+    def boost(self, candidates: np.ndarray, weights: Mapping[str, float], cap: float = 1.0) -> np.ndarray:
+        """
+        Per-candidate sum of matching genre weights (capped at `cap`).
+        Uses a per-thread scratch row buffer that is cleared after use.
+        """
+        rows, vals = self.sparse_weights(weights)
+        if not len(rows):
+            return np.zeros(len(candidates), dtype=np.float32)
+        buf = self._buffer()
+        buf[rows] = np.minimum(vals, cap)
+        try:
+            return buf[candidates]
+        finally:
+            buf[rows] = 0.0
+
+
+def taste_genre_weights(user_taste: Optional[Dict]) -> Dict[str, float]:
+    """
+    Genre weights from a taste profile: genre_counts scaled so the most
+    listened genre is 1.0, falling back to 1.0 for each of top_genres.
+    """
+    if not user_taste:
+        return {}
+    counts = user_taste.get("genre_counts") or {}
+    if counts:
+        top = max(counts.values())
+        if top > 0:
+            return {normalize_genre(g): c / top for g, c in counts.items() if c > 0}
+    return {normalize_genre(g): 1.0 for g in user_taste.get("top_genres") or []}
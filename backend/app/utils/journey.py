@@ -0,0 +1,162 @@
+# app/utils/journey.py
+"""
+Color-journey playlists: a track sequence that moves through a list of
+color stops with smooth transitions and no repeats.
+
+1. Candidates are the union of every stop's candidate rows.
+2. One batched pass scores them for all stops (a (stops, 512) x (512, P)
+   CLAP matmul plus the broadcast hybrid terms); each playlist slot's score
+   row is a linear blend of its two neighboring stops.
+3. Beam search picks one track per slot, maximizing
+       sum of slot scores - TRANSITION_EMB * (1 - cos) - TRANSITION_VA * |Δ(v, e)|
+   over consecutive tracks, never reusing a song and never playing the
+   same artist twice in a row.
+"""
+import os
+from typing import Sequence, Tuple
+
+import numpy as np
+
+from app.utils import local_recommender as lr
+from app.utils.emotion_utils import emotions_to_vad
+
+JOURNEY_BEAM = int(os.getenv("SHIKISAI_JOURNEY_BEAM", "16"))
+JOURNEY_BRANCH = int(os.getenv("SHIKISAI_JOURNEY_BRANCH", "48"))
+JOURNEY_MAX_POOL = int(os.getenv("SHIKISAI_JOURNEY_MAX_POOL", "20000"))
+JOURNEY_DEADLINE_MS = float(os.getenv("SHIKISAI_JOURNEY_DEADLINE_MS", "3000"))
+JOURNEY_MAX_STOPS = 16
+JOURNEY_MAX_LENGTH = 200
+TRANSITION_EMB = 0.3
+TRANSITION_VA = 0.5
+
+
+class Stop:
+    """One color stop: its hex, CLAP prompt embedding and (valence, arousal)."""
+
+    def __init__(self, hex_color: str, query_embed, v: float, a: float):
+        self.hex_color = hex_color
+        query_embed = np.asarray(query_embed, dtype=np.float32)[:512]
+        if query_embed.size < 512:
+            query_embed = np.concatenate([query_embed, np.zeros(512 - query_embed.size, dtype=np.float32)])
+        self.ctx = lr._query_context(query_embed, a, hex_color)
+        self.v = float(v)
+        self.a = self.ctx["a"]
+
+
+def slot_weights(n_stops: int, length: int) -> np.ndarray:
+    """(length, n_stops) linear interpolation weights spreading the slots evenly over the stops."""
+    W = np.zeros((length, n_stops), dtype=np.float32)
+    if n_stops == 1:
+        W[:, 0] = 1
+        return W
+    pos = np.linspace(0, n_stops - 1, length)
+    lo = np.minimum(np.floor(pos).astype(int), n_stops - 2)
+    t = (pos - lo).astype(np.float32)
+    W[np.arange(length), lo] = 1 - t
+    W[np.arange(length), lo + 1] = t
+    return W
+
+
+def candidate_pool(snap, stops: Sequence[Stop], row_ids=None, exclude=None) -> np.ndarray:
+    """Sorted union of the stops' candidate rows."""
+    parts = [
+        lr.select_candidates(snap, s.ctx["intent"], s.v, s.a, row_ids=row_ids, exclude=exclude)[0]
+        for s in stops
+    ]
+    return np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+
+
+def stop_scores(snap, stops: Sequence[Stop], pool: np.ndarray) -> np.ndarray:
+    """(stops, P) hybrid scores of the pool rows for every stop, in one batched pass."""
+    feats = snap.features
+    val = feats["valence"][pool]
+    energy = feats["energy"][pool]
+    v = np.array([s.v for s in stops], dtype=np.float32)[:, None]
+    a = np.array([s.a for s in stops], dtype=np.float32)[:, None]
+    dist = np.sqrt((val - v) ** 2 + (energy - a) ** 2)
+
+    w = {k: np.array([s.ctx[k] for s in stops], dtype=np.float32)[:, None]
+         for k in ("w_clap", "w_emo", "w_mod", "w_energy_pref")}
+    Q = np.stack([s.ctx["vec_norm"] for s in stops])
+    S = w["w_clap"] * (Q @ snap.emb_norm[pool].T)
+    S += w["w_emo"] * np.exp(-3.5 * dist)
+    S += w["w_mod"] * feats["year_norm"][pool]
+    S += w["w_energy_pref"] * (1 - np.abs(energy - a))
+
+    statics = {}
+    for i, s in enumerate(stops):
+        intent = s.ctx["intent"]
+        if intent not in statics:
+            statics[intent] = lr.intent_static_score(feats, intent, pool)
+        S[i] += statics[intent]
+    return S
+
+
+def beam_search(S: np.ndarray, emb: np.ndarray, va: np.ndarray, song: np.ndarray, artist: np.ndarray,
+                beam: int = JOURNEY_BEAM, branch: int = JOURNEY_BRANCH) -> Tuple[np.ndarray, float]:
+    """
+    Best sequence of pool positions for the (slots, P) score matrix S.
+    Each slot expands every beam with the slot's top candidates (enough of
+    them that `branch` are always left after excluding earlier picks).
+    Returns fewer positions than slots only if the pool runs out.
+    """
+    length, P = S.shape
+    C = min(P, branch + 2 * length)
+    top = np.argpartition(-S, C - 1, axis=1)[:, :C] if C < P else np.broadcast_to(np.arange(P), (length, P))
+
+    cand = top[0]
+    first = np.argsort(-S[0, cand], kind="stable")[:beam]
+    seqs = cand[first][:, None]
+    totals = S[0, seqs[:, 0]].astype(np.float64)
+
+    for t in range(1, length):
+        cand = top[t]
+        last = seqs[:, -1]
+        used = song[seqs]  # (B, t)
+        valid = ~(used[:, None, :] == song[cand][None, :, None]).any(axis=2)
+        valid &= artist[cand][None, :] != artist[last][:, None]
+
+        cos = emb[last] @ emb[cand].T
+        dva = np.linalg.norm(va[last][:, None, :] - va[cand][None, :, :], axis=2)
+        step = S[t, cand][None, :] - TRANSITION_EMB * (1 - cos) - TRANSITION_VA * dva
+        total = np.where(valid, totals[:, None] + step, -np.inf).ravel()
+
+        n_valid = int(np.isfinite(total).sum())
+        if n_valid == 0:
+            break
+        keep = min(beam, n_valid)
+        best = np.argpartition(-total, keep - 1)[:keep]
+        best = best[np.argsort(-total[best], kind="stable")]
+        b, c = np.divmod(best, len(cand))
+        seqs = np.hstack([seqs[b], cand[c][:, None]])
+        totals = total[best]
+
+    return seqs[0], float(totals[0])
+
+
+def plan_journey(snap, stops: Sequence[Stop], length: int, row_ids=None, exclude=None,
+                 beam: int = JOURNEY_BEAM, branch: int = JOURNEY_BRANCH) -> Tuple[np.ndarray, float]:
+    """(catalog rows in play order, objective) for a journey through the stops."""
+    pool = candidate_pool(snap, stops, row_ids, exclude)
+    if len(pool) == 0:
+        return pool, 0.0
+    S_stops = stop_scores(snap, stops, pool)
+
+    if len(pool) > JOURNEY_MAX_POOL:
+        keep = np.argpartition(-S_stops.max(axis=0), JOURNEY_MAX_POOL - 1)[:JOURNEY_MAX_POOL]
+        keep.sort()
+        pool, S_stops = pool[keep], S_stops[:, keep]
+
+    S = slot_weights(len(stops), length) @ S_stops
+    feats = snap.features
+    va = np.stack([feats["valence"][pool], feats["energy"][pool]], axis=1)
+    pos, total = beam_search(
+        S, snap.emb_norm[pool], va, feats["song_key"][pool], feats["artist_key"][pool], beam, branch
+    )
+    return pool[pos], total
+
+
+def stop_vad(emotions: str) -> Tuple[float, float]:
+    """(valence, arousal) of a color's emotion words."""
+    v, a, _ = emotions_to_vad(emotions)
+    return float(v), float(a)
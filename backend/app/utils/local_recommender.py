@@ -1,9 +1,23 @@
 import os
 import ast
+import json
 import numpy as np
 import pandas as pd
 import colorsys
-import re
+import threading
+import traceback
+
+from app.utils.spatial_index import EmotionGrid
+from app.models.catalog import CatalogSnapshot, CatalogManager
+from app.models.metadata_store import MetadataStore
+from app.utils.genre_index import GenreIndex, taste_genre_weights
+from app.models.session_history import test_rows
+from app.utils import reduction
+from app.utils import neighbor_graph
+from app.utils.reduction import RERANK_CANDIDATES
+from app.utils.parallel_scoring import SCORING, SCORE_CHUNK_ROWS
+from app.utils import fast_json
+from app.utils.fast_json import PayloadTable
 
 BLACKLIST_KEYWORDS = [
     "soundtrack", "ost", "original soundtrack", "theme", 
@@ -17,9 +31,8 @@ BLACKLIST_KEYWORDS = [
 # LOAD DATASET
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 DATA_DIR = os.path.join(BASE_DIR, "data")
-FILE_PATH = os.path.join(DATA_DIR, "my_tracks_with_clap.csv")
-
-df = pd.read_csv(FILE_PATH)
+FILE_PATH = os.getenv("SHIKISAI_CATALOG_PATH", os.path.join(DATA_DIR, "my_tracks_with_clap.csv"))
+SONG_METADATA_PATH = os.path.join(DATA_DIR, "song_metadata.json")
 
 
 # SAFE UTILITIES
@@ -53,45 +66,58 @@ def safe_parse_embed(x):
     return None
 
 
-# FIX GENRES + EMBEDDINGS
-if "genres" not in df.columns:
-    df["genres"] = [[] for _ in range(len(df))]
-else:
-    df["genres"] = df["genres"].apply(parse_list)
+def load_catalog_frame(path=FILE_PATH):
+    """
+    Read and clean the catalog CSV.
+    Returns (df, emb_norm) with the 512-d normalized CLAP matrix row-aligned to df.
+    """
+    df = pd.read_csv(path)
+
+    # FIX GENRES + EMBEDDINGS
+    if "genres" not in df.columns:
+        df["genres"] = [[] for _ in range(len(df))]
+    else:
+        df["genres"] = df["genres"].apply(parse_list)
+
+    df["clap_vec"] = df["clap_embed"].apply(safe_parse_embed)
+
+    # REMOVE SONGS WITH INVALID EMBEDDINGS
+    df = df[df["clap_vec"].notnull()].reset_index(drop=True)
 
-df["clap_vec"] = df["clap_embed"].apply(safe_parse_embed)
+    print("After filtering invalid embeddings:", len(df))
 
-# REMOVE SONGS WITH INVALID EMBEDDINGS
-df = df[df["clap_vec"].notnull()].reset_index(drop=True)
+    if len(df) == 0:
+        raise ValueError("No valid CLAP embeddings found — check your CSV formatting!")
 
-print("After filtering invalid embeddings:", len(df))
+    # FIX NUMERICAL FIELDS
+    df["valence"] = df["valence"].fillna(0.5)
+    df["energy"] = df["energy"].fillna(0.5)
+    df["instrumentalness"] = df["instrumentalness"].fillna(0.0)
+    df["speechiness"] = df["speechiness"].fillna(0.05)
+    df["popularity"] = df["popularity"].fillna(0.0)
+    df["release_year"] = df["release_year"].fillna(2010).astype(int)
 
-if len(df) == 0:
-    raise ValueError("No valid CLAP embeddings found — check your CSV formatting!")
+    # PRECOMPUTE NORMALIZED EMBEDDING MATRIX
+    emb_matrix = np.vstack(df["clap_vec"].values).astype(np.float32)
+    emb_matrix = emb_matrix[:, :512]   # 🔒 FIX
+    emb_norm = emb_matrix / (np.linalg.norm(emb_matrix, axis=1, keepdims=True) + 1e-9)
 
-# FIX NUMERICAL FIELDS
-df["valence"] = df["valence"].fillna(0.5)
-df["energy"] = df["energy"].fillna(0.5)
-df["instrumentalness"] = df["instrumentalness"].fillna(0.0)
-df["speechiness"] = df["speechiness"].fillna(0.05)
-df["popularity"] = df["popularity"].fillna(0.0)
-df["release_year"] = df["release_year"].fillna(2010).astype(int)
+    # the raw embedding columns are only needed to build the matrix
+    df = df.drop(columns=["clap_embed", "clap_vec"])
 
-# PRECOMPUTE NORMALIZED EMBEDDING MATRIX
-EMB_MATRIX = np.vstack(df["clap_vec"].values).astype(np.float32)
-EMB_MATRIX = EMB_MATRIX[:, :512]   # 🔒 FIX
-EMB_NORM = EMB_MATRIX / (np.linalg.norm(EMB_MATRIX, axis=1, keepdims=True) + 1e-9)
+    return df, emb_norm
 
 
 # COSINE SIMILARITY
-def cosine_sim_np(vec):
+def cosine_sim_np(vec, snapshot=None):
+    snap = snapshot or CATALOG.current()
     if vec is None:
-        return np.zeros(len(df))
+        return np.zeros(len(snap))
 
     vec = np.array(vec, dtype=np.float32)[:512]
     vec_norm = vec / (np.linalg.norm(vec) + 1e-9)
 
-    return EMB_NORM @ vec_norm
+    return snap.emb_norm @ vec_norm
 
 
 # COLOR → INTENT LAYER
@@ -212,286 +238,742 @@ def color_to_intent(hex_color):
     return "cool_soft"
 
 
-# FINAL HYBRID RECOMMENDER
-def recommend_hybrid(
-    query_embed,
-    v,
-    a,
-    hex_color=None,
-    user_taste=None,
-    preferences=None,
-    limit=10,
-    df_subset=None
-):
-
-    ALLOW_TERMS = [
-        "anime", "animation", "op", "ed",
-        "opening", "ending",
-        "drama", "tv", "television",
-        "k-drama", "kdrama", "c-drama", "cdrama", "j-drama",
-        "电视剧", "動畫", "アニメ", "片尾曲", "插曲"
-    ]
-    # SAFETY
-    query_embed = np.asarray(query_embed, dtype=np.float32)[:512]
-    assert query_embed.shape[0] == 512, f"BAD QUERY EMBED SHAPE: {query_embed.shape}"
+# TERM LISTS (used by the static precompute below)
+ALLOW_TERMS = [
+    "anime", "animation", "op", "ed",
+    "opening", "ending",
+    "drama", "tv", "television",
+    "k-drama", "kdrama", "c-drama", "cdrama", "j-drama",
+    "电视剧", "動畫", "アニメ", "片尾曲", "插曲"
+]
 
-    # USER PROFILE
-    user_profile = {
-        "energy_pref": 0.3,
-        "instrumental_pref": 0.2,
-        "popularity_pref": 0.6,
-        "avoid_game_ost": True,
-    }
+THEME_TERMS = [
+    "theme", "title theme", "main theme",
+    "file select", "soundtrack", "ost",
+    "from ", "opening", "ending"
+]
 
-    if preferences is None:
-        preferences = {
-            "w_clap": 1.0,
-            "w_emotion": 1.0,
-            "w_modern": 0.5,
-            "w_energy_pref": 0.3,
-        }
+ROMANCE_TERMS = [
+    "love", "kiss", "heart", "darling",
+    "fall", "you", "us", "night", "baby"
+]
 
-    df2 = df_subset.copy() if df_subset is not None else df.copy()
+GAME_FRANCHISES = [
+    "pokemon", "pokémon", "zelda", "fire emblem",
+    "final fantasy", "chrono", "kingdom hearts",
+    "nintendo", "square enix", "capcom", "atlus"
+]
 
-    blacklist_pattern = "|".join(BLACKLIST_KEYWORDS)
+GAME_TERMS = [
+    "title screen", "main menu", "overworld",
+    "route", "battle", "boss", "stage", "level",
+    "theme from", "video game", "game music",
+    "game bgm", "game soundtrack", "from \""
+]
 
-    text_all = (
-        df2["name"].str.lower() + " " +
-        df2["artists"].astype(str).str.lower()
-    )
+CLASSICAL_TERMS = [
+    "bach", "chopin", "mozart", "beethoven",
+    "prelude", "sonata", "symphony",
+    "concerto", "op.", "opus", "movement"
+]
 
-    is_blacklisted = text_all.str.contains(blacklist_pattern, na=False)
+# USER PROFILE (fixed defaults)
+USER_PROFILE = {
+    "energy_pref": 0.3,
+    "instrumental_pref": 0.2,
+    "popularity_pref": 0.6,
+    "avoid_game_ost": True,
+}
 
-    is_allowed = text_all.str.contains(
-        "|".join(ALLOW_TERMS),
-        na=False
-    )
+DEFAULT_PREFERENCES = {
+    "w_clap": 1.0,
+    "w_emotion": 1.0,
+    "w_modern": 0.5,
+    "w_energy_pref": 0.3,
+}
 
-    is_real_instrumental = df2["instrumentalness"] > 0.75
+# max emotion distance kept per intent
+EMOTION_CUTOFF = {
+    "warm_soft": 0.45,
+    "cool_soft": 0.42,
+    "dark_moody": 0.40
+}
+DEFAULT_EMOTION_CUTOFF = 0.45
 
-    df2 = df2[~(is_blacklisted & is_real_instrumental & ~is_allowed)]
+TASTE_BOOST = 0.35
 
-    intent = color_to_intent(hex_color)
-    cfg = INTENT_CONFIG[intent]
 
+# STATIC FEATURES + PER-INTENT POOLS
+def _contains(text, terms):
+    return text.str.contains("|".join(terms), na=False).to_numpy()
 
-    w_clap = preferences["w_clap"] * cfg["clap_weight"]
-    w_emo = preferences["w_emotion"]
-    w_mod = preferences["w_modern"]
-    w_energy_pref = preferences["w_energy_pref"]
 
-    # EMOTION SCORE
-    a = 0.7 * a + 0.3 * user_profile["energy_pref"]
-    emotion_dist = np.sqrt(
-        (df2["valence"] - v) ** 2 +
-        (df2["energy"] - a) ** 2
-    )
+def build_static_features(frame):
+    """
+    Everything recommend_hybrid needs from the catalog that does not depend
+    on the query: row masks, numeric columns as arrays and dedup keys.
+    """
+    name_lower = frame["name"].str.lower()
+    artists_lower = frame["artists"].astype(str).str.lower()
+    text_all = name_lower + " " + artists_lower
+
+    is_blacklisted = _contains(text_all, BLACKLIST_KEYWORDS)
+    is_allowed = _contains(text_all, ALLOW_TERMS)
+    is_real_instrumental = (frame["instrumentalness"] > 0.75).to_numpy()
+    is_game_ost = _contains(text_all, GAME_FRANCHISES) | _contains(text_all, GAME_TERMS)
+
+    keep = ~(is_blacklisted & is_real_instrumental & ~is_allowed)
+    keep &= ~(is_game_ost & ~is_allowed)
+    if USER_PROFILE["avoid_game_ost"]:
+        keep &= ~is_game_ost
+
+    keys = dedup_key_strings(frame)
+
+    return {
+        "allowed_rows": np.flatnonzero(keep),
+        "valence": frame["valence"].to_numpy(dtype=np.float32),
+        "energy": frame["energy"].to_numpy(dtype=np.float32),
+        "instrumentalness": frame["instrumentalness"].to_numpy(dtype=np.float32),
+        "speechiness": frame["speechiness"].to_numpy(dtype=np.float32),
+        "pop_norm": (frame["popularity"] / 100).to_numpy(dtype=np.float32),
+        "year_norm": ((frame["release_year"] - 1990) / 35).clip(0, 1).to_numpy(dtype=np.float32),
+        "is_theme": _contains(text_all, THEME_TERMS),
+        "is_romance": _contains(name_lower, ROMANCE_TERMS),
+        "is_classical": _contains(name_lower, CLASSICAL_TERMS) | _contains(artists_lower, CLASSICAL_TERMS),
+        "song_key": pd.factorize(keys["song_key"])[0],
+        "artist_key": pd.factorize(keys["artist_key"])[0],
+        "name_key": pd.factorize(keys["name_key"])[0],
+    }
 
-    df2["emotion_score"] = np.exp(-3.5 * emotion_dist)
-
-    cutoff = {
-        "warm_soft": 0.45,
-        "cool_soft": 0.42,
-        "dark_moody": 0.40
-    }.get(intent, 0.45)
-
-    df2 = df2[emotion_dist < cutoff]
-     
-    # CLAP SIMILARITY
-    clap_sim_all = cosine_sim_np(query_embed)
-    df2["clap_sim"] = clap_sim_all[df2.index]
-        
-    # METADATA NORMALIZATION
-    df2["pop_norm"] = df2["popularity"] / 100
-    df2["year_norm"] = ((df2["release_year"] - 1990) / 35).clip(0, 1)
-      
-    # BASE SCORE (SIMPLIFIED + STABLE)
-    df2["score"] = (
-        w_clap * df2["clap_sim"]
-        + w_emo * df2["emotion_score"]
-        + w_mod * df2["year_norm"]
-        + w_energy_pref * (1 - abs(df2["energy"] - a))
-    )
 
-    # USER TASTE BIAS
-    if user_taste is not None:
-        top_genres = set(user_taste.get("top_genres", []))
+def dedup_key_strings(frame):
+    """The strings the dedup rules compare: song (title + artists), artists and title."""
+    name_lower = frame["name"].str.lower()
+    artists_lower = frame["artists"].astype(str).str.lower()
+    return {
+        "song_key": name_lower.str.strip() + "___" + artists_lower.str.strip(),
+        "artist_key": frame["artists"].astype(str),
+        "name_key": name_lower,
+    }
 
-        if top_genres:
-            genre_text = (
-                df2["name"].str.lower()
-                + " "
-                + df2["artists"].astype(str).str.lower()
-            )
 
-            escaped_genres = [re.escape(g.lower()) for g in top_genres]
+# INTENT_CONFIG coefficients that scale one feature column each
+INTENT_COEFFICIENTS = ("energy_bias", "vocal_boost", "instrumental_penalty", "romance_bias")
 
-            taste_mask = genre_text.str.contains(
-                "|".join(escaped_genres),
-                na=False
-            )
 
-            # small but meaningful boost
-            df2.loc[taste_mask, "score"] += 0.35
+def intent_static_terms(feats, intent, rows=None):
+    """
+    intent_static_score split into its fixed part and, per INTENT_COEFFICIENTS
+    entry, the column that coefficient multiplies (the score is linear in them).
+    """
+    sel = slice(None) if rows is None else rows
 
-    # HARD OST / THEME PENALTY
-    theme_terms = [
-        "theme", "title theme", "main theme",
-        "file select", "soundtrack", "ost",
-        "from ", "opening", "ending"
-    ]
-
-    theme_text = (
-        df2["name"].str.lower()
-        + " "
-        + df2["artists"].astype(str).str.lower()
-    )
+    valence = feats["valence"][sel]
+    energy = feats["energy"][sel]
+    instr = feats["instrumentalness"][sel]
+    speech = feats["speechiness"][sel]
 
-    is_theme = theme_text.str.contains(
-        "|".join(theme_terms),
-        na=False
-    )
+    score = np.zeros(len(valence), dtype=np.float32)
 
-    df2.loc[is_theme, "score"] -= 0.6
+    # HARD OST / THEME PENALTY
+    score -= 0.6 * feats["is_theme"][sel]
 
     # penalize heavy instrumentals (but don't kill vocals)
-    df2["score"] -= 0.35 * df2["instrumentalness"]
+    score -= 0.35 * instr
 
     # popularity bias
-    df2["score"] += 0.15 * df2["pop_norm"]
+    score += 0.15 * feats["pop_norm"][sel]
 
     NEUTRAL_V = 0.5
     NEUTRAL_A = 0.5
-
-    neutral_dist = np.sqrt(
-        (df2["valence"] - NEUTRAL_V) ** 2 +
-        (df2["energy"] - NEUTRAL_A) ** 2
-    )
-    df2["score"] += 0.35 * neutral_dist
-
-    # INTENT SHAPING
-    df2["score"] += cfg["energy_bias"] * df2["energy"]
-    df2["score"] += cfg["vocal_boost"] * df2["speechiness"]
-    df2["score"] -= cfg["instrumental_penalty"] * df2["instrumentalness"]
+    score += 0.35 * np.sqrt((valence - NEUTRAL_V) ** 2 + (energy - NEUTRAL_A) ** 2)
 
     # intent-specific constraints
     if intent == "warm_soft":
         # baby pink / tender warmth
-        df2["score"] += 0.4 * df2["valence"]          # prefer positive emotion
-        df2["score"] -= 0.4 * df2["energy"]           # avoid urgency
-        df2["score"] -= 0.3 * (1 - df2["speechiness"])# avoid wordless music
+        score += 0.4 * valence          # prefer positive emotion
+        score -= 0.4 * energy           # avoid urgency
+        score -= 0.3 * (1 - speech)     # avoid wordless music
 
     elif intent == "cool_soft":
         # lavender / calm distance
-        df2["score"] -= 0.3 * df2["energy"]
-        df2["score"] += 0.1 * (1 - df2["valence"])     # allow gentle melancholy
+        score -= 0.3 * energy
+        score += 0.1 * (1 - valence)     # allow gentle melancholy
 
     elif intent == "dark_moody":
         # deep / introspective
-        df2["score"] -= 0.2 * df2["energy"]
-        df2["score"] += 0.3 * (1 - df2["valence"])     # sadness allowed
+        score -= 0.2 * energy
+        score += 0.3 * (1 - valence)     # sadness allowed
+
+    return score, {
+        "energy_bias": energy,
+        "vocal_boost": speech,
+        "instrumental_penalty": -instr,
+        "romance_bias": feats["is_romance"][sel].astype(np.float32),
+    }
+
 
+def intent_coefficient(cfg, name):
+    w = cfg.get(name, 0.0)
     # ROMANCE PRIOR (ONLY WHEN NEEDED)
-    ROMANCE_TERMS = [
-        "love", "kiss", "heart", "darling",
-        "fall", "you", "us", "night", "baby"
-    ]
+    return max(w, 0.0) if name == "romance_bias" else w
 
-    romance_mask = df2["name"].str.lower().str.contains(
-        "|".join(ROMANCE_TERMS), na=False
-    )
 
-    if cfg.get("romance_bias", 0) > 0:
-        df2.loc[romance_mask, "score"] += cfg["romance_bias"]
-
-    # GAME OST REMOVAL
-    GAME_FRANCHISES = [
-        "pokemon", "pokémon", "zelda", "fire emblem",
-        "final fantasy", "chrono", "kingdom hearts",
-        "nintendo", "square enix", "capcom", "atlus"
-    ]
-
-    GAME_TERMS = [
-        "title screen", "main menu", "overworld",
-        "route", "battle", "boss", "stage", "level",
-        "theme from", "video game", "game music",
-        "game bgm", "game soundtrack", "from \""
-    ]
-
-    text_all = (
-        df2["name"].str.lower() + " " +
-        df2["artists"].astype(str).str.lower()
+def intent_static_score(feats, intent, rows=None):
+    """
+    Query-independent part of the hybrid score for one intent:
+    theme penalty, instrumental/popularity/neutral-distance terms and the
+    INTENT_CONFIG shaping. Preference-weighted terms are added per request.
+    """
+    cfg = INTENT_CONFIG[intent]
+    score, columns = intent_static_terms(feats, intent, rows)
+
+    # INTENT SHAPING
+    for name, col in columns.items():
+        w = intent_coefficient(cfg, name)
+        if w:
+            score += w * col
+    return score
+
+
+def build_intent_pools(feats):
+    """
+    Per intent: the allowed rows (after blacklist + game OST filtering)
+    and their precomputed static score.
+    """
+    rows = feats["allowed_rows"]
+    return {
+        intent: {"rows": rows, "static": intent_static_score(feats, intent, rows)}
+        for intent in INTENT_CONFIG
+    }
+
+
+def build_emotion_grid(feats):
+    """
+    Valence/energy grid over the allowed rows. Ids are positions into the
+    pool arrays, so a radius query selects rows and static scores together.
+    """
+    rows = feats["allowed_rows"]
+    return EmotionGrid(feats["valence"][rows], feats["energy"][rows])
+
+
+def load_store_genres(df, path=SONG_METADATA_PATH):
+    """
+    {catalog row: artist genres} for catalog tracks that SongStore has
+    metadata for (its "genres" are the Spotify artist genres).
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except Exception as e:
+        print("Could not read SongStore metadata for genres:", e)
+        return {}
+
+    row_of = {tid: i for i, tid in enumerate(df["id"].astype(str))}
+    extra = {}
+    for m in meta if isinstance(meta, list) else []:
+        row = row_of.get(str(m.get("spotify_id") or m.get("id")))
+        if row is not None and m.get("genres"):
+            extra[row] = m["genres"]
+    return extra
+
+
+def build_snapshot(version, path=None):
+    """Load the catalog and build every derived structure for one snapshot."""
+    path = path or FILE_PATH
+    df, emb_norm = load_catalog_frame(path)
+
+    snap = CatalogSnapshot(version, df, emb_norm, source=path)
+    snap.features = build_static_features(df)
+    snap.pools = build_intent_pools(snap.features)
+    snap.grid = build_emotion_grid(snap.features)
+    snap.metadata = MetadataStore(df, snap.features)
+    snap.genres = GenreIndex(len(df), df["genres"], extra=load_store_genres(df))
+    snap.reduced = reduction.load_or_fit(path, emb_norm)
+    snap.payloads = build_payload_table(df)
+    return snap
+
+
+CATALOG = CatalogManager(build_snapshot, watch_paths=[FILE_PATH])
+
+
+def neighbor_graph_async(snap, base=None):
+    """
+    Start building the snapshot's neighbor graph in a background thread
+    (once per snapshot). The build runs outside the snapshot lock, so other
+    derived() structures are not held up while it runs.
+    """
+
+    def run():
+        try:
+            graph = neighbor_graph.load_or_build(snap.source, snap, base=base)
+        except Exception:
+            traceback.print_exc()
+            return
+        snap.derived("neighbors", lambda s: graph)
+
+    def start(s):
+        t = threading.Thread(target=run, name=f"neighbors-v{s.version}", daemon=True)
+        t.start()
+        return t
+
+    return snap.derived("neighbors_build", start)
+
+
+def _build_neighbor_graph(old, new):
+    """Every new snapshot gets its graph in the background; a reload whose
+    catalog only gained rows extends the previous graph instead of rebuilding it."""
+    neighbor_graph_async(new, base=old.peek_derived("neighbors") if old is not None else None)
+
+
+CATALOG.subscribe(_build_neighbor_graph)
+
+
+# RANKING + DEDUPLICATION
+def tiebreak(rows, seed):
+    """Pseudo-random but reproducible key per (row, seed), used to order equal scores."""
+    x = rows.astype(np.uint64) + np.uint64(seed)
+    x ^= x >> np.uint64(33)
+    x *= np.uint64(0xFF51AFD7ED558CCD)
+    x ^= x >> np.uint64(33)
+    x *= np.uint64(0xC4CEB9FE1A85EC53)
+    x ^= x >> np.uint64(33)
+    return x
+
+
+def _first_per_key(keys, n_max=1):
+    """Mask keeping the first n_max occurrences of every key (keys already in rank order)."""
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    pos = np.arange(len(keys))
+    starts = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]] if len(keys) else np.zeros(0, bool)
+    group_start = np.maximum.accumulate(np.where(starts, pos, 0)) if len(keys) else pos
+    rank = np.empty(len(keys), dtype=np.int64)
+    rank[order] = pos - group_start
+    return rank < n_max
+
+
+def dedupe_ranked(ranked, feats):
+    """
+    Apply the dedup rules to rows already sorted best-first:
+    one row per song key, two per artist, two classical, one per title.
+    """
+    ranked = ranked[_first_per_key(feats["song_key"][ranked])]
+    ranked = ranked[_first_per_key(feats["artist_key"][ranked], 2)]
+    is_classical = feats["is_classical"][ranked]
+    ranked = ranked[~is_classical | (np.cumsum(is_classical) <= 2)]
+    ranked = ranked[_first_per_key(feats["name_key"][ranked])]
+    return ranked
+
+
+def rank_rows(rows, score, feats, depth, seed=None):
+    """
+    Return up to `depth` catalog rows, best first, after dedup.
+    Scores are clipped at 0 and ties are broken by a seeded pseudo-random key.
+    Only a top window is sorted; it is widened until it yields `depth` rows.
+    """
+    score = np.clip(score, 0, None)
+    n = len(rows)
+    if seed is None:
+        seed = np.random.randint(0, 2**31)
+    tie = tiebreak(rows, seed)
+
+    window = min(n, max(depth * 8, 64))
+    while True:
+        top = top_window(score, tie, window)
+        ranked = dedupe_ranked(rows[top], feats)
+        if len(ranked) >= depth or window >= n:
+            return ranked[:depth]
+        window = min(n, window * 4)
+
+
+def top_window(score, tie, window):
+    """
+    Positions of the best `window` entries ordered by (score desc, tie asc).
+    Entries tied with the cut-off score are all considered, so the result is
+    exactly the first `window` of the full sort.
+    """
+    n = len(score)
+    if window < n:
+        part = np.argpartition(-score, window - 1)[:window]
+        cut = score[part].min()
+        top = np.concatenate([np.flatnonzero(score > cut), np.flatnonzero(score == cut)])
+    else:
+        top = np.arange(n)
+    top = top[np.lexsort((tie[top], -score[top]))]
+    return top[:window]
+
+
+def select_candidates(snap, intent, v, a, row_ids=None, exclude=None):
+    """
+    Rows of the intent pool within the emotion cutoff of (v, a), with their
+    static scores and emotion distances.
+
+    row_ids (sorted catalog rows, e.g. from MetadataStore.select_rows) is
+    pushed down first: a narrow selection is intersected with the pool and
+    scored directly, a wide one goes through the emotion grid and is masked.
+    exclude is a row bitmap (see session_history) of rows to drop.
+    """
+    pool = snap.pools[intent]
+    cutoff = EMOTION_CUTOFF.get(intent, DEFAULT_EMOTION_CUTOFF)
+    feats = snap.features
+
+    if row_ids is not None and len(row_ids) < len(pool["rows"]) // 4:
+        pool_rows = pool["rows"]
+        pos = np.searchsorted(pool_rows, row_ids)
+        valid = pos < len(pool_rows)
+        pos = pos[valid]
+        pos = pos[pool_rows[pos] == row_ids[valid]]
+        rows = pool_rows[pos]
+        dist = np.sqrt((feats["valence"][rows] - v) ** 2 + (feats["energy"][rows] - a) ** 2)
+        keep = dist < cutoff
+        rows, static, dist = rows[keep], pool["static"][pos[keep]], dist[keep]
+    else:
+        pos, dist = snap.grid.radius_query(v, a, cutoff)
+        rows = pool["rows"][pos]
+        static = pool["static"][pos]
+
+        if row_ids is not None:
+            mask = np.zeros(len(snap), dtype=bool)
+            mask[row_ids] = True
+            keep = mask[rows]
+            rows, static, dist = rows[keep], static[keep], dist[keep]
+
+    if exclude is not None:
+        keep = ~test_rows(exclude, rows)
+        rows, static, dist = rows[keep], static[keep], dist[keep]
+
+    return rows, static, dist
+
+
+def track_payload(r):
+    return {
+        "id": r["id"],
+        "name": r["name"],
+        "artists": r["artists"],
+        "album_image": None,
+        "preview_url": None,
+        "external_url": f"https://open.spotify.com/track/{r['id']}"
+    }
+
+
+def track_payloads(snap, rows):
+    return [track_payload(snap.df.iloc[i]) for i in rows]
+
+
+def build_payload_table(df):
+    """track_payload of every row, serialized once per snapshot (see fast_json.PayloadTable)."""
+    cols = zip(df["id"].tolist(), df["name"].tolist(), df["artists"].tolist())
+    return PayloadTable(
+        fast_json.dumps(track_payload({"id": i, "name": n, "artists": a})) for i, n, a in cols
     )
 
-    is_game_ost = (
-        text_all.str.contains("|".join(GAME_FRANCHISES), na=False) |
-        text_all.str.contains("|".join(GAME_TERMS), na=False)
+
+# HYBRID RANKING
+def _query_context(query_embed, a, hex_color=None, user_taste=None, preferences=None):
+    """Everything per query that the scoring of any row subset needs."""
+    # SAFETY
+    query_embed = np.asarray(query_embed, dtype=np.float32)[:512]
+    assert query_embed.shape[0] == 512, f"BAD QUERY EMBED SHAPE: {query_embed.shape}"
+
+    preferences = {**DEFAULT_PREFERENCES, **(preferences or {})}
+    intent = color_to_intent(hex_color)
+    cfg = INTENT_CONFIG[intent]
+
+    return {
+        "intent": intent,
+        "a": 0.7 * a + 0.3 * USER_PROFILE["energy_pref"],
+        "w_clap": preferences["w_clap"] * cfg["clap_weight"],
+        "w_emo": preferences["w_emotion"],
+        "w_mod": preferences["w_modern"],
+        "w_energy_pref": preferences["w_energy_pref"],
+        "genre_weights": taste_genre_weights(user_taste),
+        "vec_norm": query_embed / (np.linalg.norm(query_embed) + 1e-9),
+    }
+
+
+def _base_score(snap, ctx, rows, static, emotion_dist):
+    """Hybrid score of candidate rows without the CLAP term."""
+    feats = snap.features
+    energy = feats["energy"][rows]
+
+    # BASE SCORE + precomputed static part
+    score = (
+        ctx["w_emo"] * np.exp(-3.5 * emotion_dist)
+        + ctx["w_mod"] * feats["year_norm"][rows]
+        + ctx["w_energy_pref"] * (1 - np.abs(energy - ctx["a"]))
+        + static
     )
 
-    is_allowed = text_all.str.contains("|".join(ALLOW_TERMS), na=False)
+    # USER TASTE BIAS (sparse: only rows tagged with the user's genres)
+    if ctx["genre_weights"]:
+        # small but meaningful boost, full for the user's top genre
+        score += TASTE_BOOST * snap.genres.boost(rows, ctx["genre_weights"])
+    return score
 
-    df2 = df2[~(is_game_ost & ~is_allowed)]
-    if user_profile["avoid_game_ost"]:
-        df2 = df2[~is_game_ost]
 
-    # CLASSICAL DETECTION 
-    CLASSICAL_TERMS = [
-        "bach", "chopin", "mozart", "beethoven",
-        "prelude", "sonata", "symphony",
-        "concerto", "op.", "opus", "movement"
-    ]
+def _clap_score(snap, ctx, rows):
+    """Weighted CLAP similarity, in SCORE_CHUNK_ROWS blocks so each gather stays cache-sized."""
+    out = np.empty(len(rows), dtype=np.float32)
+    for b in range(0, len(rows), SCORE_CHUNK_ROWS):
+        block = rows[b:b + SCORE_CHUNK_ROWS]
+        out[b:b + SCORE_CHUNK_ROWS] = snap.emb_norm[block] @ ctx["vec_norm"]
+    return ctx["w_clap"] * out
 
-    def classical_mask_fn(frame):
-        return (
-            frame["name"].str.lower().str.contains("|".join(CLASSICAL_TERMS), na=False)
-            | frame["artists"].astype(str).str.lower().str.contains("|".join(CLASSICAL_TERMS), na=False)
-        )
 
-    # STABILITY + DEDUPLICATION
-    df2 = df2.reset_index(drop=True)
-    df2["score"] = df2["score"].clip(lower=0)
+def score_candidates(
+    query_embed,
+    v,
+    a,
+    hex_color=None,
+    user_taste=None,
+    preferences=None,
+    row_ids=None,
+    exclude=None,
+    snapshot=None,
+    limit=None
+):
+    """
+    Hybrid scores for one query: (rows, score, truncated).
+
+    With `limit` and a reduced embedding copy on the snapshot, only the best
+    `limit` candidates by coarse score are kept and rescored exactly
+    (truncated=True); otherwise every candidate is scored at 512-d.
+    """
+    snap = snapshot or CATALOG.current()
+    ctx = _query_context(query_embed, a, hex_color, user_taste, preferences)
 
-    df2["song_key"] = (
-        df2["name"].str.lower().str.strip()
-        + "___"
-        + df2["artists"].astype(str).str.lower().str.strip()
+    # EMOTION SCORE (only rows inside the intent cutoff)
+    rows, static, emotion_dist = select_candidates(
+        snap, ctx["intent"], v, ctx["a"], row_ids=row_ids, exclude=exclude
     )
+    return _score_selected(snap, ctx, rows, static, emotion_dist, limit)
+
 
-    df2 = df2.sort_values("score", ascending=False)
-    df2 = df2.drop_duplicates("song_key", keep="first")
+def _score_selected(snap, ctx, rows, static, emotion_dist, limit=None):
+    score = _base_score(snap, ctx, rows, static, emotion_dist)
 
-    df2["_artist_key"] = df2["artists"].astype(str)
-    df2 = df2.groupby("_artist_key", as_index=False).head(2)
+    # COARSE PASS: reduced-dim CLAP similarity on every candidate,
+    # exact 512-d rescoring of the best `limit` only
+    if limit is not None and snap.reduced is not None and len(rows) > limit:
+        coarse = score + ctx["w_clap"] * snap.reduced.scores(ctx["vec_norm"], rows)
+        top = np.sort(np.argpartition(-coarse, limit - 1)[:limit])
+        rows = rows[top]
+        return rows, score[top] + _clap_score(snap, ctx, rows), True
+
+    # CLAP SIMILARITY (only on surviving rows)
+    return rows, score + _clap_score(snap, ctx, rows), False
+
+
+def complete_prefix(score, tie, bounds):
+    """
+    Length of the prefix of a merged (score desc, tie asc) order that is
+    final, given the (score, tie) of the last entry of every partial list
+    that was cut short: anything ranked after such an entry may be missing.
+    """
+    n = len(score)
+    for last_score, last_tie in bounds:
+        after = (score < last_score) | ((score == last_score) & (tie > last_tie))
+        if after.any():
+            n = min(n, int(np.argmax(after)))
+    return n
 
-    classical_df = df2[classical_mask_fn(df2)].sort_values("score", ascending=False).head(2)
-    non_classical_df = df2[~classical_mask_fn(df2)]
-    df2 = pd.concat([non_classical_df, classical_df], ignore_index=True)
 
-    df2 = df2.sample(frac=1, random_state=None)
+def _rank_parallel(snap, ctx, rows, static, emotion_dist, depth, seed, tasks):
+    """
+    rank_rows over contiguous candidate chunks scored on the scoring pool:
+    every chunk keeps a local top window, the windows are merged, and the
+    complete part of the merge is deduped. Same result as exact serial ranking.
+    """
+    window = max(depth * 8, 64)
+    bounds = np.linspace(0, len(rows), tasks + 1).astype(int)
+
+    def run(i):
+        sl = slice(bounds[i], bounds[i + 1])
+        chunk = rows[sl]
+        score = _base_score(snap, ctx, chunk, static[sl], emotion_dist[sl])
+        score = np.clip(score + _clap_score(snap, ctx, chunk), 0, None)
+        tie = tiebreak(chunk, seed)
+        return chunk, score, tie, top_window(score, tie, window)
+
+    parts = SCORING.map(run, range(tasks))
+
+    top_rows = np.concatenate([c[t] for c, _, _, t in parts])
+    top_score = np.concatenate([s[t] for _, s, _, t in parts])
+    top_tie = np.concatenate([k[t] for _, _, k, t in parts])
+    order = np.lexsort((top_tie, -top_score))
+    cut_short = [(s[t[-1]], k[t[-1]]) for _, s, k, t in parts if 0 < len(t) < len(s)]
+    n = complete_prefix(top_score[order], top_tie[order], cut_short)
+
+    ranked = dedupe_ranked(top_rows[order][:n], snap.features)
+    if len(ranked) >= depth or not cut_short:
+        return ranked[:depth]
+
+    # dedup ate the merged windows: rank every scored row
+    all_rows = np.concatenate([c for c, _, _, _ in parts])
+    all_score = np.concatenate([s for _, s, _, _ in parts])
+    return rank_rows(all_rows, all_score, snap.features, depth=depth, seed=seed)
+
+
+def rank_hybrid(
+    query_embed,
+    v,
+    a,
+    hex_color=None,
+    user_taste=None,
+    preferences=None,
+    depth=10,
+    row_ids=None,
+    exclude=None,
+    seed=None,
+    snapshot=None,
+    rerank_candidates=None
+):
+    """
+    Score the candidates for one query and return up to `depth` catalog
+    rows, best first, after dedup.
+
+    Above RERANK_CANDIDATES rows (and with a reduced embedding copy) the
+    coarse pass runs first and only its best RERANK_CANDIDATES are scored
+    exactly. Both passes are split into chunks on the scoring pool when it
+    has threads to spare (see _coarse_select, _rank_parallel). A caller
+    short on time passes a smaller rerank_candidates (always serial).
+    """
+    snap = snapshot or CATALOG.current()
+    if seed is None:
+        seed = np.random.randint(0, 2**31)
+
+    with SCORING.request():
+        ctx = _query_context(query_embed, a, hex_color, user_taste, preferences)
+        rows, static, emotion_dist = select_candidates(
+            snap, ctx["intent"], v, ctx["a"], row_ids=row_ids, exclude=exclude
+        )
+        tasks = SCORING.plan(len(rows)) if rerank_candidates is None else 1
+
+        kept, kept_static, kept_dist, truncated = _coarse_select(
+            snap, ctx, rows, static, emotion_dist, rerank_candidates or RERANK_CANDIDATES, tasks
+        )
+        ranked = _rank_exact(snap, ctx, kept, kept_static, kept_dist, depth, seed, tasks)
+        if truncated and len(ranked) < depth:
+            # dedup ate too many candidates: fall back to exact scoring of all rows
+            ranked = _rank_exact(snap, ctx, rows, static, emotion_dist, depth, seed, tasks)
+        return ranked
+
+
+def _coarse_select(snap, ctx, rows, static, emotion_dist, limit, tasks=1):
+    """
+    The best `limit` candidates by coarse score (base score + reduced-dim
+    CLAP), in row order, with their static scores and emotion distances.
+    Returns the input unchanged (truncated=False) when there is nothing to
+    cut. With tasks > 1 every chunk keeps its own top `limit` on the
+    scoring pool and the chunk winners are cut again.
+    """
+    if limit is None or snap.reduced is None or len(rows) <= limit:
+        return rows, static, emotion_dist, False
+
+    def run(sl):
+        score = _base_score(snap, ctx, rows[sl], static[sl], emotion_dist[sl])
+        coarse = score + ctx["w_clap"] * snap.reduced.scores(ctx["vec_norm"], rows[sl])
+        if len(coarse) > limit:
+            top = np.argpartition(-coarse, limit - 1)[:limit]
+        else:
+            top = np.arange(len(coarse))
+        return top + sl.start, coarse[top]
+
+    bounds = np.linspace(0, len(rows), tasks + 1).astype(int)
+    slices = [slice(bounds[i], bounds[i + 1]) for i in range(tasks)]
+    parts = SCORING.map(run, slices) if tasks > 1 else [run(slices[0])]
+
+    pos = np.concatenate([p for p, _ in parts])
+    coarse = np.concatenate([c for _, c in parts])
+    if len(pos) > limit:
+        pos = pos[np.argpartition(-coarse, limit - 1)[:limit]]
+    pos.sort()
+    return rows[pos], static[pos], emotion_dist[pos], True
+
+
+def _rank_exact(snap, ctx, rows, static, emotion_dist, depth, seed, tasks=1):
+    """rank_rows over exact 512-d scores, in parallel chunks when tasks > 1 and the rows warrant it."""
+    tasks = min(tasks, max(1, len(rows) // SCORING.min_task_rows))
+    if tasks > 1:
+        return _rank_parallel(snap, ctx, rows, static, emotion_dist, depth, seed, tasks)
+    scored, score, _ = _score_selected(snap, ctx, rows, static, emotion_dist)
+    return rank_rows(scored, score, snap.features, depth=depth, seed=seed)
+
+
+def precomputed_ranking(snap, hex_color, v, a, depth):
+    """
+    Ranking by the hybrid score without the CLAP term (no encoder needed),
+    built once per (intent, v, a to 0.1) and snapshot. The cheapest
+    degradation tier of /recommend.
+    """
+    v, a = round(float(v), 1), round(float(a), 1)
+    intent = color_to_intent(hex_color)
+    table = snap.derived("precomputed_rankings", lambda s: {})
+    key = (intent, v, a, depth)
+    ranked = table.get(key)
+    if ranked is None:
+        ctx = _query_context(np.zeros(512, dtype=np.float32), a, hex_color)
+        rows, static, emotion_dist = select_candidates(snap, intent, v, ctx["a"])
+        score = _base_score(snap, ctx, rows, static, emotion_dist)
+        ranked = table[key] = rank_rows(rows, score, snap.features, depth=depth, seed=0)
+    return ranked
+
+
+# SIMILAR TRACKS
+def similar_tracks(snap, row, k=10):
+    """
+    (rows, scores) of up to k tracks like catalog `row`, read from the
+    snapshot's neighbor graph and deduped with the ranking rules; other
+    versions of the same song are dropped. None while the graph is still
+    being built in the background (never built on the calling thread).
+    """
+    graph = snap.peek_derived("neighbors")
+    if graph is None:
+        neighbor_graph_async(snap)
+        return None
+    rows, scores = graph.lookup(row)
+    feats = snap.features
+    keep = feats["song_key"][rows] != feats["song_key"][row]
+    rows, scores = rows[keep], scores[keep]
+    kept = np.isin(rows, dedupe_ranked(rows, feats))
+    return rows[kept][:k], scores[kept][:k]
+
+
+# FINAL HYBRID RECOMMENDER
+def recommend_hybrid(
+    query_embed,
+    v,
+    a,
+    hex_color=None,
+    user_taste=None,
+    preferences=None,
+    limit=10,
+    df_subset=None,
+    seed=None,
+    snapshot=None,
+    row_ids=None,
+    exclude=None
+):
+    snap = snapshot or CATALOG.current()
+
+    if df_subset is not None:
+        subset = df_subset.index.to_numpy()
+        row_ids = subset if row_ids is None else np.intersect1d(row_ids, subset)
+
+    ranked = rank_hybrid(
+        query_embed, v, a,
+        hex_color=hex_color,
+        user_taste=user_taste,
+        preferences=preferences,
+        depth=limit,
+        row_ids=row_ids,
+        exclude=exclude,
+        seed=seed,
+        snapshot=snap,
+    )
 
     # FINAL RETURN
-    top = df2.sort_values("score", ascending=False).head(limit * 2)
-
-    seen = set()
-    final = []
-
-    for _, r in top.iterrows():
-        key = r["name"].lower()
-        if key in seen:
-            continue
-        seen.add(key)
-        final.append(r)
-        if len(final) == limit:
-            break
-
-    return [
-        {
-            "id": r["id"],
-            "name": r["name"],
-            "artists": r["artists"],
-            "album_image": None,
-            "preview_url": None,
-            "external_url": f"https://open.spotify.com/track/{r['id']}"
-        }
-        for r in final
-    ]
+    return track_payloads(snap, ranked)
@@ -0,0 +1,277 @@
+# app/utils/metrics.py
+import os
+import json
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Latency buckets in seconds (Prometheus convention)
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+LOG_SAMPLE_RATE = float(os.getenv("SHIKISAI_LOG_SAMPLE_RATE", "0.01"))
+
+logger = logging.getLogger("shikisai")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, values) -> str:
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed buckets, one series per label combination.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [bucket counts..., sum, count]
+                series = [0] * len(self.buckets) + [0.0, 0]
+                self._series[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        for key, series in sorted(items):
+            for i, bound in enumerate(self.buckets):
+                labels = _format_labels(self.labelnames + ("le",), key + (repr(bound),))
+                lines.append(f"{self.name}_bucket{labels} {series[i]}")
+            labels = _format_labels(self.labelnames + ("le",), key + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {series[-2]}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter, one series per label combination."""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge:
+    """
+    Gauge whose value is either set explicitly or read from a callback at scrape time.
+    A callback may return a number or a dict {label_values_tuple: number}.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), fn: Optional[Callable] = None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def _collect(self) -> Dict[Tuple, float]:
+        if self.fn is None:
+            with self._lock:
+                return dict(self._values)
+        try:
+            value = self.fn()
+        except Exception:
+            return {}
+        if value is None:
+            return {}
+        if isinstance(value, dict):
+            return {tuple(k) if isinstance(k, tuple) else (k,): float(v) for k, v in value.items()}
+        return {(): float(value)}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for key, value in sorted(self._collect().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class CacheStats:
+    """Hit/miss bookkeeping for an in-process cache, exported as a hit-ratio gauge."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def hit(self, n: int = 1):
+        with self._lock:
+            self.hits += n
+
+    def miss(self, n: int = 1):
+        with self._lock:
+            self.misses += n
+
+    @property
+    def hit_ratio(self) -> float:
+        with self._lock:
+            hits, total = self.hits, self.hits + self.misses
+        return hits / total if total else 0.0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._caches: Dict[str, CacheStats] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=(), fn=None) -> Gauge:
+        return self._register(Gauge(name, help, labelnames, fn))
+
+    def cache(self, name: str) -> CacheStats:
+        """Return (creating if needed) the CacheStats registered under name."""
+        with self._lock:
+            stats = self._caches.get(name)
+            if stats is None:
+                stats = CacheStats(name)
+                self._caches[name] = stats
+            return stats
+
+    def cache_hit_ratios(self) -> Dict[str, float]:
+        with self._lock:
+            return {name: s.hit_ratio for name, s in self._caches.items()}
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "shikisai_request_seconds",
+    "End-to-end request latency.",
+    labelnames=("endpoint",),
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "shikisai_stage_seconds",
+    "Latency of individual pipeline stages.",
+    labelnames=("endpoint", "stage"),
+)
+REGISTRY.gauge(
+    "shikisai_cache_hit_ratio",
+    "Hit ratio of in-process caches since start.",
+    labelnames=("cache",),
+    fn=REGISTRY.cache_hit_ratios,
+)
+
+
+# Per-request stage timings (read back for the Server-Timing header)
+_current: ContextVar[Optional[Tuple[str, List]]] = ContextVar("shikisai_timings", default=None)
+
+
+def begin_request(endpoint: str) -> List:
+    """
+    Start collecting stage timings for the current request.
+    Returns the list that stage() appends (name, seconds) pairs to.
+    """
+    timings: List = []
+    _current.set((endpoint, timings))
+    return timings
+
+
+@contextmanager
+def stage(name: str):
+    """Time a pipeline stage; records into the histogram and the current request."""
+    current = _current.get()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        endpoint = current[0] if current else ""
+        STAGE_SECONDS.observe(elapsed, endpoint=endpoint, stage=name)
+        if current is not None:
+            current[1].append((name, elapsed))
+
+
+def server_timing_header(timings: List, total: Optional[float] = None) -> str:
+    """Format (name, seconds) pairs as a Server-Timing header value (durations in ms)."""
+    parts = [f"{name};dur={elapsed * 1000:.2f}" for name, elapsed in timings]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
+
+
+# Sampled structured logging
+def log_event(event: str, sample_rate: Optional[float] = None, **fields):
+    """
+    Emit a JSON log line for a fraction of calls.
+    Hot paths should call this instead of print(); sample_rate=1.0 always logs.
+    """
+    rate = LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+    if rate < 1.0 and random.random() >= rate:
+        return
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    record = {"event": event, "ts": round(time.time(), 3)}
+    record.update(fields)
+    logger.info(json.dumps(record, default=str, ensure_ascii=False))
@@ -0,0 +1,207 @@
+# app/utils/neighbor_graph.py
+"""
+Precomputed "more like this" graph over the catalog.
+
+Every row keeps its k nearest neighbors under a blended similarity:
+
+    sim(i, j) = cos(emb_i, emb_j) - VA_WEIGHT * |(v_i, e_i) - (v_j, e_j)| / sqrt(2)
+
+Candidates come from batched FAISS inner-product searches over the whole
+matrix (k * OVERFETCH per row), re-scored with the valence/energy term and
+cut to k. The result is two (n, k) arrays, int32 rows and float16 scores,
+so a lookup is a slice. Missing slots hold row -1.
+
+The catalog is exported from SongStore in insertion order, so new tracks
+arrive as rows appended to the end: extend() adds them without touching
+the rest of the graph beyond inserting the new rows into the lists they
+now belong to.
+"""
+import os
+from typing import Optional, Tuple
+
+import faiss
+import numpy as np
+
+from app.utils.reduction import fingerprint
+
+NEIGHBORS_K = int(os.getenv("SHIKISAI_NEIGHBORS_K", "50"))
+NEIGHBORS_VA_WEIGHT = float(os.getenv("SHIKISAI_NEIGHBORS_VA_WEIGHT", "0.3"))
+NEIGHBORS_OVERFETCH = 4  # cosine candidates per slot before the valence/energy re-score
+SEARCH_BATCH = 4096  # query rows per FAISS search
+
+
+def blended(emb: np.ndarray, va: np.ndarray, rows: np.ndarray, cand: np.ndarray, cos: np.ndarray,
+            va_weight: float) -> np.ndarray:
+    """Blend (len(rows), C) cosine scores of rows -> cand with their valence/energy distance."""
+    dist = np.linalg.norm(va[rows][:, None, :] - va[cand], axis=2) / np.sqrt(2)
+    return cos - va_weight * dist
+
+
+class NeighborGraph:
+    """Top-k blended neighbors of every catalog row."""
+
+    def __init__(self, ids: np.ndarray, neighbors: np.ndarray, scores: np.ndarray,
+                 fingerprint: np.ndarray, va_weight: float = NEIGHBORS_VA_WEIGHT):
+        self.ids = np.asarray(ids, dtype=str)
+        self.neighbors = np.ascontiguousarray(neighbors, dtype=np.int32)
+        self.scores = np.ascontiguousarray(scores, dtype=np.float16)
+        self.fingerprint = fingerprint
+        self.va_weight = float(va_weight)
+
+    def __len__(self):
+        return len(self.neighbors)
+
+    @property
+    def k(self) -> int:
+        return self.neighbors.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.neighbors.nbytes + self.scores.nbytes
+
+    def lookup(self, row: int, k: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, scores) of row's nearest neighbors, best first."""
+        nb = self.neighbors[row, :k]
+        keep = nb >= 0
+        return nb[keep], self.scores[row, :k][keep].astype(np.float32)
+
+    # Build
+    @staticmethod
+    def _search(index, emb: np.ndarray, va: np.ndarray, rows: np.ndarray, k: int, va_weight: float,
+                batch: int = SEARCH_BATCH) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k blended neighbors (self excluded) of `rows` against everything in index."""
+        c = min(index.ntotal, k * NEIGHBORS_OVERFETCH + 1)
+        out_nb = np.full((len(rows), k), -1, dtype=np.int32)
+        out_sc = np.full((len(rows), k), -np.inf, dtype=np.float32)
+        for start in range(0, len(rows), batch):
+            chunk = rows[start:start + batch]
+            cos, cand = index.search(emb[chunk], c)
+            score = blended(emb, va, chunk, np.maximum(cand, 0), cos, va_weight)
+            score[(cand < 0) | (cand == chunk[:, None])] = -np.inf
+            kk = min(k, c)
+            top = np.argpartition(-score, kk - 1, axis=1)[:, :kk]
+            top_sc = np.take_along_axis(score, top, axis=1)
+            order = np.argsort(-top_sc, axis=1, kind="stable")
+            top = np.take_along_axis(top, order, axis=1)
+            top_sc = np.take_along_axis(top_sc, order, axis=1)
+            nb = np.take_along_axis(cand, top, axis=1)
+            nb[~np.isfinite(top_sc)] = -1
+            out_nb[start:start + len(chunk), :kk] = nb
+            out_sc[start:start + len(chunk), :kk] = top_sc
+        return out_nb, out_sc
+
+    @classmethod
+    def build(cls, ids, emb: np.ndarray, va: np.ndarray, k: int = NEIGHBORS_K,
+              va_weight: float = NEIGHBORS_VA_WEIGHT, batch: int = SEARCH_BATCH) -> "NeighborGraph":
+        """emb: (n, d) normalized embeddings; va: (n, 2) valence/energy."""
+        emb = np.ascontiguousarray(emb, dtype=np.float32)
+        va = np.asarray(va, dtype=np.float32)
+        index = faiss.IndexFlatIP(emb.shape[1])
+        index.add(emb)
+        nb, sc = cls._search(index, emb, va, np.arange(len(emb)), k, va_weight, batch)
+        return cls(ids, nb, sc, fingerprint(emb), va_weight)
+
+    def extend(self, ids, emb: np.ndarray, va: np.ndarray, batch: int = SEARCH_BATCH) -> "NeighborGraph":
+        """
+        Graph for a catalog whose first len(self) rows are this graph's rows
+        (emb/va cover the whole new catalog). New rows get full searches;
+        existing rows only gain new rows that beat their current k-th slot.
+        Candidates for that come from the new rows' searches (the blended
+        similarity is symmetric), so an old row can miss a new neighbor that
+        ranked outside the new row's candidates; a full build fixes that.
+        """
+        n_old = len(self)
+        emb = np.ascontiguousarray(emb, dtype=np.float32)
+        va = np.asarray(va, dtype=np.float32)
+        new_rows = np.arange(n_old, len(emb))
+        k = self.k
+        if len(new_rows) == 0:
+            return NeighborGraph(ids, self.neighbors, self.scores, fingerprint(emb), self.va_weight)
+
+        index = faiss.IndexFlatIP(emb.shape[1])
+        index.add(emb)
+        c = min(index.ntotal, k * NEIGHBORS_OVERFETCH + 1)
+        new_nb, new_sc = self._search(index, emb, va, new_rows, k, self.va_weight, batch)
+
+        neighbors = np.vstack([self.neighbors, new_nb])
+        scores = np.vstack([self.scores.astype(np.float32), new_sc])
+
+        # reverse edges: old row j gains new row x when sim(j, x) beats j's worst slot
+        reverse_j, reverse_x, reverse_s = [], [], []
+        for start in range(0, len(new_rows), batch):
+            chunk = new_rows[start:start + batch]
+            cos, cand = index.search(emb[chunk], c)
+            score = blended(emb, va, chunk, np.maximum(cand, 0), cos, self.va_weight)
+            hit = (cand >= 0) & (cand < n_old)
+            hit[hit] &= score[hit] > scores[cand[hit], -1]
+            reverse_j.append(cand[hit])
+            reverse_x.append(np.broadcast_to(chunk[:, None], cand.shape)[hit])
+            reverse_s.append(score[hit])
+        j = np.concatenate(reverse_j)
+        x = np.concatenate(reverse_x)
+        s = np.concatenate(reverse_s)
+
+        order = np.argsort(j, kind="stable")
+        j, x, s = j[order], x[order], s[order]
+        bounds = np.flatnonzero(np.r_[True, j[1:] != j[:-1], True]) if len(j) else np.zeros(1, dtype=np.int64)
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            row = j[a]
+            nb = np.r_[neighbors[row], x[a:b]]
+            sc = np.r_[scores[row], s[a:b]]
+            top = np.argsort(-sc, kind="stable")[:k]
+            neighbors[row] = nb[top]
+            scores[row] = sc[top]
+
+        print(f"[NeighborGraph] Extended {n_old} -> {len(emb)} rows ({len(bounds) - 1} existing rows updated)")
+        return NeighborGraph(ids, neighbors, scores, fingerprint(emb), self.va_weight)
+
+    # Storage
+    def save(self, path: str):
+        np.savez(
+            path, ids=self.ids, neighbors=self.neighbors, scores=self.scores,
+            fingerprint=self.fingerprint, va_weight=self.va_weight,
+        )
+
+
+def catalog_inputs(snap) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(ids, emb, va) of a catalog snapshot."""
+    feats = snap.features
+    va = np.stack([feats["valence"], feats["energy"]], axis=1)
+    return snap.df["id"].astype(str).to_numpy(), snap.emb_norm, va
+
+
+def graph_path(catalog_path: str, k: int = NEIGHBORS_K) -> str:
+    """Where the offline graph for a catalog lives: next to the CSV."""
+    return f"{os.path.splitext(catalog_path)[0]}.neighbors{k}.npz"
+
+
+def load(path: str) -> Optional[NeighborGraph]:
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as z:
+        return NeighborGraph(z["ids"], z["neighbors"], z["scores"], z["fingerprint"], float(z["va_weight"]))
+
+
+def is_prefix(graph: NeighborGraph, ids: np.ndarray, emb: np.ndarray) -> bool:
+    """True if the graph was built from the first len(graph) rows of this catalog."""
+    n = len(graph)
+    if n > len(ids) or not np.array_equal(graph.ids, ids[:n]):
+        return False
+    fp = fingerprint(emb[:n])
+    return graph.fingerprint.shape == fp.shape and np.allclose(graph.fingerprint, fp, rtol=1e-4, atol=1e-3)
+
+
+def load_or_build(catalog_path: str, snap, k: int = NEIGHBORS_K, base: Optional[NeighborGraph] = None) -> NeighborGraph:
+    """
+    Graph for a snapshot: `base` or the offline file, extended if the catalog
+    has grown since; built in process when neither matches.
+    """
+    ids, emb, va = catalog_inputs(snap)
+    for graph in (base, load(graph_path(catalog_path, k))):
+        if graph is None or graph.k != k or graph.va_weight != NEIGHBORS_VA_WEIGHT:
+            continue
+        if is_prefix(graph, ids, emb):
+            return graph if len(graph) == len(ids) else graph.extend(ids, emb, va)
+    graph = NeighborGraph.build(ids, emb, va, k)
+    print(f"[NeighborGraph] Built {len(graph)} x {k} graph in process (no matching offline file)")
+    return graph
@@ -0,0 +1,71 @@
+# app/utils/parallel_scoring.py
+import os
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils import metrics
+
+SCORE_THREADS = int(os.getenv("SHIKISAI_SCORE_THREADS", str(os.cpu_count() or 1)))
+SCORE_CHUNK_ROWS = int(os.getenv("SHIKISAI_SCORE_CHUNK_ROWS", "2048"))
+SCORE_MIN_TASK_ROWS = int(os.getenv("SHIKISAI_SCORE_MIN_TASK_ROWS", "8192"))
+
+RANK_TASKS = metrics.REGISTRY.histogram(
+    "shikisai_rank_parallel_tasks",
+    "Parallel scoring tasks used per ranking (1 = serial).",
+    buckets=(1, 2, 4, 8, 16, 32),
+)
+
+
+class ScoringPool:
+    """
+    Shared thread pool for intra-request scoring.
+
+    Each ranking asks plan() how many tasks to split its candidates into:
+    the threads are shared out between the rankings in flight, so a lone
+    request uses every core and a busy worker falls back to serial scoring
+    (tasks = 1) instead of oversubscribing. NumPy releases the GIL in the
+    heavy parts (gathers, matmuls, ufuncs), so tasks overlap on real cores.
+    """
+
+    def __init__(self, threads: int = SCORE_THREADS, min_task_rows: int = SCORE_MIN_TASK_ROWS):
+        self.threads = max(1, threads)
+        self.min_task_rows = min_task_rows
+        self._inflight = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    @contextmanager
+    def request(self):
+        """Count one ranking as in flight for the duration of the block."""
+        with self._lock:
+            self._inflight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._inflight -= 1
+
+    def plan(self, n_rows: int) -> int:
+        """Tasks for scoring n_rows candidates now (1 = score serially)."""
+        if self.threads <= 1:
+            tasks = 1
+        else:
+            share = max(1, self.threads // max(1, self._inflight))
+            tasks = max(1, min(share, n_rows // self.min_task_rows))
+        RANK_TASKS.observe(tasks)
+        return tasks
+
+    def map(self, fn, items):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.threads, thread_name_prefix="score")
+        return list(self._executor.map(fn, items))
+
+
+SCORING = ScoringPool()
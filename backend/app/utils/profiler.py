@@ -0,0 +1,140 @@
+# app/utils/profiler.py
+import io
+import functools
+import time
+import marshal
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+
+class ProfileCapture:
+    """
+    On-demand cProfile capture for a bounded window of requests.
+
+    start(requests=N, seconds=T) arms the capture; every request wrapped in
+    capture() while armed is profiled and merged into one pstats.Stats.
+    Only one request is profiled at a time (cProfile is per-thread and
+    profilers cannot overlap), concurrent requests are simply not sampled.
+    While disarmed, capture() does nothing beyond one attribute check.
+    """
+
+    def __init__(self):
+        self.active = False
+        self._lock = threading.Lock()
+        self._busy = threading.Lock()
+        self._remaining: Optional[int] = None
+        self._deadline: Optional[float] = None
+        self._stats: Optional[pstats.Stats] = None
+        self._captured = 0
+        self._started_at: Optional[float] = None
+
+    def start(self, requests: Optional[int] = None, seconds: Optional[float] = None):
+        if requests is None and seconds is None:
+            raise ValueError("Give requests and/or seconds")
+        with self._lock:
+            self._remaining = requests
+            self._deadline = time.monotonic() + seconds if seconds else None
+            self._stats = None
+            self._captured = 0
+            self._started_at = time.time()
+            self.active = True
+
+    def stop(self):
+        with self._lock:
+            self.active = False
+
+    def _expired(self) -> bool:
+        if self._remaining is not None and self._remaining <= 0:
+            return True
+        if self._deadline is not None and time.monotonic() >= self._deadline:
+            return True
+        return False
+
+    @contextmanager
+    def capture(self):
+        if not self.active:
+            yield
+            return
+
+        with self._lock:
+            if self._expired():
+                self.active = False
+                sampled = False
+            else:
+                sampled = self._busy.acquire(blocking=False)
+                if sampled and self._remaining is not None:
+                    self._remaining -= 1
+
+        if not sampled:
+            yield
+            return
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+        finally:
+            self._busy.release()
+            self._merge(profiler)
+
+    def _merge(self, profiler: cProfile.Profile):
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profiler)
+            else:
+                self._stats.add(profiler)
+            self._captured += 1
+            if self._expired():
+                self.active = False
+
+    def status(self) -> dict:
+        with self._lock:
+            if self.active and self._expired():
+                self.active = False  # window ran out with no request since to close it
+            return {
+                "active": self.active,
+                "captured_requests": self._captured,
+                "remaining_requests": self._remaining,
+                "seconds_left": (
+                    max(0.0, self._deadline - time.monotonic())
+                    if self._deadline is not None and self.active else None
+                ),
+                "started_at": self._started_at,
+            }
+
+    def dump(self, fmt: str = "pstats", limit: int = 80) -> bytes:
+        """
+        fmt="pstats": marshalled stats, loadable with pstats.Stats(path),
+                      snakeviz or flameprof (for a flame graph)
+        fmt="text":   top functions by cumulative time
+        """
+        with self._lock:
+            stats = self._stats
+            if stats is None:
+                raise RuntimeError("No profile captured yet.")
+            if fmt == "pstats":
+                return marshal.dumps(stats.stats)
+            if fmt == "text":
+                buf = io.StringIO()
+                stats.stream = buf
+                stats.sort_stats("cumulative").print_stats(limit)
+                return buf.getvalue().encode("utf-8")
+        raise ValueError(f"Unknown profile format: {fmt}")
+
+
+PROFILER = ProfileCapture()
+
+
+def profiled(fn):
+    """Decorator: run fn inside PROFILER.capture() (keeps the signature for FastAPI)."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with PROFILER.capture():
+            return fn(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,119 @@
+# app/utils/reduction.py
+import os
+from typing import Optional
+
+import numpy as np
+
+REDUCED_DIMS = int(os.getenv("SHIKISAI_REDUCED_DIMS", "128"))  # 0 disables the coarse pass
+REDUCTION_KIND = os.getenv("SHIKISAI_REDUCTION", "pca")  # pca | random
+RERANK_CANDIDATES = int(os.getenv("SHIKISAI_RERANK_CANDIDATES", "4000"))
+
+
+class ReducedEmbeddings:
+    """
+    Low-dimensional copy of a normalized embedding matrix for coarse scoring.
+
+    With x ≈ mean + Pᵀ·P·(x - mean) for a (dims, d) projection P with
+    orthonormal rows, a dot product q·x is approximated by
+    q·mean + (P·q)·reduced[row], where reduced = P·(x - mean).
+    """
+
+    def __init__(self, kind: str, mean: np.ndarray, proj: np.ndarray, reduced: np.ndarray, fingerprint: np.ndarray):
+        self.kind = kind
+        self.mean = mean.astype(np.float32)
+        self.proj = proj.astype(np.float32)
+        self.reduced = np.ascontiguousarray(reduced, dtype=np.float32)
+        self.fingerprint = fingerprint
+
+    @property
+    def dims(self) -> int:
+        return self.proj.shape[0]
+
+    def query(self, q: np.ndarray):
+        """(projected query, constant offset) for scores()."""
+        q = np.asarray(q, dtype=np.float32)
+        return self.proj @ q, float(q @ self.mean)
+
+    def scores(self, q: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate q·x for the given rows (all rows if None)."""
+        pq, offset = self.query(q)
+        mat = self.reduced if rows is None else self.reduced[rows]
+        return mat @ pq + offset
+
+    def save(self, path: str):
+        np.savez(
+            path, kind=self.kind, mean=self.mean, proj=self.proj,
+            reduced=self.reduced, fingerprint=self.fingerprint,
+        )
+
+
+def fingerprint(emb: np.ndarray) -> np.ndarray:
+    """Cheap identity check for an embedding matrix: row count + strided column sums."""
+    step = max(1, len(emb) // 1000)
+    return np.r_[float(len(emb)), emb[::step].sum(axis=0, dtype=np.float64)]
+
+
+def fit(emb: np.ndarray, dims: int = REDUCED_DIMS, kind: str = REDUCTION_KIND,
+        sample: int = 50000, seed: int = 0) -> ReducedEmbeddings:
+    """PCA (top eigenvectors of the covariance of a row sample) or a random orthonormal projection."""
+    d = emb.shape[1]
+    dims = min(dims, d)
+    rng = np.random.default_rng(seed)
+
+    if kind == "pca":
+        idx = rng.choice(len(emb), min(sample, len(emb)), replace=False)
+        x = emb[idx].astype(np.float64)
+        mean = x.mean(axis=0)
+        x -= mean
+        _, vecs = np.linalg.eigh(x.T @ x)
+        proj = vecs[:, ::-1][:, :dims].T
+    elif kind == "random":
+        mean = np.zeros(d)
+        q, _ = np.linalg.qr(rng.standard_normal((d, dims)))
+        proj = q.T
+    else:
+        raise ValueError(f"Unknown reduction: {kind}")
+
+    mean = mean.astype(np.float32)
+    proj = proj.astype(np.float32)
+    reduced = (emb - mean) @ proj.T
+    return ReducedEmbeddings(kind, mean, proj, reduced, fingerprint(emb))
+
+
+def reduced_path(catalog_path: str, dims: int = REDUCED_DIMS) -> str:
+    """Where the offline copy for a catalog lives: next to the CSV."""
+    return f"{os.path.splitext(catalog_path)[0]}.reduced{dims}.npz"
+
+
+def load(path: str, emb: np.ndarray) -> Optional[ReducedEmbeddings]:
+    """Load a saved copy; None if missing or built from a different matrix."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as z:
+        red = ReducedEmbeddings(str(z["kind"]), z["mean"], z["proj"], z["reduced"], z["fingerprint"])
+    fp = fingerprint(emb)
+    if red.reduced.shape[0] != len(emb) or red.proj.shape[1] != emb.shape[1] \
+            or red.fingerprint.shape != fp.shape or not np.allclose(red.fingerprint, fp, rtol=1e-4, atol=1e-3):
+        print(f"[Reduction] {path} does not match the catalog embeddings; ignoring it")
+        return None
+    return red
+
+
+def load_or_fit(catalog_path: str, emb: np.ndarray, dims: int = REDUCED_DIMS) -> Optional[ReducedEmbeddings]:
+    """Reduced copy for a catalog: the offline file if valid, else fitted in process. None if disabled."""
+    if dims <= 0 or dims >= emb.shape[1]:
+        return None
+    red = load(reduced_path(catalog_path, dims), emb)
+    if red is None:
+        red = fit(emb, dims)
+        print(f"[Reduction] Fitted {red.kind} {red.dims}-d copy in process (no offline file)")
+    return red
+
+
+def spearman(a: np.ndarray, b: np.ndarray) -> float:
+    """Spearman rank correlation (ties broken by position)."""
+    ra = np.empty(len(a))
+    rb = np.empty(len(b))
+    ra[np.argsort(a)] = np.arange(len(a))
+    rb[np.argsort(b)] = np.arange(len(b))
+    return float(np.corrcoef(ra, rb)[0, 1])
@@ -0,0 +1,67 @@
+# app/utils/spatial_index.py
+import numpy as np
+
+
+class EmotionGrid:
+    """
+    Uniform grid over (valence, energy) in [0, 1]^2 for radius queries.
+
+    Points are bucketed into `cells x cells` cells and stored cell-sorted
+    (row-major by energy, then valence), so each energy band of a query is a
+    single contiguous slice. radius_query() returns the ids of points within
+    `radius` of the query, only touching bands/cells that intersect the circle.
+    """
+
+    def __init__(self, valence, energy, ids=None, cells: int = 32):
+        valence = np.asarray(valence, dtype=np.float32)
+        energy = np.asarray(energy, dtype=np.float32)
+        if ids is None:
+            ids = np.arange(len(valence))
+
+        # out-of-range values land in the border cells; distances use raw values
+        self.cells = cells
+        col = np.minimum((np.clip(valence, 0.0, 1.0) * cells).astype(np.int64), cells - 1)
+        row = np.minimum((np.clip(energy, 0.0, 1.0) * cells).astype(np.int64), cells - 1)
+        cell = row * cells + col
+
+        order = np.argsort(cell, kind="stable")
+        self.ids = np.asarray(ids)[order]
+        self.valence = valence[order]
+        self.energy = energy[order]
+        # CSR offsets: points of cell c are [offsets[c], offsets[c + 1])
+        self.offsets = np.zeros(cells * cells + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cell, minlength=cells * cells), out=self.offsets[1:])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _cell(self, x):
+        return int(min(max(x, 0.0), 1.0 - 1e-9) * self.cells)
+
+    def radius_query(self, v: float, a: float, radius: float):
+        """
+        Return (ids, distances) of points with distance < radius from (v, a).
+        """
+        c = self.cells
+        r0, r1 = self._cell(a - radius), self._cell(a + radius)
+
+        slices = []
+        for r in range(r0, r1 + 1):
+            # vertical distance from the query to this energy band
+            lo, hi = r / c, (r + 1) / c
+            dy = 0.0 if lo <= a <= hi else min(abs(a - lo), abs(a - hi))
+            if dy >= radius:
+                continue
+            dx = np.sqrt(radius * radius - dy * dy)
+            c0, c1 = self._cell(v - dx), self._cell(v + dx)
+            start, stop = self.offsets[r * c + c0], self.offsets[r * c + c1 + 1]
+            if stop > start:
+                slices.append(np.arange(start, stop))
+
+        if not slices:
+            return self.ids[:0], np.zeros(0, dtype=np.float32)
+
+        pos = np.concatenate(slices)
+        dist = np.sqrt((self.valence[pos] - v) ** 2 + (self.energy[pos] - a) ** 2)
+        hit = dist < radius
+        return self.ids[pos[hit]], dist[hit]
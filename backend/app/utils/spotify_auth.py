@@ -11,6 +11,10 @@ CLIENT_SECRET = os.getenv("SPOTIPY_CLIENT_SECRET")
 REDIRECT_URI = os.getenv("SPOTIPY_REDIRECT_URI", "http://127.0.0.1:8080/callback")
 SCOPE = "user-library-read user-top-read playlist-read-private user-read-recently-played"
 
+# Overrides for pointing the client at a local mock (load tests)
+API_URL = os.getenv("SHIKISAI_SPOTIFY_API_URL")
+ACCOUNTS_URL = os.getenv("SHIKISAI_SPOTIFY_ACCOUNTS_URL")
+
 class SpotifyAuth:
     def __init__(self):
         if CLIENT_ID is None or CLIENT_SECRET is None:
@@ -23,6 +27,10 @@ class SpotifyAuth:
             scope=SCOPE,
             cache_path=".spotifycache"
         )
+        if ACCOUNTS_URL:
+            base = ACCOUNTS_URL.rstrip("/")
+            self.oauth.OAUTH_AUTHORIZE_URL = f"{base}/authorize"
+            self.oauth.OAUTH_TOKEN_URL = f"{base}/api/token"
 
     def get_authorize_url(self):
         return self.oauth.get_authorize_url()
@@ -32,7 +40,10 @@ class SpotifyAuth:
         return token_info
 
     def get_spotify_client(self, access_token: str):
-        return spotipy.Spotify(auth=access_token)
+        sp = spotipy.Spotify(auth=access_token)
+        if API_URL:
+            sp.prefix = API_URL.rstrip("/") + "/"
+        return sp
 
     def refresh_access_token(self, refresh_token):
         token_info = self.oauth.refresh_access_token(refresh_token)
@@ -1,9 +1,21 @@
 # app/utils/spotify_fetch.py
-from typing import List, Dict
+from typing import List, Dict, Optional
+from collections import OrderedDict
 from spotipy.exceptions import SpotifyException
 from .spotify_auth import SpotifyAuth
 import spotipy
 import time
+from datetime import datetime
+
+def _played_at_ms(played_at: Optional[str]) -> Optional[int]:
+    """Spotify "2024-05-01T12:34:56.789Z" -> epoch milliseconds."""
+    if not played_at:
+        return None
+    try:
+        return int(datetime.fromisoformat(played_at.replace("Z", "+00:00")).timestamp() * 1000)
+    except ValueError:
+        return None
+
 
 class SpotifyFetcher:
     """
@@ -12,6 +24,28 @@ class SpotifyFetcher:
     """
     def __init__(self):
         self.auth = SpotifyAuth()
+        self._user_ids: "OrderedDict[str, str]" = OrderedDict()
+        self._recent: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get_user_id(self, access_token: str, refresh_token: Optional[str] = None, max_cached: int = 4096) -> Optional[str]:
+        """Spotify user id for a token (cached per token, one /me call per new token)."""
+        uid = self._user_ids.get(access_token)
+        if uid is not None:
+            return uid
+        try:
+            if refresh_token:
+                me = self._with_refresh(access_token, refresh_token, lambda sp: sp.current_user())
+            else:
+                me = self.auth.get_spotify_client(access_token).current_user()
+        except Exception as e:
+            print("user id fetch failed:", e)
+            return None
+        uid = (me or {}).get("id")
+        if uid:
+            self._user_ids[access_token] = uid
+            while len(self._user_ids) > max_cached:
+                self._user_ids.popitem(last=False)
+        return uid
 
     def _with_refresh(self, access_token, refresh_token, fn):
         sp = self.auth.get_spotify_client(access_token)
@@ -26,6 +60,106 @@ class SpotifyFetcher:
             else:
                 raise
 
+    def get_recently_played_ids(self, access_token: str, refresh_token: Optional[str] = None, limit: int = 50, ttl: float = 60.0) -> List[str]:
+        """Track ids from the user's recently played list (cached per token for `ttl` seconds)."""
+        cached = self._recent.get(access_token)
+        if cached is not None and time.time() - cached[0] < ttl:
+            return cached[1]
+
+        def fetch(sp):
+            return sp.current_user_recently_played(limit=min(limit, 50))
+
+        try:
+            if refresh_token:
+                resp = self._with_refresh(access_token, refresh_token, fetch)
+            else:
+                resp = fetch(self.auth.get_spotify_client(access_token))
+        except Exception as e:
+            print("recently played fetch failed:", e)
+            return []
+
+        ids = [
+            (it.get("track") or {}).get("id")
+            for it in (resp or {}).get("items", [])
+        ]
+        ids = [i for i in ids if i]
+        self._recent[access_token] = (time.time(), ids)
+        while len(self._recent) > 4096:
+            self._recent.popitem(last=False)
+        return ids
+
+    def _call(self, access_token, refresh_token, fn):
+        if refresh_token:
+            return self._with_refresh(access_token, refresh_token, fn)
+        return fn(self.auth.get_spotify_client(access_token))
+
+    def get_recently_played_since(self, access_token: str, refresh_token: Optional[str] = None,
+                                  after_ms: Optional[int] = None, max_pages: int = 4) -> List[Dict]:
+        """
+        Plays newer than after_ms (all of the last 50 when None), oldest first:
+        [{"id", "played_at_ms", "artist_ids", "track"}]. Raises on API errors.
+        """
+        plays = []
+        cursor = after_ms
+        for _ in range(max_pages):
+            if cursor is None:
+                resp = self._call(access_token, refresh_token, lambda sp: sp.current_user_recently_played(limit=50))
+            else:
+                after = cursor
+                resp = self._call(access_token, refresh_token, lambda sp: sp.current_user_recently_played(limit=50, after=after))
+            items = (resp or {}).get("items", [])
+            for it in items:
+                t = it.get("track") or {}
+                ts = _played_at_ms(it.get("played_at"))
+                if t.get("id") and ts is not None and (after_ms is None or ts > after_ms):
+                    plays.append({
+                        "id": t["id"],
+                        "played_at_ms": ts,
+                        "artist_ids": [a.get("id") for a in t.get("artists", []) if a.get("id")],
+                        "track": t,
+                    })
+            # a full page after a cursor may have more behind it
+            if cursor is None or len(items) < 50 or not plays:
+                break
+            cursor = max(p["played_at_ms"] for p in plays)
+        unique = {(p["id"], p["played_at_ms"]): p for p in plays}
+        return sorted(unique.values(), key=lambda p: p["played_at_ms"])
+
+    def get_top_tracks(self, access_token: str, refresh_token: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        resp = self._call(
+            access_token, refresh_token,
+            lambda sp: sp.current_user_top_tracks(limit=min(limit, 50), time_range="medium_term"),
+        )
+        return (resp or {}).get("items", [])
+
+    def get_artist_genres(self, access_token: str, refresh_token: Optional[str], artist_ids: List[str]) -> Dict[str, List[str]]:
+        """{artist_id: genres}, 50 artists per call."""
+        out = {}
+        ids = [a for a in dict.fromkeys(artist_ids) if a]
+        for i in range(0, len(ids), 50):
+            chunk = ids[i:i + 50]
+            resp = self._call(access_token, refresh_token, lambda sp: sp.artists(chunk))
+            for a in (resp or {}).get("artists", []):
+                if a and a.get("id"):
+                    out[a["id"]] = a.get("genres", [])
+        return out
+
+    def get_audio_features(self, access_token: str, refresh_token: Optional[str], track_ids: List[str]) -> Dict[str, Dict]:
+        """{track_id: audio features}, 100 tracks per call; tracks without features are left out."""
+        out = {}
+        ids = [t for t in dict.fromkeys(track_ids) if t]
+        for i in range(0, len(ids), 100):
+            chunk = ids[i:i + 100]
+            try:
+                feats = self._call(access_token, refresh_token, lambda sp: sp.audio_features(tracks=chunk))
+            except Exception as e:
+                print("audio features chunk skipped:", e)
+                continue
+            for f in feats or []:
+                if f and f.get("id"):
+                    out[f["id"]] = f
+        return out
+
     def _safe_split_artists(self, artist_objs):
         return [a.get("name") for a in artist_objs] if artist_objs else []
 
@@ -0,0 +1,92 @@
+# app/utils/warmup.py
+import time
+import threading
+from typing import Callable, Dict, List, Optional
+
+_UNSET = object()
+
+
+class Component:
+    """
+    A service singleton built on first use (or ahead of time by warm_up).
+
+    Attribute access is forwarded to the built object, so a Component can be
+    handed to code expecting the object itself; the first such access blocks
+    until the build finishes. Concurrent callers share one build. A failed
+    build is retried on the next use. Use peek() / ready for non-blocking checks.
+    """
+
+    def __init__(self, name: str, build: Callable, required: bool = True):
+        self.name = name
+        self.required = required
+        self._build = build
+        self._value = _UNSET
+        self._lock = threading.Lock()
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.seconds: Optional[float] = None
+
+    def get(self):
+        value = self._value
+        if value is not _UNSET:
+            return value
+        with self._lock:
+            if self._value is _UNSET:
+                self.state = "loading"
+                t0 = time.perf_counter()
+                try:
+                    value = self._build()
+                except Exception as e:
+                    self.state = "failed"
+                    self.error = f"{type(e).__name__}: {e}"
+                    print(f"[Warmup] {self.name} failed: {self.error}")
+                    raise
+                self.seconds = round(time.perf_counter() - t0, 3)
+                self.error = None
+                self._value = value
+                self.state = "ready"
+                print(f"[Warmup] {self.name} ready in {self.seconds}s")
+        return self._value
+
+    def peek(self):
+        """The built object, or None without triggering a build."""
+        value = self._value
+        return None if value is _UNSET else value
+
+    @property
+    def ready(self) -> bool:
+        return self._value is not _UNSET
+
+    def status(self) -> Dict:
+        return {"state": self.state, "required": self.required, "seconds": self.seconds, "error": self.error}
+
+    def __getattr__(self, attr):
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        return getattr(self.get(), attr)
+
+
+def warm_up(components: List[Component], background: bool = True) -> List[threading.Thread]:
+    """Build components concurrently; in the background unless background=False."""
+
+    def build(c):
+        try:
+            c.get()
+        except Exception:
+            pass  # recorded on the component; retried on first use
+
+    threads = [threading.Thread(target=build, args=(c,), name=f"warmup-{c.name}", daemon=True) for c in components]
+    for t in threads:
+        t.start()
+    if not background:
+        for t in threads:
+            t.join()
+    return threads
+
+
+def readiness(components: List[Component]) -> Dict:
+    """{"ready": all required components built, "components": per-component status}."""
+    return {
+        "ready": all(c.ready for c in components if c.required),
+        "components": {c.name: c.status() for c in components},
+    }
@@ -0,0 +1,194 @@
+# app/utils/weight_eval.py
+"""
+Offline evaluation of ranking weights (preferences and INTENT_CONFIG).
+
+For a fixed color the candidate rows, their emotion distances and CLAP
+similarities do not depend on the weights, and the hybrid score is linear
+in them: score = terms @ weights. So each color is prepared once
+(prepare_query) and a block of configurations is scored with one matmul,
+cut to a top window with one batched argpartition and deduped per
+configuration with the serving rules.
+
+A configuration is a flat dict:
+  "w_clap", "w_emotion", "w_modern", "w_energy_pref"  -> preferences
+  "<intent>.<coefficient>"                              -> INTENT_CONFIG[intent]
+  "*.<coefficient>"                                     -> every intent
+Missing keys keep the serving defaults.
+"""
+import time
+import itertools
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.utils import local_recommender as lr
+
+# columns of EvalQuery.terms, in weight-vector order
+TERM_NAMES = ("emotion", "modern", "energy_pref", "clap", "static") + lr.INTENT_COEFFICIENTS
+METRICS = ("overlap", "diversity", "adherence", "clap", "artist_spread")
+
+
+class EvalQuery:
+    """One color's candidates and weight-independent score terms."""
+
+    def __init__(self, hex_color, v, a, intent, rows, terms, emotion_dist):
+        self.hex_color = hex_color
+        self.v = v
+        self.a = a
+        self.intent = intent
+        self.rows = rows
+        self.terms = terms  # (n_candidates, len(TERM_NAMES)) float32
+        self.emotion_dist = emotion_dist
+        self._order = np.argsort(rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def positions(self, rows: np.ndarray) -> np.ndarray:
+        """Candidate positions of catalog rows (rows must be candidates)."""
+        return self._order[np.searchsorted(self.rows, rows, sorter=self._order)]
+
+
+def prepare_query(snap, hex_color: str, query_embed, v: float, a: float, row_ids=None) -> EvalQuery:
+    ctx = lr._query_context(query_embed, a, hex_color)
+    intent = ctx["intent"]
+    rows, _, dist = lr.select_candidates(snap, intent, v, ctx["a"], row_ids=row_ids)
+    feats = snap.features
+
+    fixed, columns = lr.intent_static_terms(feats, intent, rows)
+    energy = feats["energy"][rows]
+    terms = np.empty((len(rows), len(TERM_NAMES)), dtype=np.float32)
+    terms[:, 0] = np.exp(-3.5 * dist)
+    terms[:, 1] = feats["year_norm"][rows]
+    terms[:, 2] = 1 - np.abs(energy - ctx["a"])
+    terms[:, 3] = lr._clap_score(snap, {**ctx, "w_clap": 1.0}, rows)
+    terms[:, 4] = fixed
+    for i, name in enumerate(lr.INTENT_COEFFICIENTS):
+        terms[:, 5 + i] = columns[name]
+    return EvalQuery(hex_color, v, a, intent, rows, terms, dist)
+
+
+# CONFIGURATIONS
+def expand_grid(grid: Dict[str, Sequence[float]]) -> List[Dict]:
+    """Every combination of the listed values."""
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def sample_grid(ranges: Dict[str, Sequence[float]], n: int, seed: int = 0) -> List[Dict]:
+    """n configurations drawn uniformly from {key: (low, high)}."""
+    rng = np.random.default_rng(seed)
+    return [{k: round(float(rng.uniform(lo, hi)), 4) for k, (lo, hi) in ranges.items()} for _ in range(n)]
+
+
+def _intent_config(config: Dict, intent: str) -> Dict:
+    cfg = dict(lr.INTENT_CONFIG[intent])
+    for key, value in config.items():
+        scope, _, name = key.rpartition(".")
+        if scope in ("*", intent):
+            cfg[name] = value
+    return cfg
+
+
+def weight_matrix(configs: Sequence[Dict], intent: str) -> np.ndarray:
+    """(len(TERM_NAMES), len(configs)) weights for one intent."""
+    W = np.empty((len(TERM_NAMES), len(configs)), dtype=np.float32)
+    for j, config in enumerate(configs):
+        prefs = {**lr.DEFAULT_PREFERENCES, **{k: v for k, v in config.items() if k in lr.DEFAULT_PREFERENCES}}
+        cfg = _intent_config(config, intent)
+        W[:5, j] = (
+            prefs["w_emotion"],
+            prefs["w_modern"],
+            prefs["w_energy_pref"],
+            prefs["w_clap"] * cfg["clap_weight"],
+            1.0,
+        )
+        W[5:, j] = [lr.intent_coefficient(cfg, name) for name in lr.INTENT_COEFFICIENTS]
+    return W
+
+
+# RANKING
+def rank_block(snap, q: EvalQuery, W: np.ndarray, depth: int, seed: int) -> List[np.ndarray]:
+    """
+    rank_rows for every column of W: one matmul, one batched top-window
+    partition, then per-configuration ordering and dedup. Columns whose
+    window is not exact (ties at the cut, or dedup leaves too few rows) fall
+    back to rank_rows on the full column.
+    """
+    feats = snap.features
+    n = len(q)
+    if n == 0:
+        return [q.rows[:0] for _ in range(W.shape[1])]
+
+    S = q.terms @ W
+    np.maximum(S, 0, out=S)
+    tie = lr.tiebreak(q.rows, seed)
+
+    window = min(n, max(depth * 8, 64))
+    if window < n:
+        part = np.argpartition(-S, window - 1, axis=0)[:window]
+        cut = np.take_along_axis(S, part, axis=0).min(axis=0)
+        exact = (S >= cut).sum(axis=0) <= window
+    else:
+        part = np.broadcast_to(np.arange(n)[:, None], S.shape)
+        exact = np.ones(S.shape[1], dtype=bool)
+
+    out = []
+    for j in range(S.shape[1]):
+        col = S[:, j]
+        if exact[j]:
+            idx = part[:, j]
+            idx = idx[np.lexsort((tie[idx], -col[idx]))]
+            ranked = lr.dedupe_ranked(q.rows[idx], feats)
+            if len(ranked) >= depth or window >= n:
+                out.append(ranked[:depth])
+                continue
+        out.append(lr.rank_rows(q.rows, col, feats, depth=depth, seed=seed))
+    return out
+
+
+# METRICS
+def ranking_metrics(snap, q: EvalQuery, ranked: np.ndarray, baseline: np.ndarray) -> Dict[str, float]:
+    """
+    overlap       share of the baseline ranking that is still in the top
+    diversity     1 - mean pairwise cosine similarity of the tracks' CLAP embeddings
+    adherence     mean emotion closeness exp(-3.5 * dist) to the color's (v, a)
+    clap          mean CLAP similarity to the color prompt
+    artist_spread distinct artists / tracks
+    """
+    k = len(ranked)
+    if k == 0:
+        return {m: 0.0 for m in METRICS}
+    pos = q.positions(ranked)
+    emb = snap.emb_norm[ranked]
+    gram = emb @ emb.T
+    return {
+        "overlap": len(np.intersect1d(ranked, baseline)) / max(len(baseline), 1),
+        "diversity": float(1 - (gram.sum() - np.trace(gram)) / (k * (k - 1))) if k > 1 else 0.0,
+        "adherence": float(q.terms[pos, 0].mean()),
+        "clap": float(q.terms[pos, 3].mean()),
+        "artist_spread": len(np.unique(snap.features["artist_key"][ranked])) / k,
+    }
+
+
+def evaluate(snap, queries: Sequence[EvalQuery], configs: Sequence[Dict], depth: int = 10,
+             block: int = 64, seed: int = 0, baseline: Optional[Dict] = None) -> List[Dict]:
+    """
+    Metrics of every configuration, averaged over queries, plus the seconds
+    spent ranking it (its share of each block's matmul and partition).
+    overlap is measured against `baseline` (the serving defaults if None).
+    """
+    results = [{"config": dict(c), "seconds": 0.0, **{m: 0.0 for m in METRICS}} for c in configs]
+    for q in queries:
+        base = rank_block(snap, q, weight_matrix([baseline or {}], q.intent), depth, seed)[0]
+        for start in range(0, len(configs), block):
+            chunk = configs[start:start + block]
+            t0 = time.perf_counter()
+            ranked = rank_block(snap, q, weight_matrix(chunk, q.intent), depth, seed)
+            share = (time.perf_counter() - t0) / len(chunk)
+            for j, r in enumerate(ranked):
+                res = results[start + j]
+                res["seconds"] += share
+                for m, val in ranking_metrics(snap, q, r, base).items():
+                    res[m] += val / len(queries)
+    return results
@@ -0,0 +1,77 @@
+# loadtest/fixtures.py
+"""
+Synthetic catalog + base SongStore files for load runs.
+
+Embeddings come from HashingEncoder, the same encoder the app is started
+with, so prompts and tracks live in one space and rankings are meaningful.
+"""
+import os
+import json
+import numpy as np
+import pandas as pd
+
+from app.utils.clap_encoder import HashingEncoder
+from app.models.song_store import FINAL_DIM, TEXT_DIM
+
+GENRES = [
+    "pop", "indie pop", "bedroom pop", "rock", "jazz", "lofi",
+    "anime", "k-pop", "folk", "classical", "r&b", "ambient",
+]
+WORDS = [
+    "love", "night", "blue", "sun", "heart", "rain", "dream", "city",
+    "fire", "ocean", "summer", "ghost", "gold", "silence", "dance", "home",
+]
+
+
+def write_catalog(path: str, n_tracks: int, seed: int = 0) -> str:
+    """Write a catalog CSV in the my_tracks_with_clap.csv format."""
+    rng = np.random.default_rng(seed)
+    enc = HashingEncoder()
+    rows = []
+    for i in range(n_tracks):
+        name = " ".join(rng.choice(WORDS, 2)) + f" {i}"
+        artist = f"Artist {int(rng.integers(0, max(10, n_tracks // 8)))}"
+        genres = [str(g) for g in rng.choice(GENRES, int(rng.integers(1, 3)), replace=False)]
+        emb = enc.encode_text(f"Song '{name}' by {artist}. Genres: {', '.join(genres)}.")[:TEXT_DIM]
+        rows.append({
+            "id": f"trk{i:06d}",
+            "name": name,
+            "artists": str([artist]),
+            "genres": str(genres),
+            "clap_embed": json.dumps([round(float(x), 5) for x in emb]),
+            "valence": float(np.clip(rng.normal(0.5, 0.2), 0, 1)),
+            "energy": float(np.clip(rng.normal(0.5, 0.2), 0, 1)),
+            "instrumentalness": float(rng.random() ** 3),
+            "speechiness": float(rng.random() * 0.3),
+            "popularity": float(rng.integers(0, 100)),
+            "release_year": int(rng.integers(1970, 2026)),
+        })
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return path
+
+
+def write_base_store(catalog_path: str, data_dir: str) -> int:
+    """Seed data_dir with SongStore vectors + metadata for the catalog (index is built on load)."""
+    df = pd.read_csv(catalog_path)
+    vecs = np.zeros((len(df), FINAL_DIM), dtype=np.float32)
+    vecs[:, :TEXT_DIM] = np.vstack([np.asarray(json.loads(e), dtype=np.float32) for e in df["clap_embed"]])
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-9
+
+    version = HashingEncoder().version
+    meta = [
+        {
+            "spotify_id": r.id,
+            "title": r.name,
+            "artists": [r.artists.strip("[]").strip("'\"")],
+            "genres": json.loads(r.genres.replace("'", '"')),
+            "source": "spotify",
+            "encoder": version,
+        }
+        for r in df.itertuples()
+    ]
+    os.makedirs(data_dir, exist_ok=True)
+    np.save(os.path.join(data_dir, "song_vectors.npy"), vecs)
+    with open(os.path.join(data_dir, "song_metadata.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return len(meta)
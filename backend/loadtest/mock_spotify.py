@@ -0,0 +1,197 @@
+# loadtest/mock_spotify.py
+"""
+Local stand-in for the parts of the Spotify Web API and accounts service
+that the backend calls. Responses are deterministic per access token:
+token "lt-<n>" belongs to user "user<n>", whose library is a fixed
+pseudo-random slice of the track universe.
+
+Run standalone:  python -m loadtest.mock_spotify --catalog tracks.csv --port 8901
+"""
+import csv
+import json
+import random
+import argparse
+import threading
+import zlib
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+GENRES = [
+    "pop", "indie pop", "bedroom pop", "rock", "jazz", "lofi",
+    "anime", "k-pop", "folk", "classical", "r&b", "ambient",
+]
+LIBRARY_SIZE = 120
+OWN_TRACK_RATIO = 0.25
+
+
+class TrackUniverse:
+    def __init__(self, catalog_path=None, n_fallback=2000):
+        self.tracks = []
+        if catalog_path:
+            csv.field_size_limit(1 << 30)
+            with open(catalog_path, newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    self.tracks.append((row["id"], row.get("name") or row["id"], row.get("artists") or "[]"))
+        if not self.tracks:
+            self.tracks = [(f"trk{i:06d}", f"Track {i}", f"['Artist {i % 300}']") for i in range(n_fallback)]
+
+    def track(self, i):
+        tid, name, artists = self.tracks[i % len(self.tracks)]
+        artist = artists.strip("[]").split(",")[0].strip(" '\"") or "Unknown"
+        aid = "art" + format(zlib.crc32(artist.encode("utf-8")), "08x")
+        return {
+            "id": tid,
+            "name": name,
+            "artists": [{"id": aid, "name": artist}],
+            "album": {"name": f"Album of {artist}"},
+        }
+
+    def library(self, token):
+        """A user's library: mostly catalog tracks, plus some the base store has never seen."""
+        rng = random.Random(zlib.crc32(token.encode("utf-8")))
+        lib = []
+        for j in range(LIBRARY_SIZE):
+            t = self.track(rng.randrange(len(self.tracks)))
+            if rng.random() < OWN_TRACK_RATIO:
+                t = dict(t, id=f"own{zlib.crc32(token.encode('utf-8')):08x}{j:03d}", name=f"{t['name']} (live)")
+            lib.append(t)
+        return lib
+
+
+def user_of(token):
+    return "user" + token.split("-", 1)[-1]
+
+
+def make_handler(universe, stats):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _token(self):
+            auth = self.headers.get("Authorization", "")
+            return auth[7:] if auth.startswith("Bearer ") else None
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            self.rfile.read(length)
+            with stats["lock"]:
+                stats["requests"] += 1
+            if self.path.rstrip("/").endswith("/api/token"):
+                return self._send(200, {
+                    "access_token": "lt-refreshed",
+                    "token_type": "Bearer",
+                    "expires_in": 3600,
+                    "scope": "",
+                })
+            self._send(404, {"error": "not found"})
+
+        def do_GET(self):
+            with stats["lock"]:
+                stats["requests"] += 1
+            url = urlparse(self.path)
+            path = url.path.rstrip("/")
+            qs = parse_qs(url.query)
+            token = self._token()
+            if not token:
+                return self._send(401, {"error": {"status": 401, "message": "No token"}})
+
+            lib = universe.library(token)
+            limit = int(qs.get("limit", ["50"])[0])
+
+            if path.endswith("/me"):
+                return self._send(200, {"id": user_of(token), "display_name": user_of(token)})
+            if path.endswith("/me/top/tracks"):
+                return self._send(200, {"items": lib[:limit], "next": None})
+            if path.endswith("/me/tracks"):
+                return self._send(200, {"items": [{"track": t} for t in lib[:limit]], "next": None})
+            if path.endswith("/me/playlists"):
+                return self._send(200, {"items": [{"id": "pl" + format(zlib.crc32(token.encode("utf-8")), "08x")}], "next": None})
+            if "/playlists/" in path and path.endswith(("/tracks", "/items")):
+                return self._send(200, {"items": [{"track": t} for t in lib[50:50 + limit]], "next": None})
+            if path.endswith("/me/player/recently-played"):
+                now = datetime.now(timezone.utc)
+                items = [
+                    {"track": t, "played_at": (now - timedelta(minutes=3 * i)).strftime("%Y-%m-%dT%H:%M:%S.000Z")}
+                    for i, t in enumerate(lib[:limit])
+                ]
+                after = int(now.timestamp() * 1000)
+                return self._send(200, {"items": items, "next": None, "cursors": {"after": str(after), "before": None}})
+            if "/artists/" in path:
+                aid = path.rsplit("/", 1)[-1]
+                h = zlib.crc32(aid.encode("utf-8"))
+                genres = [GENRES[h % len(GENRES)], GENRES[(h // 7) % len(GENRES)]]
+                return self._send(200, {"id": aid, "genres": sorted(set(genres))})
+            if path.endswith("/audio-features"):
+                ids = (qs.get("ids", [""])[0]).split(",")
+                feats = []
+                for tid in ids:
+                    rng = random.Random(zlib.crc32(tid.encode("utf-8")))
+                    feats.append({
+                        "id": tid,
+                        "valence": rng.random(),
+                        "energy": rng.random(),
+                        "acousticness": rng.random(),
+                        "danceability": rng.random(),
+                        "tempo": 70 + rng.random() * 100,
+                    })
+                return self._send(200, {"audio_features": feats})
+
+            self._send(404, {"error": {"status": 404, "message": f"No mock for {path}"}})
+
+    return Handler
+
+
+class MockSpotify:
+    """Threaded mock server; base_url is the API prefix, accounts_url the token service."""
+
+    def __init__(self, catalog_path=None, host="127.0.0.1", port=0):
+        self.stats = {"requests": 0, "lock": threading.Lock()}
+        self.server = ThreadingHTTPServer((host, port), make_handler(TrackUniverse(catalog_path), self.stats))
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def accounts_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="mock-spotify", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--catalog", default=None)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8901)
+    args = ap.parse_args()
+
+    mock = MockSpotify(args.catalog, args.host, args.port)
+    print("Mock Spotify API at", mock.base_url)
+    mock.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
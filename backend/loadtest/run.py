@@ -0,0 +1,395 @@
+# loadtest/run.py
+"""
+End-to-end load test for app.main with local stand-ins.
+
+Starts a mock Spotify API and the FastAPI app (uvicorn, N workers) with the
+deterministic HashingEncoder and a synthetic catalog, drives an open-loop
+request mix at a target rate, and saves throughput, latency percentiles,
+error rates and per-worker RSS to loadtest/results/.
+
+    cd backend
+    python -m loadtest.run --rps 40 --duration 60 --workers 2 \\
+        --mix recommend=0.7,page=0.1,batch=0.15,build=0.05 --name baseline
+    python -m loadtest.run compare results/A.json results/B.json
+
+Traffic kinds:
+  recommend  GET /recommend for a random color (some with a user token)
+  page       GET /recommend?cursor=... following a cached ranking
+  batch      a 5-color palette walked in one session (5 sequential requests)
+  build      POST /build_index_spotify for a mock user
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timezone
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "loadtest", "results")
+
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from loadtest.mock_spotify import MockSpotify  # noqa: E402
+from loadtest.fixtures import write_catalog, write_base_store  # noqa: E402
+
+KINDS = ("recommend", "page", "batch", "build")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in KINDS:
+            raise ValueError(f"Unknown traffic kind: {kind}")
+        mix[kind] = float(weight or 1)
+    total = sum(mix.values())
+    return {k: w / total for k, w in mix.items()}
+
+
+def random_hex(rng):
+    return "#%02x%02x%02x" % (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+
+
+# App process
+def start_app(workdir, port, workers, env):
+    cmd = [
+        sys.executable, "-m", "uvicorn", "app.main:app",
+        "--app-dir", BACKEND_DIR,
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers),
+        "--log-level", "warning",
+    ]
+    log = open(os.path.join(workdir, "app.log"), "w")
+    return subprocess.Popen(cmd, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_ready(base_url, proc, timeout=300):
+    import httpx
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("App exited during startup (see app.log)")
+        try:
+            r = httpx.get(f"{base_url}/readyz", timeout=5)
+            if r.status_code == 200:
+                return time.time()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError("App did not become ready")
+
+
+class RssSampler(threading.Thread):
+    """Samples RSS of the app process tree once per interval."""
+
+    def __init__(self, pid, interval=1.0):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = {}
+        self._stop = threading.Event()
+
+    def run(self):
+        import psutil
+
+        root = psutil.Process(self.pid)
+        while not self._stop.wait(self.interval):
+            try:
+                procs = [root] + root.children(recursive=True)
+            except psutil.NoSuchProcess:
+                return
+            for p in procs:
+                try:
+                    rss = p.memory_info().rss
+                except psutil.Error:
+                    continue
+                self.samples.setdefault(p.pid, []).append(rss)
+
+    def stop(self):
+        self._stop.set()
+
+    def summary(self):
+        return [
+            {
+                "pid": pid,
+                "rss_mb_max": round(max(v) / 2**20, 1),
+                "rss_mb_mean": round(sum(v) / len(v) / 2**20, 1),
+                "rss_mb_last": round(v[-1] / 2**20, 1),
+            }
+            for pid, v in sorted(self.samples.items())
+        ]
+
+
+# Traffic
+class Driver:
+    def __init__(self, base_url, users, auth_ratio, seed):
+        self.base_url = base_url
+        self.users = users
+        self.auth_ratio = auth_ratio
+        self.rng = random.Random(seed)
+        self.cursors = []
+        self.records = []
+
+    def _user_params(self):
+        if self.rng.random() >= self.auth_ratio:
+            return {}
+        n = self.rng.randrange(self.users)
+        return {"token": f"lt-{n}", "refresh_token": f"lt-refresh-{n}"}
+
+    async def _timed(self, client, kind, method, url, **kw):
+        t0 = time.perf_counter()
+        status, err = None, None
+        body = None
+        try:
+            r = await client.request(method, url, **kw)
+            status = r.status_code
+            if status == 200:
+                body = r.json()
+        except Exception as e:
+            err = type(e).__name__
+        self.records.append((kind, time.perf_counter() - t0, status, err, t0))
+        return body
+
+    async def recommend(self, client):
+        params = {"hex": random_hex(self.rng), "k": 10, **self._user_params()}
+        body = await self._timed(client, "recommend", "GET", "/recommend", params=params)
+        if body and body.get("next_cursor"):
+            self.cursors.append(body["next_cursor"])
+            del self.cursors[:-500]
+
+    async def page(self, client):
+        if not self.cursors:
+            return await self.recommend(client)
+        cursor = self.cursors.pop(self.rng.randrange(len(self.cursors)))
+        body = await self._timed(client, "page", "GET", "/recommend", params={"cursor": cursor, "k": 10})
+        if body and body.get("next_cursor"):
+            self.cursors.append(body["next_cursor"])
+
+    async def batch(self, client):
+        session = f"lt-session-{self.rng.randrange(1 << 30)}"
+        user = self._user_params()
+        for _ in range(5):
+            params = {"hex": random_hex(self.rng), "k": 10, "session_id": session, **user}
+            await self._timed(client, "batch", "GET", "/recommend", params=params)
+
+    async def build(self, client):
+        n = self.rng.randrange(self.users)
+        payload = {"token": f"lt-{n}", "max_tracks_per_source": 50}
+        await self._timed(client, "build", "POST", "/build_index_spotify", json=payload)
+
+    async def run(self, rps, duration, mix, max_inflight):
+        import httpx
+
+        kinds, weights = zip(*mix.items())
+        limits = httpx.Limits(max_connections=max_inflight, max_keepalive_connections=max_inflight)
+        dropped = 0
+        tasks = set()
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=60, limits=limits) as client:
+            start = time.perf_counter()
+            next_at = start
+            while True:
+                next_at += self.rng.expovariate(rps)
+                if next_at - start >= duration:
+                    break
+                await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+                if len(tasks) >= max_inflight:
+                    dropped += 1
+                    continue
+                kind = self.rng.choices(kinds, weights)[0]
+                task = asyncio.create_task(getattr(self, kind)(client))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            elapsed = time.perf_counter() - start
+        return elapsed, dropped
+
+
+def summarize(records, elapsed, dropped):
+    def stats(rows):
+        lat = np.array([r[1] for r in rows]) * 1000
+        ok = [r for r in rows if r[2] is not None and 200 <= r[2] < 300]
+        out = {
+            "requests": len(rows),
+            "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round(1 - len(ok) / len(rows), 4) if rows else 0.0,
+        }
+        if len(lat):
+            for p in (50, 90, 95, 99):
+                out[f"p{p}_ms"] = round(float(np.percentile(lat, p)), 2)
+            out["max_ms"] = round(float(lat.max()), 2)
+            out["mean_ms"] = round(float(lat.mean()), 2)
+        statuses = {}
+        for r in rows:
+            key = str(r[2]) if r[2] is not None else r[3]
+            statuses[key] = statuses.get(key, 0) + 1
+        out["statuses"] = statuses
+        return out
+
+    by_kind = {k: stats([r for r in records if r[0] == k]) for k in KINDS if any(r[0] == k for r in records)}
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "client_dropped": dropped,
+        "overall": stats(records),
+        "by_kind": by_kind,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return None
+
+
+def save(result, name):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    path = os.path.join(RESULTS_DIR, f"{stamp}_{name}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    return path
+
+
+def run(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix="shikisai-loadtest-")
+    catalog = args.catalog
+    if not catalog:
+        catalog = os.path.join(workdir, "catalog.csv")
+        print(f"Generating {args.tracks}-track catalog in {catalog}")
+        write_catalog(catalog, args.tracks, seed=args.seed)
+    write_base_store(catalog, os.path.join(workdir, "data"))
+
+    mock = MockSpotify(catalog).start()
+    env = dict(os.environ)
+    env.update({
+        "SHIKISAI_ENCODER": "hashing",
+        "SHIKISAI_CATALOG_PATH": os.path.abspath(catalog),
+        "SHIKISAI_SPOTIFY_API_URL": mock.base_url,
+        "SHIKISAI_SPOTIFY_ACCOUNTS_URL": mock.accounts_url,
+        "SPOTIPY_CLIENT_ID": "loadtest",
+        "SPOTIPY_CLIENT_SECRET": "loadtest",
+        "SHIKISAI_LOG_SAMPLE_RATE": "0",
+    })
+    env.update(dict(kv.split("=", 1) for kv in args.env))
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    t0 = time.time()
+    proc = start_app(workdir, args.port, args.workers, env)
+    sampler = None
+    try:
+        ready_at = wait_ready(base_url, proc)
+        print(f"App ready after {ready_at - t0:.1f}s; driving {args.rps} rps for {args.duration}s")
+        sampler = RssSampler(proc.pid)
+        sampler.start()
+
+        driver = Driver(base_url, args.users, args.auth_ratio, args.seed)
+        mix = parse_mix(args.mix)
+        elapsed, dropped = asyncio.run(driver.run(args.rps, args.duration, mix, args.max_inflight))
+    finally:
+        if sampler:
+            sampler.stop()
+        proc.terminate()
+        try:
+            proc.wait(timeout=20)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        mock.stop()
+
+    result = {
+        "name": args.name,
+        "commit": git_commit(),
+        "started_at": datetime.fromtimestamp(t0, timezone.utc).isoformat(),
+        "config": {
+            "rps": args.rps, "duration_s": args.duration, "workers": args.workers,
+            "mix": mix, "tracks": args.tracks if not args.catalog else None,
+            "catalog": args.catalog, "users": args.users, "auth_ratio": args.auth_ratio,
+            "max_inflight": args.max_inflight, "env": args.env,
+        },
+        "startup_s": round(ready_at - t0, 2),
+        "mock_spotify_requests": mock.stats["requests"],
+        "workers_rss": sampler.summary() if sampler else [],
+        **summarize(driver.records, elapsed, dropped),
+    }
+    path = save(result, args.name)
+    print_summary(result)
+    print("Saved", path)
+
+
+def print_summary(result):
+    print(f"\n{result['name']}  ({result['elapsed_s']}s, dropped={result['client_dropped']})")
+    print(f"{'kind':<10}{'reqs':>7}{'rps':>9}{'err%':>7}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+    rows = list(result["by_kind"].items()) + [("overall", result["overall"])]
+    for kind, s in rows:
+        print(
+            f"{kind:<10}{s['requests']:>7}{s['throughput_rps']:>9}{s['error_rate'] * 100:>7.1f}"
+            f"{s.get('p50_ms', 0):>9}{s.get('p90_ms', 0):>9}{s.get('p99_ms', 0):>9}{s.get('max_ms', 0):>9}"
+        )
+    for w in result["workers_rss"]:
+        print(f"  pid {w['pid']}: rss max {w['rss_mb_max']} MB, mean {w['rss_mb_mean']} MB")
+
+
+def compare(path_a, path_b):
+    with open(path_a, encoding="utf-8") as f:
+        a = json.load(f)
+    with open(path_b, encoding="utf-8") as f:
+        b = json.load(f)
+
+    def delta(x, y):
+        return f"{(y - x) / x * 100:+.1f}%" if x else "n/a"
+
+    print(f"A = {a['name']} ({a.get('commit')})   B = {b['name']} ({b.get('commit')})")
+    print(f"{'kind':<10}{'metric':<16}{'A':>10}{'B':>10}{'delta':>10}")
+    kinds = sorted(set(a["by_kind"]) | set(b["by_kind"])) + ["overall"]
+    for kind in kinds:
+        sa = a["overall"] if kind == "overall" else a["by_kind"].get(kind, {})
+        sb = b["overall"] if kind == "overall" else b["by_kind"].get(kind, {})
+        for metric in ("throughput_rps", "error_rate", "p50_ms", "p99_ms"):
+            x, y = sa.get(metric), sb.get(metric)
+            if x is None or y is None:
+                continue
+            print(f"{kind:<10}{metric:<16}{x:>10}{y:>10}{delta(x, y):>10}")
+    rss_a = max((w["rss_mb_max"] for w in a["workers_rss"]), default=0)
+    rss_b = max((w["rss_mb_max"] for w in b["workers_rss"]), default=0)
+    print(f"{'workers':<10}{'rss_mb_max':<16}{rss_a:>10}{rss_b:>10}{delta(rss_a, rss_b):>10}")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        if len(sys.argv) != 4:
+            sys.exit("usage: python -m loadtest.run compare A.json B.json")
+        return compare(sys.argv[2], sys.argv[3])
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--name", default="run")
+    ap.add_argument("--rps", type=float, default=20.0)
+    ap.add_argument("--duration", type=float, default=30.0)
+    ap.add_argument("--mix", default="recommend=0.7,page=0.1,batch=0.15,build=0.05")
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--tracks", type=int, default=5000, help="synthetic catalog size")
+    ap.add_argument("--catalog", default=None, help="use an existing catalog CSV instead")
+    ap.add_argument("--users", type=int, default=200, help="distinct mock Spotify users")
+    ap.add_argument("--auth-ratio", type=float, default=0.3, help="share of requests with a user token")
+    ap.add_argument("--max-inflight", type=int, default=256)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workdir", default=None)
+    ap.add_argument("--env", action="append", default=[], help="extra KEY=VALUE for the app")
+    run(ap.parse_args())
+
+
+if __name__ == "__main__":
+    main()
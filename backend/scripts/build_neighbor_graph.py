@@ -0,0 +1,82 @@
+# backend/scripts/build_neighbor_graph.py
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+"""
+Build the "more like this" neighbor graph of the catalog (see
+app/utils/neighbor_graph.py) and report how close it is to an exact
+blended search.
+
+  python scripts/build_neighbor_graph.py
+  python scripts/build_neighbor_graph.py --k 30 --check 500
+  python scripts/build_neighbor_graph.py --update    # catalog only gained rows
+
+Output: <catalog>.neighbors<k>.npz next to the catalog CSV
+(serving picks it up when SHIKISAI_NEIGHBORS_K matches).
+
+--update extends the existing file with the rows appended to the catalog
+since it was built; it falls back to a full build when the catalog changed
+in any other way.
+"""
+
+BACKEND = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND))
+
+from app.utils import neighbor_graph as ng  # noqa: E402
+from app.utils import local_recommender as lr  # noqa: E402
+
+
+def recall_check(graph, emb, va, n, seed=0):
+    """Share of the exact blended top-k (brute force over all rows) found in the graph."""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(emb), min(n, len(emb)), replace=False)
+    k = graph.k
+    hits = []
+    for row in rows:
+        score = ng.blended(emb, va, np.array([row]), np.arange(len(emb))[None, :], (emb @ emb[row])[None, :], graph.va_weight)[0]
+        score[row] = -np.inf
+        truth = np.argpartition(-score, k - 1)[:k]
+        got, _ = graph.lookup(row)
+        hits.append(len(np.intersect1d(got, truth)) / k)
+    return float(np.mean(hits))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--catalog", default=lr.FILE_PATH)
+    ap.add_argument("--k", type=int, default=ng.NEIGHBORS_K)
+    ap.add_argument("--batch", type=int, default=ng.SEARCH_BATCH, help="query rows per FAISS search")
+    ap.add_argument("--update", action="store_true", help="extend the existing graph with appended rows")
+    ap.add_argument("--check", type=int, default=200, help="rows sampled for the recall check (0 = skip)")
+    ap.add_argument("--no-save", action="store_true")
+    args = ap.parse_args()
+
+    snap = lr.build_snapshot(0, args.catalog)
+    ids, emb, va = ng.catalog_inputs(snap)
+    path = ng.graph_path(args.catalog, args.k)
+
+    t0 = time.perf_counter()
+    old = ng.load(path) if args.update else None
+    if old is not None and old.k == args.k and ng.is_prefix(old, ids, emb):
+        graph = old.extend(ids, emb, va, batch=args.batch)
+    else:
+        if args.update:
+            print("No matching graph to extend; building from scratch")
+        graph = ng.NeighborGraph.build(ids, emb, va, args.k, batch=args.batch)
+    elapsed = time.perf_counter() - t0
+    print(f"{len(graph)} rows x {graph.k} neighbors in {elapsed:.1f}s ({graph.nbytes / 1e6:.1f} MB)")
+
+    if args.check:
+        print(f"recall@{graph.k} vs exact blended search ({args.check} rows): {recall_check(graph, emb, va, args.check):.4f}")
+
+    if not args.no_save:
+        graph.save(path)
+        print("Wrote", path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# backend/scripts/build_reduced_embeddings.py
+import os
+import sys
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+"""
+Build the reduced-dimension copy of the catalog CLAP embeddings used for the
+coarse scoring pass, and report how much ranking quality it costs.
+
+  python scripts/build_reduced_embeddings.py --dims 64 96 128
+  python scripts/build_reduced_embeddings.py --dims 128 --kind random --no-save
+
+Output: <catalog>.reduced<dims>.npz next to the catalog CSV
+(serving picks it up when SHIKISAI_REDUCED_DIMS matches).
+
+Check, per dims:
+ - spearman: rank correlation of reduced vs full 512-d similarity over all rows
+ - recall@k: share of the exact top-k (full 512-d) that survives the coarse
+   top-N + exact rerank, for plain similarity and for rank_hybrid end to end
+"""
+
+BACKEND = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND))
+
+from app.utils import reduction  # noqa: E402
+from app.utils import local_recommender as lr  # noqa: E402
+
+
+def random_queries(emb, n, rng, noise=0.3):
+    """Catalog rows blurred with noise: realistic directions that aren't exact rows."""
+    q = emb[rng.choice(len(emb), n)] + noise * rng.standard_normal((n, emb.shape[1])).astype(np.float32) / np.sqrt(emb.shape[1])
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+
+def similarity_check(emb, red, queries, candidates, ks):
+    rhos = []
+    recall = {k: [] for k in ks}
+    for q in queries:
+        exact = emb @ q
+        approx = red.scores(q)
+        rhos.append(reduction.spearman(exact, approx))
+        n = min(candidates, len(emb))
+        cand = np.argpartition(-approx, n - 1)[:n]
+        reranked = cand[np.argsort(-exact[cand])]
+        truth = np.argsort(-exact)
+        for k in ks:
+            recall[k].append(len(np.intersect1d(reranked[:k], truth[:k])) / k)
+    return float(np.mean(rhos)), float(np.min(rhos)), {k: float(np.mean(v)) for k, v in recall.items()}
+
+
+def pipeline_check(snap, red, queries, rng, ks, candidates):
+    """Top-k overlap of rank_hybrid with the coarse pass vs exact scoring."""
+    old_candidates = lr.RERANK_CANDIDATES
+    lr.RERANK_CANDIDATES = candidates
+    overlap = {k: [] for k in ks}
+    try:
+        for i, q in enumerate(queries):
+            hex_color = "#%06x" % rng.integers(0, 1 << 24)
+            v, a = rng.random(2)
+            kw = dict(hex_color=hex_color, depth=max(ks), seed=i, snapshot=snap)
+            snap.reduced = None
+            exact = lr.rank_hybrid(q, v, a, **kw)
+            snap.reduced = red
+            fast = lr.rank_hybrid(q, v, a, **kw)
+            for k in ks:
+                overlap[k].append(len(np.intersect1d(exact[:k], fast[:k])) / max(1, min(k, len(exact))))
+    finally:
+        lr.RERANK_CANDIDATES = old_candidates
+    return {k: float(np.mean(v)) for k, v in overlap.items()}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--catalog", default=lr.FILE_PATH)
+    ap.add_argument("--dims", type=int, nargs="+", default=[reduction.REDUCED_DIMS or 128])
+    ap.add_argument("--kind", choices=["pca", "random"], default=reduction.REDUCTION_KIND)
+    ap.add_argument("--queries", type=int, default=100)
+    ap.add_argument("--candidates", type=int, default=reduction.RERANK_CANDIDATES)
+    ap.add_argument("--no-save", action="store_true")
+    args = ap.parse_args()
+
+    snap = lr.build_snapshot(0, args.catalog)
+    emb = snap.emb_norm
+    rng = np.random.default_rng(0)
+    queries = random_queries(emb, args.queries, rng)
+    ks = (10, 50, 200)
+    print(f"Catalog: {len(emb)} rows x {emb.shape[1]}d, rerank candidates: {args.candidates}")
+
+    for dims in args.dims:
+        red = reduction.fit(emb, dims, kind=args.kind)
+        rho_mean, rho_min, recall = similarity_check(emb, red, queries, args.candidates, ks)
+        overlap = pipeline_check(snap, red, queries, rng, ks, args.candidates)
+        print(
+            f"{args.kind} {dims:>4}d  spearman mean={rho_mean:.4f} min={rho_min:.4f}  "
+            + "  ".join(f"recall@{k}={recall[k]:.3f}" for k in ks)
+            + "  |  rank_hybrid "
+            + "  ".join(f"overlap@{k}={overlap[k]:.3f}" for k in ks)
+        )
+        if not args.no_save:
+            out = reduction.reduced_path(args.catalog, dims)
+            red.save(out)
+            print(f"  wrote {out} ({os.path.getsize(out) / 2**20:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# backend/scripts/check_sharding.py
+import os
+import sys
+import time
+import socket
+import secrets
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+import numpy as np
+
+"""
+Start N local shard processes for a catalog and check that scatter-gather
+rankings match unsharded rank_hybrid for random queries (with filters,
+exclusions and taste on some of them).
+
+  python scripts/check_sharding.py --shards 4 --queries 200
+  python scripts/check_sharding.py --catalog /path/to/catalog.csv --shards 3 --depth 200
+
+The unsharded side runs without the reduced-embedding coarse pass, which
+shards do not use either.
+"""
+
+BACKEND = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND))
+
+from app.utils import local_recommender as lr  # noqa: E402
+from app.models import sharding  # noqa: E402
+from app.models.session_history import new_bitmap, set_rows  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_shards(manifest, n, env):
+    procs, addresses = [], []
+    for i in range(n):
+        port = free_port()
+        cmd = [sys.executable, "-m", "app.models.sharding", "serve", "--manifest", manifest, "--shard", str(i), "--port", str(port)]
+        procs.append(subprocess.Popen(cmd, cwd=BACKEND, env=env))
+        addresses.append(("127.0.0.1", port))
+    return procs, addresses
+
+
+def wait_connect(catalog, timeout=600):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return catalog.info()
+        except (ConnectionRefusedError, OSError):
+            if time.time() > deadline:
+                raise
+            time.sleep(0.5)
+
+
+def random_query(snap, rng, i):
+    q = snap.emb_norm[rng.integers(len(snap))] + 0.3 * rng.standard_normal(512).astype(np.float32) / np.sqrt(512)
+    query = dict(
+        query_embed=q, v=float(rng.random()), a=float(rng.random()),
+        hex_color="#%06x" % rng.integers(0, 1 << 24), seed=i,
+    )
+    filters = None
+    if i % 4 == 1:
+        filters = {"year_min": int(rng.integers(1975, 2015)), "popularity_min": float(rng.integers(0, 60))}
+    exclude_rows = rng.choice(len(snap), len(snap) // 20, replace=False) if i % 3 == 2 else None
+    if i % 5 == 3:
+        query["user_taste"] = {"top_genres": ["pop", "jazz"]}
+    return query, filters, exclude_rows
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--catalog", default=lr.FILE_PATH)
+    ap.add_argument("--shards", type=int, default=4)
+    ap.add_argument("--queries", type=int, default=100)
+    ap.add_argument("--depth", type=int, default=50)
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="shikisai-shards-")
+    manifest = sharding.split_catalog(args.catalog, args.shards, workdir)
+    authkey = os.getenv("SHIKISAI_SHARD_AUTHKEY") or secrets.token_hex(16)  # throwaway key for local shards
+    env = dict(os.environ, SHIKISAI_REDUCED_DIMS="0", PYTHONUNBUFFERED="1", SHIKISAI_SHARD_AUTHKEY=authkey)
+    procs, addresses = start_shards(manifest, args.shards, env)
+    try:
+        lr.RERANK_CANDIDATES = 1 << 62
+        snap = lr.build_snapshot(0, args.catalog)
+        coordinator = sharding.ShardedCatalog(addresses, authkey=authkey.encode("utf-8"))
+        print("Shards:", wait_connect(coordinator))
+
+        rng = np.random.default_rng(0)
+        mismatches = 0
+        t_local = t_sharded = 0.0
+        for i in range(args.queries):
+            query, filters, exclude_rows = random_query(snap, rng, i)
+
+            t0 = time.perf_counter()
+            row_ids = snap.metadata.select_rows(**filters) if filters else None
+            exclude = None
+            if exclude_rows is not None:
+                exclude = new_bitmap(len(snap))
+                set_rows(exclude, exclude_rows)
+            expected = lr.rank_hybrid(depth=args.depth, row_ids=row_ids, exclude=exclude, snapshot=snap, **query)
+            t_local += time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            got, payloads = coordinator.rank(depth=args.depth, filters=filters, exclude_rows=exclude_rows, **query)
+            t_sharded += time.perf_counter() - t0
+
+            ids_ok = [p["id"] for p in payloads] == snap.df["id"].iloc[expected].tolist()
+            if not (np.array_equal(expected, got) and ids_ok):
+                mismatches += 1
+                print(f"query {i}: MISMATCH expected {expected[:10]} got {got[:10]}")
+
+        n = args.queries
+        print(f"{n - mismatches}/{n} rankings identical (depth {args.depth}, {args.shards} shards)")
+        print(f"mean latency: unsharded {t_local / n * 1000:.1f} ms, scatter-gather {t_sharded / n * 1000:.1f} ms")
+        sys.exit(1 if mismatches else 0)
+    finally:
+        for p in procs:
+            p.terminate()
+
+
+if __name__ == "__main__":
+    main()
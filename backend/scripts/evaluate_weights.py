@@ -0,0 +1,143 @@
+# backend/scripts/evaluate_weights.py
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+"""
+Sweep ranking weights offline: score a grid of weight configurations x a
+set of colors in batched matrix form and report ranking metrics per
+configuration (see app/utils/weight_eval.py).
+
+  python scripts/evaluate_weights.py --param w_clap=0.5,1,1.5 --param w_emotion=0.5,1,2 --param "*.energy_bias=-0.3,0,0.3"
+  python scripts/evaluate_weights.py --sample 5000 --range w_clap=0:2 --range w_modern=0:1 --range warm_soft.vocal_boost=0:1
+  python scripts/evaluate_weights.py --grid grid.json --out results.json --sort diversity
+
+grid.json is {"key": [values, ...]} (expanded) or [{config}, ...] (as is).
+Queries go through the serving encoder (SHIKISAI_ENCODER) and prompt.
+--verify checks that the engine's ranking for the serving defaults matches
+rank_hybrid for every color.
+"""
+
+BACKEND = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND))
+
+from app.utils import local_recommender as lr  # noqa: E402
+from app.utils import weight_eval  # noqa: E402
+from app.utils.clap_encoder import make_encoder  # noqa: E402
+from app.utils.color_to_text import color_to_text_prompt  # noqa: E402
+
+DEFAULT_COLORS = [
+    "#ffc0cb", "#ff0000", "#ff8c00", "#ffd700", "#7cfc00", "#2e8b57",
+    "#87ceeb", "#4169e1", "#8a2be2", "#c8a2c8", "#2f2f2f", "#f5f5dc",
+]
+
+
+def color_query(encoder, hex_color):
+    """(query_embed, v, a) the way /recommend builds them."""
+    prompt, vad_vals = color_to_text_prompt(hex_color)
+    v, a = vad_vals if vad_vals is not None and len(vad_vals) == 2 else (0.5, 0.5)
+    emb = np.asarray(encoder.encode_text(prompt), dtype=np.float32)[:512]
+    return emb, float(v), float(a)
+
+
+def parse_values(spec):
+    key, _, values = spec.partition("=")
+    return key.strip(), values
+
+
+def load_configs(args):
+    configs = []
+    if args.grid:
+        with open(args.grid, encoding="utf-8") as f:
+            grid = json.load(f)
+        configs += grid if isinstance(grid, list) else weight_eval.expand_grid(grid)
+    if args.param:
+        grid = {}
+        for spec in args.param:
+            key, values = parse_values(spec)
+            grid[key] = [float(x) for x in values.split(",")]
+        configs += weight_eval.expand_grid(grid)
+    if args.sample:
+        ranges = {}
+        for spec in args.range:
+            key, values = parse_values(spec)
+            lo, hi = values.split(":")
+            ranges[key] = (float(lo), float(hi))
+        configs += weight_eval.sample_grid(ranges, args.sample, args.seed)
+    return configs or [{}]
+
+
+def verify(snap, queries, depth, seed):
+    ok = 0
+    old = lr.RERANK_CANDIDATES
+    lr.RERANK_CANDIDATES = 1 << 62  # exact scoring, like the engine
+    try:
+        for q, (emb, v, a) in queries:
+            got = weight_eval.rank_block(snap, q, weight_eval.weight_matrix([{}], q.intent), depth, seed)[0]
+            expected = lr.rank_hybrid(emb, v, a, hex_color=q.hex_color, depth=depth, seed=seed, snapshot=snap)
+            same = np.array_equal(got, expected)
+            ok += same
+            if not same:
+                print(f"  {q.hex_color}: overlap {len(np.intersect1d(got, expected))}/{len(expected)} (float ties)")
+    finally:
+        lr.RERANK_CANDIDATES = old
+    print(f"verify: {ok}/{len(queries)} colors identical to rank_hybrid")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--catalog", default=lr.FILE_PATH)
+    ap.add_argument("--colors", nargs="+", default=DEFAULT_COLORS)
+    ap.add_argument("--grid")
+    ap.add_argument("--param", action="append", default=[], help='key=v1,v2,... (repeatable)')
+    ap.add_argument("--sample", type=int, default=0, help="random configurations drawn from --range")
+    ap.add_argument("--range", action="append", default=[], help="key=low:high (repeatable)")
+    ap.add_argument("--depth", type=int, default=10)
+    ap.add_argument("--block", type=int, default=64, help="configurations per matmul")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--sort", default="adherence", choices=weight_eval.METRICS)
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--out")
+    ap.add_argument("--verify", action="store_true")
+    args = ap.parse_args()
+
+    configs = load_configs(args)
+    snap = lr.build_snapshot(0, args.catalog)
+    encoder = make_encoder()
+
+    t0 = time.perf_counter()
+    queries = []
+    for hex_color in args.colors:
+        emb, v, a = color_query(encoder, hex_color)
+        queries.append((weight_eval.prepare_query(snap, hex_color, emb, v, a), (emb, v, a)))
+    sizes = [len(q) for q, _ in queries]
+    print(f"{len(queries)} colors prepared in {time.perf_counter() - t0:.1f}s "
+          f"(candidates per color: min {min(sizes)}, mean {int(np.mean(sizes))}, max {max(sizes)})")
+
+    if args.verify:
+        verify(snap, queries, args.depth, args.seed)
+
+    t0 = time.perf_counter()
+    results = weight_eval.evaluate(snap, [q for q, _ in queries], configs, depth=args.depth, block=args.block, seed=args.seed)
+    elapsed = time.perf_counter() - t0
+    print(f"{len(configs)} configurations x {len(queries)} colors in {elapsed:.1f}s "
+          f"({elapsed / len(configs) * 1000:.2f} ms per configuration)")
+
+    results.sort(key=lambda r: -r[args.sort])
+    cols = weight_eval.METRICS + ("seconds",)
+    print("  ".join(f"{c:>13}" for c in cols) + "  config")
+    for r in results[:args.top]:
+        print("  ".join(f"{r[c]:>13.4f}" for c in cols) + "  " + json.dumps(r["config"]))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+        print("Wrote", args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# backend/scripts/export_clap_text_onnx.py
+import os
+import argparse
+from pathlib import Path
+
+"""
+Export the CLAP text tower to ONNX for SHIKISAI_ENCODER=clap-onnx.
+
+  python scripts/export_clap_text_onnx.py                 # fp32 + int8 export
+  python scripts/export_clap_text_onnx.py --no-quantize   # fp32 only
+
+Output: backend/data/clap_text.onnx and backend/data/clap_text_int8.onnx
+(int8 = ONNX Runtime dynamic quantization of the MatMul weights).
+Needs torch + transformers + onnxruntime at export time only.
+"""
+
+BACKEND = Path(__file__).resolve().parents[1]
+DATA_DIR = BACKEND / "data"
+MODEL = os.getenv("SHIKISAI_CLAP_MODEL", "laion/clap-htsat-fused")
+
+
+def export(out_path: Path, opset: int = 17):
+    import torch
+    from transformers import AutoTokenizer, ClapTextModelWithProjection
+
+    model = ClapTextModelWithProjection.from_pretrained(MODEL).eval()
+    tokenizer = AutoTokenizer.from_pretrained(MODEL)
+    sample = tokenizer(["a calm blue night song", "energetic"], return_tensors="pt", padding=True)
+
+    class TextTower(torch.nn.Module):
+        def __init__(self, m):
+            super().__init__()
+            self.m = m
+
+        def forward(self, input_ids, attention_mask):
+            return self.m(input_ids=input_ids, attention_mask=attention_mask).text_embeds
+
+    torch.onnx.export(
+        TextTower(model),
+        (sample["input_ids"], sample["attention_mask"]),
+        str(out_path),
+        input_names=["input_ids", "attention_mask"],
+        output_names=["text_embeds"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "seq"},
+            "attention_mask": {0: "batch", 1: "seq"},
+            "text_embeds": {0: "batch"},
+        },
+        opset_version=opset,
+    )
+    print("Wrote", out_path)
+
+    # sanity check against the PyTorch model
+    import numpy as np
+    import onnxruntime as ort
+
+    sess = ort.InferenceSession(str(out_path), providers=["CPUExecutionProvider"])
+    got = sess.run(None, {k: v.numpy() for k, v in sample.items() if k in ("input_ids", "attention_mask")})[0]
+    with torch.no_grad():
+        ref = model(**sample).text_embeds.numpy()
+    print("max abs diff vs torch:", float(np.abs(got - ref).max()))
+
+
+def quantize(src: Path, dst: Path):
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    quantize_dynamic(str(src), str(dst), weight_type=QuantType.QInt8)
+    print(f"Wrote {dst} ({dst.stat().st_size / 2**20:.1f} MB, was {src.stat().st_size / 2**20:.1f} MB)")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--out-dir", default=str(DATA_DIR))
+    ap.add_argument("--no-quantize", action="store_true")
+    args = ap.parse_args()
+
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    fp32 = out_dir / "clap_text.onnx"
+    export(fp32)
+    if not args.no_quantize:
+        quantize(fp32, out_dir / "clap_text_int8.onnx")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+# backend/tests/conftest.py
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND))
+
+# no model downloads, no background warm-up, no reduced-embedding coarse pass
+os.environ.setdefault("SHIKISAI_ENCODER", "hashing")
+os.environ.setdefault("SHIKISAI_WARMUP", "off")
+os.environ["SHIKISAI_REDUCED_DIMS"] = "0"
+
+from app.utils import local_recommender as lr  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def catalog_path():
+    if not os.path.exists(lr.FILE_PATH):
+        pytest.skip(f"catalog not found: {lr.FILE_PATH}")
+    return lr.FILE_PATH
+
+
+@pytest.fixture(scope="session")
+def snap(catalog_path):
+    return lr.build_snapshot(0, catalog_path)
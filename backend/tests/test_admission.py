@@ -0,0 +1,75 @@
+# backend/tests/test_admission.py
+import time
+
+from app.utils import admission
+from app.utils.admission import AdmissionController, Deadline
+
+
+def controller(**kw):
+    kw.setdefault("concurrency", 1)
+    kw.setdefault("max_queue", 1)
+    return AdmissionController(**kw)
+
+
+def test_deadline():
+    d = Deadline(0.05)
+    assert not d.expired() and 0 < d.remaining() <= 0.05
+    assert Deadline(-1).expired()
+
+
+def test_tiers_follow_budget():
+    ac = controller()
+    full = ac.estimate("taste", "recent", "encode", "rank") * admission.TIER_SAFETY
+    no_taste = ac.estimate("encode", "rank") * admission.TIER_SAFETY
+    coarse = ac.estimate("encode", "rank_coarse") * admission.TIER_SAFETY
+
+    assert ac.choose_tier(Deadline(full + 1), wants_taste=True) == "full"
+    assert ac.choose_tier(Deadline(no_taste + 0.01), wants_taste=True) == "no_taste"
+    assert ac.choose_tier(Deadline(no_taste + 0.01), wants_taste=False) == "full"
+    assert ac.choose_tier(Deadline(coarse + 0.005), wants_taste=True) == "coarse"
+    assert ac.choose_tier(Deadline(0), wants_taste=True) == "cached"
+
+
+def test_first_observation_is_warmup():
+    ac = controller()
+    ac.observe("encode", 5.0)
+    assert ac.estimate("encode") == admission.DEFAULT_STAGE_SECONDS["encode"]
+    ac.observe("encode", 5.0)
+    assert ac.estimate("encode") > admission.DEFAULT_STAGE_SECONDS["encode"]
+
+
+def test_slow_estimate_decays_back_to_default():
+    ac = controller(half_life_s=0.05)
+    default = admission.DEFAULT_STAGE_SECONDS["encode"]
+    for _ in range(5):
+        ac.observe("encode", 2.0)
+    assert ac.choose_tier(Deadline(1.0), wants_taste=False) != "full"
+    time.sleep(0.6)  # > 10 half-lives
+    assert abs(ac.estimate("encode") - default) < 0.01
+    assert ac.choose_tier(Deadline(1.0), wants_taste=False) == "full"
+
+
+def test_admit_sheds_when_queue_full():
+    ac = controller(max_queue=0)
+    with ac.admit(Deadline(1.0)) as ok:
+        assert not ok
+
+
+def test_admit_times_out_without_a_slot():
+    ac = controller()
+    with ac.admit(Deadline(1.0)) as first:
+        assert first
+        t0 = time.monotonic()
+        with ac.admit(Deadline(0.3), reserve=0.2) as second:
+            assert not second
+        assert time.monotonic() - t0 < 0.25
+    with ac.admit(Deadline(1.0)) as again:
+        assert again
+
+
+def test_journey_encodes_do_not_move_the_recommend_estimate():
+    ac = controller()
+    for _ in range(5):
+        ac.observe("journey_encode", 2.0)
+    assert ac.estimate("encode") == admission.DEFAULT_STAGE_SECONDS["encode"]
+    assert ac.estimate("journey_encode") > admission.DEFAULT_STAGE_SECONDS["journey_encode"]
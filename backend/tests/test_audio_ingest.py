@@ -0,0 +1,80 @@
+# backend/tests/test_audio_ingest.py
+import os
+
+import numpy as np
+import pytest
+
+from app.models.song_store import SongStore
+from app.utils import audio_ingest
+from app.utils.clap_encoder import HashingEncoder
+
+
+class CountingEncoder(HashingEncoder):
+    def __init__(self):
+        super().__init__()
+        self.windows = 0
+
+    def encode_audio_batch(self, waveforms):
+        self.windows += len(waveforms)
+        return super().encode_audio_batch(waveforms)
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    """An audio dir whose files 'decode' to windows derived from their bytes (no librosa needed)."""
+    def decode(path, *args):
+        data = np.frombuffer(open(path, "rb").read().ljust(64, b"\0"), dtype=np.uint8).astype(np.float32)
+        return np.stack([data[:32], data[32:64]])
+
+    monkeypatch.setattr(audio_ingest, "decode_windows", decode)
+    audio = tmp_path / "audio"
+    audio.mkdir()
+    store = SongStore(CountingEncoder(), str(tmp_path / "data"))
+
+    def write(name, data, mtime):
+        path = audio / name
+        path.write_bytes(data)
+        os.utime(path, (mtime, mtime))
+
+    def ingest():
+        return audio_ingest.ingest(store, str(audio), workers=1)
+
+    return store, write, ingest
+
+
+def test_edited_file_replaces_its_old_vector(library):
+    store, write, ingest = library
+    write("a.wav", b"one", 1)
+    write("b.wav", b"two", 1)
+    assert ingest() == 2
+    before = set(store.seen_ids)
+
+    write("a.wav", b"one, edited", 2)
+    assert ingest() == 1
+    assert len(store.seen_ids) == 2 and len(store.seen_ids - before) == 1
+    assert store.vectors.shape[0] == store.index.ntotal == 2
+
+
+def test_content_kept_alive_by_a_copy_is_not_removed(library):
+    store, write, ingest = library
+    write("b.wav", b"two", 1)
+    ingest()
+    write("c.wav", b"two", 2)
+    write("b.wav", b"two, edited", 2)
+    ingest()
+    assert len(store.seen_ids) == 2
+
+
+def test_duplicates_in_one_run_are_embedded_once(library):
+    store, write, ingest = library
+    write("a.wav", b"same", 1)
+    write("b.wav", b"same", 1)
+    write("c.wav", b"other", 1)
+    assert ingest() == 2
+    assert store.clap.windows == 4  # two windows per distinct file
+
+    manifest = audio_ingest.AudioManifest(os.path.join(os.path.dirname(store.meta_path), "audio_manifest.json"))
+    ids = {os.path.basename(p): e["spotify_id"] for p, e in manifest.entries.items()}
+    assert ids["a.wav"] == ids["b.wav"] != ids["c.wav"]
+
+    assert ingest() == 0  # nothing new or changed
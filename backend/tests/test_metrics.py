@@ -0,0 +1,21 @@
+# backend/tests/test_metrics.py
+import threading
+
+from app.utils.metrics import CacheStats
+
+
+def test_cache_stats_count_every_concurrent_update():
+    stats = CacheStats("test")
+
+    def run():
+        for _ in range(20000):
+            stats.hit()
+            stats.miss(2)
+
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert (stats.hits, stats.misses) == (160000, 320000)
+    assert abs(stats.hit_ratio - 1 / 3) < 1e-9
@@ -0,0 +1,79 @@
+# backend/tests/test_parallel_scoring.py
+import numpy as np
+import pytest
+
+from app.utils import local_recommender as lr
+from app.utils.parallel_scoring import ScoringPool
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """Swap in a pool that splits even the small test catalog into chunks."""
+    def use(threads, min_task_rows=64):
+        p = ScoringPool(threads=threads, min_task_rows=min_task_rows)
+        monkeypatch.setattr(lr, "SCORING", p)
+        return p
+    return use
+
+
+def queries(snap, n):
+    rng = np.random.default_rng(0)
+    for i in range(n):
+        q = snap.emb_norm[rng.integers(len(snap))] + 0.3 * rng.standard_normal(512).astype(np.float32) / np.sqrt(512)
+        yield dict(query_embed=q, v=float(rng.random()), a=float(rng.random()),
+                   hex_color="#%06x" % rng.integers(0, 1 << 24), seed=i)
+
+
+def rank(snap, depth, **query):
+    return lr.rank_hybrid(depth=depth, snapshot=snap, **query)
+
+
+@pytest.mark.parametrize("threads", [2, 4])
+def test_parallel_matches_serial(snap, pool, monkeypatch, threads):
+    calls = []
+    rank_parallel = lr._rank_parallel
+    monkeypatch.setattr(lr, "_rank_parallel", lambda *a: calls.append(a[-1]) or rank_parallel(*a))
+
+    for query in queries(snap, 12):
+        pool(1)
+        expected = rank(snap, 40, **query)
+        pool(threads)
+        np.testing.assert_array_equal(rank(snap, 40, **query), expected)
+    assert calls and all(1 < tasks <= threads for tasks in calls)
+
+
+def test_chunk_scores_match_serial_scores(snap):
+    query = next(queries(snap, 1))
+    ctx = lr._query_context(query["query_embed"], query["a"], query["hex_color"])
+    rows, static, dist = lr.select_candidates(snap, ctx["intent"], query["v"], ctx["a"])
+    _, expected, _ = lr._score_selected(snap, ctx, rows, static, dist)
+
+    bounds = np.linspace(0, len(rows), 4).astype(int)
+    got = np.concatenate([
+        lr._base_score(snap, ctx, rows[s:e], static[s:e], dist[s:e]) + lr._clap_score(snap, ctx, rows[s:e])
+        for s, e in zip(bounds[:-1], bounds[1:])
+    ])
+    np.testing.assert_array_equal(got, expected)
+
+
+def test_ties_at_the_window_boundary(snap, pool, monkeypatch):
+    """Coarsely rounded scores put many rows on each chunk's cut-off, so the merge relies on complete_prefix."""
+    base, clap = lr._base_score, lr._clap_score
+    monkeypatch.setattr(lr, "_base_score", lambda *a, **k: np.round(base(*a, **k), 1).astype(np.float32))
+    monkeypatch.setattr(lr, "_clap_score", lambda *a, **k: np.round(clap(*a, **k), 1).astype(np.float32))
+
+    cuts = []
+    complete_prefix = lr.complete_prefix
+
+    def spy(score, tie, bounds):
+        n = complete_prefix(score, tie, bounds)
+        cuts.append(n < len(score))
+        return n
+
+    monkeypatch.setattr(lr, "complete_prefix", spy)
+    for query in queries(snap, 12):
+        pool(1)
+        expected = rank(snap, 10, **query)
+        pool(4)
+        np.testing.assert_array_equal(rank(snap, 10, **query), expected)
+    assert any(cuts)
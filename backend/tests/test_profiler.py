@@ -0,0 +1,24 @@
+# backend/tests/test_profiler.py
+import time
+
+from app.utils.profiler import ProfileCapture
+
+
+def test_time_window_ends_without_further_requests():
+    profiler = ProfileCapture()
+    profiler.start(seconds=0.05)
+    assert profiler.status()["active"]
+    time.sleep(0.1)
+    status = profiler.status()
+    assert not status["active"] and status["seconds_left"] is None
+
+
+def test_request_window_counts_captures():
+    profiler = ProfileCapture()
+    profiler.start(requests=2)
+    for _ in range(3):
+        with profiler.capture():
+            sum(range(1000))
+    status = profiler.status()
+    assert not status["active"] and status["captured_requests"] == 2
+    assert profiler.dump("text")
@@ -0,0 +1,58 @@
+# backend/tests/test_ranking_cache.py
+import numpy as np
+
+from app.models.ranking_cache import RankingCache
+
+
+class Snap:
+    version = 1
+
+
+def cached(n=25):
+    cache = RankingCache()
+    return cache, cache.put(Snap(), np.arange(n), {"hex": "#ff0000"})
+
+
+def test_pages_follow_cursors_to_the_end():
+    cache, list_id = cached()
+    cursor, seen = f"{list_id}:0", []
+    while cursor:
+        _, rows, cursor = cache.page(cursor, 10)
+        seen.extend(rows.tolist())
+    assert seen == list(range(25))
+
+
+def test_negative_offset_is_rejected():
+    cache, list_id = cached()
+    assert cache.page(f"{list_id}:-3", 10) is None
+    assert cache.page(f"{list_id}:-50", 10) is None
+
+
+def test_empty_or_negative_page_size_is_rejected():
+    cache, list_id = cached()
+    assert cache.page(f"{list_id}:0", 0) is None
+    assert cache.page(f"{list_id}:0", -3) is None
+
+
+def test_malformed_and_unknown_cursors():
+    cache, list_id = cached()
+    assert cache.page(list_id, 10) is None
+    assert cache.page(f"{list_id}:x", 10) is None
+    assert cache.page("nope:0", 10) is None
+
+
+def test_catalog_swap_retires_older_lists():
+    cache, old_id = cached()
+    newer = Snap()
+    newer.version = 2
+    new_id = cache.put(newer, np.arange(5), {})
+
+    cache.retire(2)
+    assert cache.page(f"{old_id}:0", 10) is None
+    assert cache.page(f"{new_id}:0", 10) is not None
+    assert len(cache) == 1 and cache.cached_rows == 5
+
+    # a request still pinned to the old snapshot does not re-cache it
+    late_id = cache.put(Snap(), np.arange(5), {})
+    assert cache.page(f"{late_id}:0", 10) is None
+    assert len(cache) == 1
@@ -0,0 +1,36 @@
+# backend/tests/test_recommend_api.py
+import pytest
+from fastapi.testclient import TestClient
+
+from app.models.ranking_cache import RANKING_DEPTH
+
+
+@pytest.fixture(scope="module")
+def client(catalog_path):
+    from app.main import app
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("k", [-3, 0, RANKING_DEPTH + 1])
+def test_out_of_range_k_is_rejected(client, k):
+    assert client.get("/recommend", params={"hex": "#ff0000", "k": k}).status_code == 422
+
+
+def test_cursor_pages_and_rejects_negative_offsets(client):
+    first = client.get("/recommend", params={"hex": "#ff0000", "k": 5}).json()
+    assert len(first["recommendations"]) == 5
+    list_id = first["next_cursor"].rsplit(":", 1)[0]
+    assert first["next_cursor"] == f"{list_id}:5"
+
+    second = client.get("/recommend", params={"cursor": first["next_cursor"], "k": 5}).json()
+    assert second["next_cursor"] == f"{list_id}:10"
+    assert not {t["id"] for t in first["recommendations"]} & {t["id"] for t in second["recommendations"]}
+
+    assert client.get("/recommend", params={"cursor": f"{list_id}:-50", "k": 5}).status_code == 410
+    assert client.get("/recommend", params={"cursor": first["next_cursor"], "k": 0}).status_code == 422
+
+
+def test_full_tier_needs_no_song_store_index(client):
+    r = client.get("/recommend", params={"hex": "#1e90ff", "k": 5, "deadline_ms": 60000})
+    assert r.status_code == 200
+    assert r.json()["tier"] == "full"
@@ -0,0 +1,47 @@
+# backend/tests/test_session_history.py
+import numpy as np
+
+from app.models.session_history import SessionHistory, test_rows as bits_set
+
+
+class Snap:
+    def __init__(self, version, n_rows=1_000_000):
+        self.version = version
+        self.n_rows = n_rows
+
+    def __len__(self):
+        return self.n_rows
+
+
+def test_served_rows_accumulate_into_the_bitmap():
+    sessions, snap = SessionHistory(), Snap(1)
+    sessions.record("s", snap, [5, 999_999, 5])
+    sessions.record("s", snap, [42])
+    np.testing.assert_array_equal(sessions.rows("s", snap), [5, 42, 999_999])
+
+    bits = sessions.bitmap("s", snap)
+    assert bits.nbytes == len(snap) // 8
+    assert bits_set(bits, [5, 42, 999_999]).all()
+    assert not bits_set(bits, [0, 6, 41, 999_998]).any()
+
+
+def test_footprint_is_per_served_row_not_per_catalog_row():
+    sessions, snap = SessionHistory(), Snap(1)
+    for i in range(100):
+        sessions.record(f"s{i}", snap, np.arange(i, i + 20))
+    assert sessions.memory_bytes() == 100 * 20 * 4
+
+
+def test_history_is_dropped_on_a_new_snapshot():
+    sessions = SessionHistory()
+    sessions.record("s", Snap(1), [1, 2])
+    assert sessions.bitmap("s", Snap(2)) is None
+    sessions.record("s", Snap(2), [3])
+    np.testing.assert_array_equal(sessions.rows("s", Snap(2)), [3])
+
+
+def test_least_recently_used_sessions_are_evicted():
+    sessions, snap = SessionHistory(max_sessions=2), Snap(1)
+    for sid in ("a", "b", "c"):
+        sessions.record(sid, snap, [1])
+    assert len(sessions) == 2 and sessions.rows("a", snap) is None
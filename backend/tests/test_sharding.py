@@ -0,0 +1,83 @@
+# backend/tests/test_sharding.py
+import json
+import secrets
+import socket
+import threading
+import time
+from multiprocessing import AuthenticationError
+
+import numpy as np
+import pytest
+
+from app.utils import local_recommender as lr
+from app.models import sharding
+from app.models.session_history import new_bitmap, set_rows
+
+N_SHARDS = 3
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def coordinator(catalog_path, tmp_path_factory):
+    manifest = sharding.split_catalog(catalog_path, N_SHARDS, str(tmp_path_factory.mktemp("shards")))
+    with open(manifest, encoding="utf-8") as f:
+        specs = json.load(f)["shards"]
+
+    authkey = secrets.token_bytes(16)
+    addresses = []
+    for spec in specs:
+        port = free_port()
+        shard = sharding.Shard(spec["path"], spec["start"])
+        threading.Thread(target=sharding.serve, args=(shard, "127.0.0.1", port, authkey), daemon=True).start()
+        addresses.append(("127.0.0.1", port))
+
+    catalog = sharding.ShardedCatalog(addresses, authkey=authkey)
+    for _ in range(100):
+        try:
+            catalog.info()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return catalog
+
+
+def test_shards_cover_the_catalog(coordinator, snap):
+    info = coordinator.info()
+    assert sum(i["n_rows"] for i in info) == len(snap)
+    assert [i["offset"] for i in info] == sorted(i["offset"] for i in info)
+
+
+@pytest.mark.parametrize("i", range(8))
+def test_scatter_gather_matches_unsharded(coordinator, snap, i):
+    rng = np.random.default_rng(i)
+    q = snap.emb_norm[rng.integers(len(snap))] + 0.3 * rng.standard_normal(512).astype(np.float32) / np.sqrt(512)
+    query = dict(query_embed=q, v=float(rng.random()), a=float(rng.random()),
+                 hex_color="#%06x" % rng.integers(0, 1 << 24), seed=i)
+    filters = {"year_min": int(rng.integers(1975, 2015))} if i % 4 == 1 else None
+    exclude_rows = rng.choice(len(snap), len(snap) // 20, replace=False) if i % 3 == 2 else None
+    if i % 4 == 3:
+        query["user_taste"] = {"top_genres": ["pop", "jazz"]}
+
+    row_ids = snap.metadata.select_rows(**filters) if filters else None
+    exclude = None
+    if exclude_rows is not None:
+        exclude = new_bitmap(len(snap))
+        set_rows(exclude, exclude_rows)
+    expected = lr.rank_hybrid(depth=40, row_ids=row_ids, exclude=exclude, snapshot=snap,
+                              rerank_candidates=1 << 62, **query)
+
+    got, payloads = coordinator.rank(depth=40, filters=filters, exclude_rows=exclude_rows, **query)
+    np.testing.assert_array_equal(got, expected)
+    assert [p["id"] for p in payloads] == snap.df["id"].iloc[expected].tolist()
+
+
+def test_wrong_key_is_rejected(coordinator):
+    address = coordinator.clients[0].address
+    with pytest.raises(AuthenticationError):
+        sharding.ShardClient(address, b"wrong").call("info")
+    assert coordinator.info()  # server still serving
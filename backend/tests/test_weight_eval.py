@@ -0,0 +1,34 @@
+# backend/tests/test_weight_eval.py
+import numpy as np
+import pytest
+
+from app.utils import local_recommender as lr
+from app.utils import weight_eval
+
+COLORS = ["#ff0000", "#1e90ff", "#2e8b57", "#ffd700", "#4b0082", "#222222"]
+
+
+@pytest.mark.parametrize("hex_color", COLORS)
+def test_default_weights_match_rank_hybrid(snap, hex_color):
+    rng = np.random.default_rng(int(hex_color[1:], 16))
+    emb = snap.emb_norm[rng.integers(len(snap))] + 0.3 * rng.standard_normal(512).astype(np.float32) / np.sqrt(512)
+    v, a = float(rng.random()), float(rng.random())
+    depth, seed = 30, 7
+
+    q = weight_eval.prepare_query(snap, hex_color, emb, v, a)
+    got = weight_eval.rank_block(snap, q, weight_eval.weight_matrix([{}], q.intent), depth, seed)[0]
+    expected = lr.rank_hybrid(
+        emb, v, a, hex_color=hex_color, depth=depth, seed=seed, snapshot=snap, rerank_candidates=1 << 62
+    )
+    np.testing.assert_array_equal(got, expected)
+
+
+def test_block_matches_per_config_ranking(snap):
+    emb = snap.emb_norm[3]
+    q = weight_eval.prepare_query(snap, "#ff8800", emb, 0.7, 0.6)
+    configs = [{}] + weight_eval.sample_grid({"w_clap": (0, 3), "w_emotion": (0, 2)}, 5, seed=1)
+    W = weight_eval.weight_matrix(configs, q.intent)
+    block = weight_eval.rank_block(snap, q, W, 20, 3)
+    for j, ranked in enumerate(block):
+        col = np.maximum(q.terms @ W[:, j], 0)
+        np.testing.assert_array_equal(ranked, lr.rank_rows(q.rows, col, snap.features, depth=20, seed=3))